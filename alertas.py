@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Alertas por email
+Junta os cruzamentos dos ultimos 14 dias de todas as carteiras (sinais_recentes
+do relatorio), descarta os que ja foram enviados (data/alertas-enviados.json)
+e envia um unico resumo por janela diaria, a partir das 19h BRT. Todas as
+mensagens de uma janela (uma por destinatario) saem pela mesma conexao SMTP.
+
+Configuracao por variaveis de ambiente:
+    EMAIL_SENDER, EMAIL_PASSWORD   remetente e senha de app (sem senha nao faz login)
+    EMAIL_RECIPIENT                destinatarios, separados por virgula
+    SMTP_HOST, SMTP_PORT           padrao smtp.gmail.com:587
+    SMTP_STARTTLS                  "0" desliga o STARTTLS (servidor local de testes)
+    RELATORIO_URL                  link para o relatorio completo (opcional)
+
+Teste local, sem enviar nada de verdade (o servidor so imprime as mensagens):
+    pip install aiosmtpd
+    python -m aiosmtpd -n -l localhost:8025
+    SMTP_HOST=localhost SMTP_PORT=8025 SMTP_STARTTLS=0 EMAIL_SENDER=a@b EMAIL_RECIPIENT=c@d \\
+        python alertas.py --ignorar-horario
+"""
+
+import os
+import sys
+import json
+import argparse
+import smtplib
+from datetime import timedelta
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+import monitor
+import renderizador
+
+ARQUIVO_ENVIADOS = os.path.join("data", "alertas-enviados.json")
+HORA_ENVIO = 19
+# Sinais enviados continuam no registro por mais este tempo depois de sair da janela
+DIAS_REGISTRO = 30
+
+
+def configuracao():
+    """Parametros de envio a partir do ambiente, ou None se faltar remetente/destinatario"""
+    remetente = os.getenv("EMAIL_SENDER", "").strip()
+    destinatarios = [d.strip() for d in os.getenv("EMAIL_RECIPIENT", "").split(",") if d.strip()]
+    if not remetente or not destinatarios:
+        return None
+    porta = int(os.getenv("SMTP_PORT", "587"))
+    return {
+        "remetente": remetente,
+        "senha": os.getenv("EMAIL_PASSWORD", "").strip(),
+        "destinatarios": destinatarios,
+        "host": os.getenv("SMTP_HOST", "smtp.gmail.com").strip(),
+        "porta": porta,
+        "starttls": os.getenv("SMTP_STARTTLS", "1").strip() != "0",
+        "url": os.getenv("RELATORIO_URL", "").strip(),
+    }
+
+
+def chave(sinal):
+    """Identifica um cruzamento independente da carteira: ativo, data e direcao"""
+    return "%s|%s|%s" % (sinal["ativo"], sinal["data"], sinal["sinal"])
+
+
+def carregar_registro(caminho=ARQUIVO_ENVIADOS):
+    """Registro de alertas enviados: {"ultimo_envio": data ISO, "enviados": {chave: quando}}"""
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            registro = json.load(f)
+    except FileNotFoundError:
+        registro = {}
+    except Exception as e:
+        print("[AVISO] Registro de alertas invalido, recomecando: " + str(e)[:80])
+        registro = {}
+    registro.setdefault("ultimo_envio", None)
+    registro.setdefault("enviados", {})
+    return registro
+
+
+def salvar_registro(registro, caminho=ARQUIVO_ENVIADOS):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(registro, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(temporario, caminho)
+
+
+def novos_sinais(sinais_recentes, registro):
+    """Cruzamentos ainda nao enviados, um por chave, com as carteiras em que o ativo aparece"""
+    novos = {}
+    for sinal in sinais_recentes:
+        k = chave(sinal)
+        if k in registro["enviados"]:
+            continue
+        if k not in novos:
+            novos[k] = dict(sinal, carteiras=[])
+            del novos[k]["carteira"]
+        if sinal["carteira"] not in novos[k]["carteiras"]:
+            novos[k]["carteiras"].append(sinal["carteira"])
+    return sorted(novos.values(), key=lambda s: (s["data"], s["ativo"]), reverse=True)
+
+
+def montar_mensagens(sinais, config, momento):
+    """Uma mensagem (texto + HTML) por destinatario com o resumo dos cruzamentos"""
+    assunto = "[ALERTA] Cruzamentos de Médias - " + momento.strftime('%d/%m/%Y %H:%M')
+    texto = ["VIGILANTE - %d cruzamento(s) novo(s) nos ultimos %d dias" % (len(sinais), monitor.DIAS_SINAIS_RECENTES), ""]
+    linhas = []
+    for s in sinais:
+        data = "%s/%s/%s" % (s["data"][8:10], s["data"][5:7], s["data"][:4])
+        texto.append("%-10s %-6s %s  %10.2f  %+.4f  (%s)" % (s["ativo"], s["sinal"], data, s["preco"],
+                                                            s["distancia"], ", ".join(s["carteiras"])))
+        renderizador.modelo("linha_alerta").renderizar(
+            linhas,
+            ativo=s["ativo"],
+            carteiras=", ".join(s["carteiras"]),
+            cor="#28a745" if s["sinal"] == "COMPRA" else "#dc3545",
+            sinal=s["sinal"],
+            data=data,
+            preco="%.2f" % s["preco"],
+            distancia="%+.4f" % s["distancia"],
+        )
+    link = []
+    if config["url"]:
+        texto += ["", "Relatorio completo: " + config["url"]]
+        renderizador.modelo("link_relatorio").renderizar(link, url=config["url"])
+    corpo_html = "".join(renderizador.modelo("alerta").renderizar(
+        [],
+        quantidade=len(sinais),
+        dias=monitor.DIAS_SINAIS_RECENTES,
+        timestamp=momento.strftime('%d/%m/%Y %H:%M BRT'),
+        linhas=linhas,
+        link=link,
+    ))
+
+    mensagens = []
+    for destinatario in config["destinatarios"]:
+        msg = EmailMessage()
+        msg["Subject"] = assunto
+        msg["From"] = config["remetente"]
+        msg["To"] = destinatario
+        msg["Date"] = formatdate(localtime=True)
+        msg["Message-ID"] = make_msgid(domain=config["remetente"].rpartition("@")[2] or None)
+        msg.set_content("\n".join(texto) + "\n")
+        msg.add_alternative(corpo_html, subtype="html")
+        mensagens.append(msg)
+    return mensagens
+
+
+def enviar(mensagens, config, timeout=30):
+    """Envia todas as mensagens por uma unica conexao SMTP"""
+    with smtplib.SMTP(config["host"], config["porta"], timeout=timeout) as servidor:
+        if config["starttls"]:
+            servidor.starttls()
+        if config["senha"]:
+            servidor.login(config["remetente"], config["senha"])
+        for msg in mensagens:
+            servidor.send_message(msg)
+
+
+def processar(relatorio, momento=None, ignorar_horario=False, caminho=ARQUIVO_ENVIADOS):
+    """Envia o resumo da janela do dia se for hora e houver cruzamentos novos. Retorna quantos sinais foram enviados"""
+    momento = momento or monitor.agora()
+    hoje = momento.date().isoformat()
+    if not ignorar_horario and momento.hour < HORA_ENVIO:
+        return 0
+    config = configuracao()
+    if config is None:
+        print("[EMAIL] Nao configurado (EMAIL_SENDER/EMAIL_RECIPIENT) - alerta nao enviado")
+        return 0
+
+    registro = carregar_registro(caminho)
+    if registro["ultimo_envio"] == hoje and not ignorar_horario:
+        return 0
+    sinais = novos_sinais(relatorio.get("sinais_recentes", []), registro)
+    if not sinais:
+        print("[EMAIL] Nenhum cruzamento novo - alerta nao enviado")
+        return 0
+
+    try:
+        enviar(montar_mensagens(sinais, config, momento), config)
+    except Exception as e:
+        print("[ERRO] Falha ao enviar email: " + str(e)[:80])
+        return 0
+
+    quando = momento.isoformat()
+    registro["enviados"].update((chave(s), quando) for s in sinais)
+    limite = (momento.date() - timedelta(days=monitor.DIAS_SINAIS_RECENTES + DIAS_REGISTRO)).isoformat()
+    registro["enviados"] = {k: v for k, v in registro["enviados"].items() if k.split("|")[1] >= limite}
+    registro["ultimo_envio"] = hoje
+    salvar_registro(registro, caminho)
+    print("[EMAIL] Alerta enviado com sucesso: %d cruzamento(s) para %d destinatario(s)"
+          % (len(sinais), len(config["destinatarios"])))
+    return len(sinais)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="VIGILANTE - Envia o alerta de cruzamentos a partir de data/current-analysis.json")
+    parser.add_argument("--ignorar-horario", action="store_true",
+                        help="envia fora da janela das %dh e mesmo que a janela de hoje ja tenha sido enviada" % HORA_ENVIO)
+    args = parser.parse_args(argv)
+    try:
+        with open("data/current-analysis.json", encoding="utf-8") as f:
+            relatorio = json.load(f)
+        processar(relatorio, ignorar_horario=args.ignorar_horario)
+        return 0
+    except Exception as e:
+        print("[ERRO FATAL]:", str(e))
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
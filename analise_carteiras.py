@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Analise por carteira
+Alinha os fechamentos de todos os ativos em uma unica matriz (pregoes x ativos)
+sobre a uniao dos calendarios: BTC-USD negocia todos os dias e a B3 so nos dias
+uteis, entao cada ativo repete o ultimo fechamento nos dias em que nao negociou.
+Todas as metricas das carteiras saem dessa matriz, calculada uma unica vez:
+
+    amplitude          % dos ativos com sinal de COMPRA
+    indice             carteira com pesos iguais (rebalanceada a cada pregao), base 100
+                       no inicio da janela de 1 ano; retornos de 1 mes e 1 ano e queda
+                       desde o topo da janela
+    correlacao_media   media das correlacoes entre os retornos diarios dos ativos (1 ano)
+    dist_min/dist_max  distancia media do fechamento ao minimo/maximo de 5 anos
+"""
+
+import numpy as np
+
+import calendario
+
+PREGOES_ANO = 252
+PREGOES_MES = 21
+
+
+def alinhar(series):
+    """Converte {ativo: (datas, fechamentos)} em (ativos, datas, precos, negociou).
+
+    `datas` e a uniao ordenada dos pregoes; `precos` (pregoes x ativos) repete o ultimo
+    fechamento onde o ativo nao negociou e fica NaN antes do primeiro pregao dele;
+    `negociou` marca as posicoes com pregao de fato.
+    """
+    ativos = list(series)
+    datas = np.unique(np.concatenate([np.asarray(series[a][0]).astype("datetime64[D]") for a in ativos])) \
+        if ativos else np.array([], dtype="datetime64[D]")
+    precos = np.full((len(datas), len(ativos)), np.nan)
+    for j, ativo in enumerate(ativos):
+        s_datas, s_precos = series[ativo][:2]
+        precos[np.searchsorted(datas, np.asarray(s_datas).astype("datetime64[D]")), j] = s_precos
+    negociou = ~np.isnan(precos)
+    # Repete o ultimo fechamento valido ao longo de cada coluna
+    indices = np.where(negociou, np.arange(len(datas))[:, None], 0)
+    np.maximum.accumulate(indices, axis=0, out=indices)
+    precos = precos[indices, np.arange(len(ativos))]
+    precos[np.cumsum(negociou, axis=0) == 0] = np.nan
+    return ativos, datas, precos, negociou
+
+
+def _pct(valor, casas=2):
+    return None if valor is None or not np.isfinite(valor) else round(float(valor) * 100, casas)
+
+
+def analisar(ativos, datas, precos, negociou, carteiras, sinais):
+    """Metricas de cada carteira a partir da matriz alinhada. `sinais` e {ativo: "COMPRA"/"VENDA"/...}"""
+    posicao = {ativo: j for j, ativo in enumerate(ativos)}
+    resultado = {}
+    if len(datas) == 0:
+        return resultado
+
+    # Uma vez para o universo: minimo/maximo dos 5 anos ate o ultimo pregao de cada ativo
+    # (mesmo corte do Min/Max (5y) das linhas) e distancia do ultimo fechamento ate eles
+    ultimo_pregao = datas[len(datas) - 1 - np.argmax(negociou[::-1], axis=0)]
+    limites = np.array([calendario.anos_antes(d.astype(object), 5) for d in ultimo_pregao], dtype="datetime64[D]")
+    janela_5a = np.where(datas[:, None] >= limites[None, :], precos, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dist_min = precos[-1] / np.nanmin(janela_5a, axis=0) - 1
+        dist_max = precos[-1] / np.nanmax(janela_5a, axis=0) - 1
+
+    for carteira, membros in carteiras.items():
+        colunas = [posicao[ativo] for ativo in membros if ativo in posicao]
+        if not colunas:
+            continue
+        # Pregoes da carteira: dias em que pelo menos um dos ativos negociou
+        linhas = np.flatnonzero(negociou[:, colunas].any(axis=1))[-(PREGOES_ANO + 1):]
+        p = precos[np.ix_(linhas, colunas)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            retornos = p[1:] / p[:-1] - 1
+        validos = np.isfinite(retornos)
+        quantos = validos.sum(axis=1)
+        # Pesos iguais entre os ativos que ja tinham cotacao; sem nenhum, retorno zero
+        medio = np.where(validos, retornos, 0.0).sum(axis=1) / np.maximum(quantos, 1)
+        indice = 100 * np.concatenate(([1.0], np.cumprod(1 + medio)))
+
+        correlacao = None
+        validas = retornos[:, validos.all(axis=0)]
+        if validas.ndim == 2 and validas.shape[1] >= 2 and validas.shape[0] >= 2:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                matriz = np.corrcoef(validas, rowvar=False)
+            pares = matriz[np.triu_indices(len(matriz), k=1)]
+            pares = pares[np.isfinite(pares)]
+            correlacao = round(float(pares.mean()), 3) if len(pares) else None
+
+        n_sinais = [sinais[ativo] for ativo in membros if ativo in sinais]
+        resultado[carteira] = {
+            "ativos": len(colunas),
+            "amplitude": _pct(sum(s == "COMPRA" for s in n_sinais) / len(n_sinais), 1) if n_sinais else None,
+            "indice": round(float(indice[-1]), 2),
+            "retorno_1m": _pct(indice[-1] / indice[max(0, len(indice) - 1 - PREGOES_MES)] - 1),
+            "retorno_1a": _pct(indice[-1] / indice[0] - 1),
+            "queda_do_topo": _pct(indice[-1] / indice.max() - 1),
+            "correlacao_media": correlacao,
+            "dist_min": _pct(np.nanmean(dist_min[colunas])),
+            "dist_max": _pct(np.nanmean(dist_max[colunas])),
+        }
+    return resultado
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Backtest da estrategia SMA17 x SMA72
+Reproduz a estrategia (comprado com SMA17 acima da SMA72, fora do mercado
+abaixo) nos ultimos 15 anos de todos os ativos de CARTEIRAS e grava
+data/backtest.json, lido pela aba Backtest do frontend.
+
+A simulacao e vetorizada sobre a matriz (ativos x pregoes) inteira: nao ha
+laco por pregao nem por ativo.
+
+O historico baixado tambem alimenta a matriz de precos compartilhada (matriz_precos.py);
+com --matriz o backtest le dela e nao baixa nada.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+import monitor
+import calendario
+import cruzamentos
+import cache_precos
+import matriz_precos
+
+PERIODO_ANOS = 15
+ARQUIVO = os.path.join("data", "backtest.json")
+
+
+def simular(precos, curta=17, longa=72):
+    """Simula a estrategia em todas as linhas da matriz de precos (alinhada pela direita).
+
+    O sinal do fechamento de um pregao vale a partir do pregao seguinte. Retorna um
+    dict de arrays com uma posicao por ativo.
+    """
+    linhas, colunas = precos.shape
+    validos = ~np.isnan(precos)
+
+    sma_curta = cruzamentos.medias_moveis(precos, curta)
+    sma_longa = cruzamentos.medias_moveis(precos, longa)
+    with np.errstate(invalid="ignore"):
+        comprado = sma_curta > sma_longa
+
+    retorno = np.zeros_like(precos)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        retorno[:, 1:] = precos[:, 1:] / precos[:, :-1] - 1
+    retorno[~np.isfinite(retorno)] = 0.0
+
+    # Posicao carregada durante o pregao t e a decidida no fechamento de t-1
+    posicao = np.zeros_like(comprado)
+    posicao[:, 1:] = comprado[:, :-1]
+    log_estrategia = np.where(posicao, np.log1p(retorno), 0.0)
+
+    # Curva de capital e drawdown maximo
+    capital = np.exp(np.cumsum(log_estrategia, axis=1))
+    drawdown = (capital / np.maximum.accumulate(capital, axis=1) - 1).min(axis=1)
+
+    # Operacoes: cada sequencia continua de pregoes comprado e uma operacao
+    entradas = posicao.copy()
+    entradas[:, 1:] &= ~posicao[:, :-1]
+    operacao = np.cumsum(entradas, axis=1)
+    chave = (np.arange(linhas)[:, None] * (colunas + 1) + operacao)[posicao]
+    soma_log = np.bincount(chave, weights=log_estrategia[posicao], minlength=linhas * (colunas + 1))
+    existe = np.bincount(chave, minlength=linhas * (colunas + 1)) > 0
+    retorno_operacao = np.expm1(soma_log[existe])
+    linha_operacao = np.flatnonzero(existe) // (colunas + 1)
+
+    total = np.bincount(linha_operacao, minlength=linhas)
+    positivas = np.bincount(linha_operacao, weights=retorno_operacao > 0, minlength=linhas).astype(int)
+    soma_operacoes = np.bincount(linha_operacao, weights=retorno_operacao, minlength=linhas)
+    maior_ganho = np.full(linhas, -np.inf)
+    maior_perda = np.full(linhas, np.inf)
+    np.maximum.at(maior_ganho, linha_operacao, retorno_operacao)
+    np.minimum.at(maior_perda, linha_operacao, retorno_operacao)
+
+    primeiro = validos.argmax(axis=1)
+    preco_inicial = precos[np.arange(linhas), primeiro]
+    preco_final = precos[:, -1]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "primeiro": primeiro,
+            "preco_inicial": preco_inicial,
+            "preco_final": preco_final,
+            "rentabilidade_estrategia": np.expm1(log_estrategia.sum(axis=1)),
+            "retorno_buy_hold": preco_final / preco_inicial - 1,
+            "drawdown_maximo": drawdown,
+            "total_entradas": total,
+            "operacoes_positivas": positivas,
+            "operacoes_negativas": total - positivas,
+            "taxa_acerto": np.where(total > 0, positivas / np.maximum(total, 1), 0.0),
+            "retorno_medio_por_operacao": np.where(total > 0, soma_operacoes / np.maximum(total, 1), 0.0),
+            "maior_ganho": np.where(total > 0, maior_ganho, 0.0),
+            "maior_perda": np.where(total > 0, maior_perda, 0.0),
+        }
+
+
+def _pct(valor):
+    return round(float(valor) * 100, 2)
+
+
+def montar_relatorio(ativos, datas, precos, periodo_anos=PERIODO_ANOS, curta=17, longa=72):
+    """Monta o dicionario de data/backtest.json a partir da matriz de precos"""
+    r = simular(precos, curta, longa)
+
+    por_ativo = {}
+    for i, ativo in enumerate(ativos):
+        por_ativo[ativo] = {
+            "ativo": ativo,
+            "data_inicio": str(datas[i, r["primeiro"][i]]),
+            "data_fim": str(datas[i, -1]),
+            "total_entradas": int(r["total_entradas"][i]),
+            "operacoes_positivas": int(r["operacoes_positivas"][i]),
+            "operacoes_negativas": int(r["operacoes_negativas"][i]),
+            "taxa_acerto_percent": _pct(r["taxa_acerto"][i]),
+            "rentabilidade_estrategia": _pct(r["rentabilidade_estrategia"][i]),
+            "retorno_buy_hold": _pct(r["retorno_buy_hold"][i]),
+            "drawdown_maximo": _pct(r["drawdown_maximo"][i]),
+            "retorno_medio_por_operacao": _pct(r["retorno_medio_por_operacao"][i]),
+            "maior_ganho": _pct(r["maior_ganho"][i]),
+            "maior_perda": _pct(r["maior_perda"][i]),
+            "preco_inicial": round(float(r["preco_inicial"][i]), 2),
+            "preco_final": round(float(r["preco_final"][i]), 2),
+        }
+
+    linha = {ativo: i for i, ativo in enumerate(ativos)}
+    carteiras = {}
+    resumo_carteiras = {}
+    for carteira, lista in monitor.CARTEIRAS.items():
+        carteiras[carteira] = [por_ativo[ativo] for ativo in lista if ativo in por_ativo]
+        indices = [linha[ativo] for ativo in lista if ativo in linha]
+        if not indices:
+            continue
+        entradas = int(r["total_entradas"][indices].sum())
+        positivas = int(r["operacoes_positivas"][indices].sum())
+        # Carteira com pesos iguais entre os ativos
+        resumo_carteiras[carteira] = {
+            "ativos": len(indices),
+            "rentabilidade_media": _pct(r["rentabilidade_estrategia"][indices].mean()),
+            "retorno_buy_hold_medio": _pct(r["retorno_buy_hold"][indices].mean()),
+            "drawdown_medio": _pct(r["drawdown_maximo"][indices].mean()),
+            "pior_drawdown": _pct(r["drawdown_maximo"][indices].min()),
+            "total_entradas": entradas,
+            "taxa_acerto_percent": _pct(positivas / entradas) if entradas else 0,
+        }
+
+    return {
+        "timestamp": monitor.agora().isoformat(),
+        "periodo_anos": periodo_anos,
+        "status": "completo",
+        "estrategia": {"sma_curta": curta, "sma_longa": longa},
+        "resumo": {
+            "total_ativos": len(monitor.universo()),
+            "ativos_analisados": len(ativos),
+            "rentabilidade_media": _pct(r["rentabilidade_estrategia"].mean()) if len(ativos) else 0,
+            "taxa_acerto_media": _pct(r["taxa_acerto"].mean()) if len(ativos) else 0,
+            "drawdown_medio": _pct(r["drawdown_maximo"].mean()) if len(ativos) else 0,
+        },
+        "resumo_carteiras": resumo_carteiras,
+        "carteiras": carteiras,
+    }
+
+
+def series_da_matriz(periodo_anos=PERIODO_ANOS, minimo=72):
+    """{ativo: (datas, fechamentos)} do universo nos ultimos `periodo_anos` da matriz compartilhada"""
+    matriz = matriz_precos.abrir()
+    if matriz is None or not len(matriz.datas):
+        raise RuntimeError("matriz de precos inexistente em " + matriz_precos.DIR_MATRIZ)
+    desde = calendario.anos_antes(matriz.datas[-1].astype(object), periodo_anos)
+    print("[MATRIZ] v%d: %d ativos x %d pregoes, a partir de %s" % (
+        matriz.versao, len(matriz.ativos), len(matriz.datas), desde.isoformat()))
+    return {ativo: (serie.datas, serie.closes)
+            for ativo, serie in matriz.series(monitor.universo(), desde).items() if len(serie.closes) > minimo}
+
+
+def executar(periodo_anos=PERIODO_ANOS, usar_matriz=False):
+    """Baixa o historico de todo o universo em lote (ou le da matriz), simula e grava data/backtest.json"""
+    print("[BACKTEST] Iniciando - " + monitor.agora().strftime('%d/%m/%Y %H:%M:%S BRT'))
+    if usar_matriz:
+        series = series_da_matriz(periodo_anos)
+    else:
+        dados = monitor.baixar_precos(monitor.universo(), periodo=str(periodo_anos) + "y")
+        series = {ativo: df['Close'] for ativo, df in dados.items() if len(df) > 72}
+        try:
+            mudancas = matriz_precos.atualizar({ativo: cache_precos.fechamentos(df) for ativo, df in dados.items()})
+            print("[OK] Matriz de precos: %(acrescentados)d pregoes novos, %(regravados)d celulas regravadas" % mudancas)
+        except Exception as e:
+            print("[AVISO] Falha ao atualizar a matriz de precos: " + str(e)[:80])
+
+    inicio = time.perf_counter()
+    ativos, datas, precos = cruzamentos.montar_matriz(series)
+    relatorio = montar_relatorio(ativos, datas, precos, periodo_anos)
+    print("[TEMPO] Simulacao: %.3fs para %d ativos x %d pregoes" % (time.perf_counter() - inicio, *precos.shape))
+
+    os.makedirs(os.path.dirname(ARQUIVO), exist_ok=True)
+    with open(ARQUIVO, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print("[OK] Backtest salvo em " + ARQUIVO)
+    return relatorio
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="VIGILANTE - Backtest da estrategia SMA17 x SMA72")
+    parser.add_argument("--matriz", action="store_true",
+                        help="le os precos da matriz compartilhada (data/matriz/) em vez de baixar")
+    parser.add_argument("--anos", type=int, default=PERIODO_ANOS, help="anos de historico (padrao: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        executar(args.anos, args.matriz)
+        return 0
+    except Exception as e:
+        print("[ERRO FATAL]:", str(e))
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
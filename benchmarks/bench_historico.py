@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: formato antigo (current-analysis.json com historico indentado)
+contra o novo (resumo compacto + um arquivo compacto por ativo).
+
+Mede o tamanho em bytes e o tempo de json.loads do que o navegador precisa
+baixar na abertura da pagina e na abertura de um grafico.
+
+    python benchmarks/bench_historico.py [--ativos 22] [--repeticoes 50]
+    python benchmarks/bench_historico.py --pipeline 22 [--anos 5]
+
+Sem --ativos usa data/current-analysis.json se ele ainda tiver o historico
+embutido; caso contrario gera um historico sintetico. Com --pipeline o relatorio
+e o montado por monitor.montar_relatorio (linhas, cruzamentos, analise por
+carteira...) sobre um cache de precos sintetico, o mesmo do bench_pipeline.py:
+mede o resumo que a pagina baixa de fato.
+"""
+
+import os
+import sys
+import json
+import io
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import contextlib
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import historico
+
+
+def sintetico(n_ativos, dias=365):
+    """Relatorio no formato de buscar_e_processar com precos em passeio aleatorio"""
+    random.seed(42)
+    datas = []
+    dia = date(2025, 1, 2)
+    while len(datas) < dias:
+        if dia.weekday() < 5:
+            datas.append(dia.isoformat())
+        dia += timedelta(days=1)
+    relatorio = {"timestamp": "2026-01-01T00:00:00-03:00", "carteiras": {"Sintetica": []}, "historico": {}}
+    for i in range(n_ativos):
+        ativo = "ATV%d.SA" % i
+        preco = 20.0
+        precos = []
+        for _ in datas:
+            preco *= 1 + random.gauss(0, 0.02)
+            precos.append(round(preco, 2))
+        sma17 = [round(sum(precos[max(0, j - 16):j + 1]) / min(j + 1, 17), 2) for j in range(dias)]
+        sma72 = [round(sum(precos[max(0, j - 71):j + 1]) / min(j + 1, 72), 2) for j in range(dias)]
+        relatorio["historico"][ativo] = {"datas": datas, "precos": precos, "sma17": sma17, "sma72": sma72}
+        relatorio["carteiras"]["Sintetica"].append({
+            "Ativo": ativo, "Fechamento": precos[-1], "SMA17": sma17[-1], "SMA72": sma72[-1],
+            "Min (5y)": min(precos), "Max (5y)": max(precos), "Sinal": "COMPRA", "Último Cruzamento": "N/A"
+        })
+    return relatorio
+
+
+def do_pipeline(n_ativos, anos):
+    """Relatorio de monitor.buscar + montar_relatorio sobre um cache sintetico em diretorio temporario"""
+    from bench_pipeline import gerar_cache, ULTIMO_PREGAO
+    import monitor
+    original = os.getcwd()
+    temporario = tempfile.mkdtemp(prefix="bench-historico-")
+    try:
+        os.chdir(temporario)
+        ativos, carteiras = gerar_cache(n_ativos, anos)
+        # Execucao na noite do ultimo pregao sintetico: os sinais recentes sao os dos ultimos 14 dias dele
+        fim = ULTIMO_PREGAO.astype(object)
+        monitor.agora = lambda: datetime(fim.year, fim.month, fim.day, 20, 0, tzinfo=monitor.BRT)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            relatorio, dados, resultados = monitor.buscar(ativos, baixar=set())
+            return monitor.montar_relatorio(relatorio, dados, resultados, composicao=carteiras, extras={})
+    finally:
+        os.chdir(original)
+        shutil.rmtree(temporario, ignore_errors=True)
+
+
+def tempo_parse(texto, repeticoes):
+    """Melhor tempo de json.loads entre as repeticoes, em milissegundos"""
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        json.loads(texto)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1000
+
+
+def medir(relatorio, repeticoes):
+    antigo = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    resumo = json.dumps({k: v for k, v in relatorio.items() if k != "historico"},
+                        ensure_ascii=False, separators=(",", ":"))
+    arquivos = {ativo: historico.serializar(historico.codificar(ativo, serie))
+                for ativo, serie in relatorio["historico"].items()}
+
+    # Confere que o formato novo volta exatamente para o antigo
+    for ativo, texto in arquivos.items():
+        volta = historico.decodificar(json.loads(texto))
+        original = relatorio["historico"][ativo]
+        for nome in ("datas",) + historico.SERIES:
+            esperado = [None if v != v else v for v in original[nome]]
+            assert volta[nome] == esperado, (ativo, nome)
+        if "cruzamentos" in original:
+            esperado = [historico.decodificar_cruzamento(historico.codificar_cruzamento(evento))
+                        for evento in original["cruzamentos"]]
+            assert volta["cruzamentos"] == esperado, (ativo, "cruzamentos")
+
+    um_grafico = max(arquivos.values(), key=len)
+    return {
+        "ativos": len(arquivos),
+        "bytes_antigo": len(antigo.encode("utf-8")),
+        "bytes_resumo": len(resumo.encode("utf-8")),
+        "bytes_historicos": sum(len(t.encode("utf-8")) for t in arquivos.values()),
+        "bytes_um_grafico": len(um_grafico.encode("utf-8")),
+        "parse_antigo_ms": tempo_parse(antigo, repeticoes),
+        "parse_resumo_ms": tempo_parse(resumo, repeticoes),
+        "parse_um_grafico_ms": tempo_parse(um_grafico, repeticoes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--ativos", type=int, help="gera historico sintetico com N ativos")
+    parser.add_argument("--pipeline", type=int, metavar="ATIVOS",
+                        help="relatorio montado pelo monitor sobre um cache sintetico de N ativos")
+    parser.add_argument("--anos", type=int, default=5, help="anos de historico do cache do --pipeline")
+    parser.add_argument("--repeticoes", type=int, default=50)
+    args = parser.parse_args()
+
+    relatorio = None
+    if args.pipeline:
+        relatorio = do_pipeline(args.pipeline, args.anos)
+    elif args.ativos is None and os.path.exists("data/current-analysis.json"):
+        with open("data/current-analysis.json", encoding="utf-8") as f:
+            relatorio = json.load(f)
+        if not relatorio.get("historico"):
+            relatorio = None
+    if relatorio is None:
+        relatorio = sintetico(args.ativos or 22)
+
+    r = medir(relatorio, args.repeticoes)
+    print("Ativos: %d%s" % (r["ativos"], " (resumo de monitor.montar_relatorio)" if args.pipeline else ""))
+    print("Abertura da pagina: %8d bytes -> %8d bytes  | parse %7.2f ms -> %6.2f ms"
+          % (r["bytes_antigo"], r["bytes_resumo"], r["parse_antigo_ms"], r["parse_resumo_ms"]))
+    print("Abrir um grafico:   %8s          %8d bytes  | parse %17.2f ms"
+          % ("-", r["bytes_um_grafico"], r["parse_um_grafico_ms"]))
+    print("Todos os historicos: %d bytes (%.1f%% do formato antigo)"
+          % (r["bytes_historicos"], 100.0 * r["bytes_historicos"] / r["bytes_antigo"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Orcamento de tempo de partida do monitor.py.
+
+Mede `python -X importtime -c "import monitor"` e falha (codigo de saida 1) se
+o import passar do orcamento ou se pandas/yfinance forem importados so por
+carregar o monitor. Com cache local em data/cache, confere tambem que calcular
+os indicadores apenas a partir do cache nao importa pandas nem yfinance.
+
+    python benchmarks/bench_importacao.py [--orcamento-ms 300] [--repeticoes 5]
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PROIBIDOS = ("pandas", "yfinance")
+ORCAMENTO_MS = 300
+
+# Indicadores de todo o universo sem download: nenhum ativo em `baixar`
+SEM_DOWNLOAD = """
+import sys, monitor, cache_precos
+ativos = [a for a in monitor.universo() if cache_precos.carregar_fechamentos(a) is not None]
+_, resultados, _ = monitor.executar_pipeline(ativos, 1, baixar=set())
+print("PROCESSADOS=%%d" %% len([r for r in resultados.values() if r]))
+print("CARREGADOS=" + ",".join(m for m in %r if m in sys.modules))
+""" % (PROIBIDOS,)
+
+
+def importtime(codigo):
+    """Executa `codigo` com -X importtime. Retorna {modulo: (self_us, cumulativo_us, nivel)} e a saida"""
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo],
+                       cwd=RAIZ, capture_output=True, text=True)
+    if r.returncode != 0:
+        raise RuntimeError(r.stderr.strip().splitlines()[-1])
+    modulos = {}
+    for linha in r.stderr.splitlines():
+        if not linha.startswith("import time:") or "imported package" in linha:
+            continue
+        proprio, cumulativo, nome = linha[len("import time:"):].split("|")
+        nivel = (len(nome) - len(nome.lstrip(" ")) - 1) // 2
+        modulos[nome.strip()] = (int(proprio), int(cumulativo), nivel)
+    return modulos, r.stdout
+
+
+def medir_import(repeticoes):
+    """Melhor tempo cumulativo de `import monitor` em ms, com os modulos da ultima medicao"""
+    melhor = float("inf")
+    modulos = {}
+    for _ in range(repeticoes):
+        modulos, _ = importtime("import monitor")
+        melhor = min(melhor, modulos["monitor"][1] / 1000)
+    return melhor, modulos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--orcamento-ms", type=float, default=ORCAMENTO_MS)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+    falhas = []
+
+    tempo, modulos = medir_import(args.repeticoes)
+    diretos = sorted((m for m, (_, _, nivel) in modulos.items() if nivel == 1 and m != "monitor"),
+                     key=lambda m: -modulos[m][1])
+    print("import monitor: %.1f ms (orcamento %.0f ms)" % (tempo, args.orcamento_ms))
+    for m in diretos[:5]:
+        print("  %-24s %8.1f ms" % (m, modulos[m][1] / 1000))
+    if tempo > args.orcamento_ms:
+        falhas.append("import monitor levou %.1f ms (orcamento %.0f ms)" % (tempo, args.orcamento_ms))
+    carregados = [m for m in PROIBIDOS if m in modulos]
+    if carregados:
+        falhas.append("import monitor carregou " + ", ".join(carregados))
+
+    if os.path.isdir(os.path.join(RAIZ, "data", "cache")):
+        modulos, saida = importtime(SEM_DOWNLOAD)
+        valores = dict(linha.split("=", 1) for linha in saida.splitlines() if linha.startswith(("PROCESSADOS=", "CARREGADOS=")))
+        processados, carregados = valores["PROCESSADOS"], valores["CARREGADOS"]
+        print("Indicadores so com o cache: %s ativos, %.1f ms de imports" % (processados, modulos["monitor"][1] / 1000))
+        if carregados:
+            falhas.append("indicadores a partir do cache carregaram " + carregados)
+    else:
+        print("Sem data/cache: verificacao do caminho sem download ignorada")
+
+    for falha in falhas:
+        print("[FALHA] " + falha)
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
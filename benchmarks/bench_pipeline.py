@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark do pipeline do monitor, offline, com precos sinteticos.
+
+Para cada caso (ativos x anos de historico) gera o cache de precos em um
+diretorio temporario (B3 em dias uteis e 1 a cada 20 ativos em cripto, todos os
+dias) e mede cada etapa separadamente, em um processo novo por caso:
+
+    indicadores              executar_pipeline so com o cache, sem estado salvo das medias
+    indicadores_incremental  o mesmo com o estado das medias da rodada anterior
+    carteiras                montagem das linhas por carteira
+    cruzamentos              matriz de fechamentos, deteccao e sinais recentes
+    analise_carteiras        matriz alinhada e metricas por carteira
+    indicadores_extras       RSI, MACD, ATR e Bollinger de todos os ativos em uma passada
+    indicadores_avanco       rodada seguinte do modo servico: o motor anterior so avanca o pregao em aberto
+    historico                serializacao e gravacao de data/historico/
+    html                     renderizacao e gravacao do relatorio_monitor.html
+    json                     gravacao do data/current-analysis.json
+
+O pico de memoria (RSS) e o do processo de cada caso; com --tracemalloc cada etapa
+registra tambem o pico de alocacoes do Python (deixa os tempos mais lentos).
+
+O resultado vai para benchmarks/resultados/pipeline-<commit>.json; --comparar
+mostra a variacao contra um resultado anterior e falha se alguma etapa piorar
+alem da tolerancia.
+
+    python benchmarks/bench_pipeline.py [--casos 20x5 200x5 2000x15] [--repeticoes 3]
+    python benchmarks/bench_pipeline.py --comparar benchmarks/resultados/pipeline-abc1234.json
+"""
+
+import os
+import io
+import sys
+import glob
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, RAIZ)
+
+CASOS_PADRAO = ["20x5", "200x5", "200x15", "2000x5", "2000x15"]
+DIR_RESULTADOS = os.path.join(RAIZ, "benchmarks", "resultados")
+ATIVOS_POR_CARTEIRA = 50
+# Fim do historico sintetico (quarta-feira, pregao normal)
+ULTIMO_PREGAO = np.datetime64("2025-12-31")
+# Etapas mais rapidas que isto nao entram na comparacao (ruido)
+MINIMO_COMPARAVEL_S = 0.01
+
+
+def gerar_cache(n_ativos, anos, semente=42):
+    """Grava o cache de precos sintetico em data/cache/. Retorna (ativos, carteiras)"""
+    import pandas as pd
+    import cache_precos
+    rng = np.random.default_rng(semente)
+    todos = np.arange(ULTIMO_PREGAO - np.timedelta64(int(anos * 365.25), "D"), ULTIMO_PREGAO + 1)
+    uteis = todos[np.is_busday(todos)]
+    ativos = []
+    for i in range(n_ativos):
+        cripto = i % 20 == 19
+        ativo = "C%04d-USD" % i if cripto else "S%04d.SA" % i
+        datas = todos if cripto else uteis
+        closes = 20 * np.exp(np.cumsum(rng.normal(0, 0.02, len(datas))))
+        df = pd.DataFrame({"Open": closes, "High": closes * 1.01, "Low": closes * 0.99, "Close": closes,
+                           "Volume": np.full(len(datas), 1000.0)}, index=pd.DatetimeIndex(datas, name="Date"))
+        cache_precos.salvar(ativo, df)
+        ativos.append(ativo)
+    carteiras = {"Carteira %d" % (i // ATIVOS_POR_CARTEIRA + 1): ativos[i:i + ATIVOS_POR_CARTEIRA]
+                 for i in range(0, n_ativos, ATIVOS_POR_CARTEIRA)}
+    return ativos, carteiras
+
+
+class Cronometro:
+    """Tempo (e, opcionalmente, pico de alocacoes do Python) de cada etapa, guardando o melhor"""
+
+    def __init__(self, alocacoes=False):
+        self.alocacoes = alocacoes
+        self.tempos = {}
+        self.picos = {}
+
+    @contextlib.contextmanager
+    def etapa(self, nome):
+        if self.alocacoes:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.tempos[nome] = min(duracao, self.tempos.get(nome, float("inf")))
+            if self.alocacoes:
+                pico = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+                self.picos[nome] = round(max(pico, self.picos.get(nome, 0.0)), 2)
+
+
+def pico_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB, macOS em bytes
+    return round(pico / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def rodar_caso(n_ativos, anos, repeticoes, workers, alocacoes):
+    """Executa um caso no diretorio atual (temporario) e devolve as medicoes"""
+    import monitor
+    import cruzamentos
+    import analise_carteiras
+    import indicadores
+    import historico
+    import renderizador
+    from datetime import timedelta
+
+    ativos, carteiras = gerar_cache(n_ativos, anos)
+    cronometro = Cronometro(alocacoes)
+    for _ in range(repeticoes):
+        for estado in glob.glob(os.path.join("data", "cache", "*.sma.json")):
+            os.remove(estado)
+        with cronometro.etapa("indicadores"):
+            dados, resultados, erros = monitor.executar_pipeline(ativos, workers, baixar=set())
+        with cronometro.etapa("indicadores_incremental"):
+            dados, resultados, erros = monitor.executar_pipeline(ativos, workers, baixar=set())
+
+        relatorio = {"timestamp": monitor.agora().isoformat(), "carteiras": {}, "historico": {}, "erros": erros}
+        with cronometro.etapa("carteiras"):
+            for carteira, membros in carteiras.items():
+                relatorio["carteiras"][carteira] = [dict(resultados[a][0]) for a in membros if resultados.get(a)]
+                relatorio["historico"].update((a, resultados[a][1]) for a in membros if resultados.get(a))
+        series = {ativo: dados[ativo] for ativo, resultado in resultados.items() if resultado}
+        with cronometro.etapa("cruzamentos"):
+            eventos = cruzamentos.detectar(*cruzamentos.montar_matriz(series))
+            relatorio["ultimos_cruzamentos"] = cruzamentos.ultimos(eventos)
+            for ativo, lista in eventos.items():
+                if ativo in relatorio["historico"]:
+                    relatorio["historico"][ativo]["cruzamentos"] = lista
+            desde = (monitor.agora().date() - timedelta(days=monitor.DIAS_SINAIS_RECENTES)).isoformat()
+            relatorio["sinais_recentes"] = cruzamentos.recentes(eventos, carteiras, desde)
+        with cronometro.etapa("analise_carteiras"):
+            sinais = {ativo: resultado[0]["Sinal"] for ativo, resultado in resultados.items() if resultado}
+            relatorio["analise_carteiras"] = analise_carteiras.analisar(
+                *analise_carteiras.alinhar(series), carteiras, sinais)
+        extras = [indicadores.criar(nome) for nome in ("rsi14", "macd", "atr14", "bollinger20")]
+        with cronometro.etapa("indicadores_extras"):
+            motor, valores = indicadores.atualizar(series, extras)
+        # Rodada seguinte do modo servico: o motor anterior so avanca o pregao em aberto
+        with cronometro.etapa("indicadores_avanco"):
+            indicadores.atualizar(series, extras, motor)
+        relatorio["fingerprint"] = monitor.impressao_digital(relatorio, dados)
+        with cronometro.etapa("historico"):
+            indice = historico.gravar(relatorio["historico"])
+        with cronometro.etapa("html"):
+            renderizador.gravar("relatorio_monitor.html", monitor.partes_html(relatorio, indice))
+        with cronometro.etapa("json"):
+            resumo = {chave: valor for chave, valor in relatorio.items() if chave != "historico"}
+            with open(os.path.join("data", "current-analysis.json"), "w", encoding="utf-8") as f:
+                json.dump(resumo, f, ensure_ascii=False, separators=(",", ":"))
+
+    caso = {
+        "ativos": n_ativos,
+        "anos": anos,
+        "pregoes": int(max(len(serie.datas) for serie in dados.values())),
+        "etapas_s": {nome: round(t, 4) for nome, t in cronometro.tempos.items()},
+        "total_s": round(sum(t for nome, t in cronometro.tempos.items() if nome != "indicadores_incremental"), 4),
+        "pico_rss_mb": pico_rss_mb(),
+        "bytes_html": os.path.getsize("relatorio_monitor.html"),
+        "bytes_json": os.path.getsize(os.path.join("data", "current-analysis.json")),
+    }
+    if alocacoes:
+        caso["pico_python_mb"] = cronometro.picos
+    return caso
+
+
+def ler_caso(texto):
+    try:
+        ativos, anos = (int(parte) for parte in texto.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("use ATIVOSxANOS, por exemplo 200x5")
+    return ativos, anos
+
+
+def versao_do_codigo():
+    """Commit atual (com '+' se houver alteracoes nao commitadas) ou None fora do git"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        sujo = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ,
+                              capture_output=True, text=True).stdout.strip()
+        return commit + ("+" if sujo else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, anterior, tolerancia):
+    """Imprime a variacao por etapa contra `anterior`. Retorna as regressoes acima da tolerancia"""
+    referencia = {(c["ativos"], c["anos"]): c for c in anterior["casos"]}
+    regressoes = []
+    print("\nComparacao com %s:" % (anterior.get("commit") or "resultado anterior"))
+    if atual.get("tracemalloc") != anterior.get("tracemalloc"):
+        print("  [AVISO] so um dos dois resultados usou --tracemalloc: os tempos nao sao comparaveis")
+    for caso in atual["casos"]:
+        base = referencia.get((caso["ativos"], caso["anos"]))
+        if base is None:
+            continue
+        for nome, tempo in caso["etapas_s"].items():
+            antes = base["etapas_s"].get(nome)
+            if not antes or max(antes, tempo) < MINIMO_COMPARAVEL_S:
+                continue
+            razao = tempo / antes
+            marca = ""
+            if razao > 1 + tolerancia:
+                marca = "  <-- REGRESSAO"
+                regressoes.append((caso["ativos"], caso["anos"], nome, razao))
+            print("  %5d x %2d anos  %-24s %8.3fs -> %8.3fs  (%+.0f%%)%s"
+                  % (caso["ativos"], caso["anos"], nome, antes, tempo, (razao - 1) * 100, marca))
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline do monitor com precos sinteticos")
+    parser.add_argument("--casos", nargs="+", type=ler_caso, default=[ler_caso(c) for c in CASOS_PADRAO],
+                        metavar="ATIVOSxANOS", help="padrao: " + " ".join(CASOS_PADRAO))
+    parser.add_argument("--repeticoes", type=int, default=3, help="guarda o melhor tempo de cada etapa")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--tracemalloc", action="store_true", help="pico de alocacoes do Python por etapa")
+    parser.add_argument("--saida", help="arquivo de resultado (padrao: benchmarks/resultados/pipeline-<commit>.json)")
+    parser.add_argument("--comparar", metavar="ARQUIVO", help="resultado anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="piora aceita por etapa (padrao: 25%%)")
+    parser.add_argument("--caso-interno", type=ler_caso, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.caso_interno:
+        # Processo filho: um caso, resultado em JSON na ultima linha da saida
+        print(json.dumps(rodar_caso(*args.caso_interno, args.repeticoes, args.workers, args.tracemalloc)))
+        return 0
+
+    commit = versao_do_codigo()
+    resultado = {
+        "commit": commit,
+        "data": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "workers": args.workers,
+        "repeticoes": args.repeticoes,
+        "tracemalloc": args.tracemalloc,
+        "casos": [],
+    }
+    for ativos, anos in args.casos:
+        temporario = tempfile.mkdtemp(prefix="bench-pipeline-")
+        try:
+            comando = [sys.executable, os.path.abspath(__file__), "--caso-interno", "%dx%d" % (ativos, anos),
+                       "--repeticoes", str(args.repeticoes), "--workers", str(args.workers)]
+            if args.tracemalloc:
+                comando.append("--tracemalloc")
+            r = subprocess.run(comando, cwd=temporario, capture_output=True, text=True,
+                               env=dict(os.environ, PYTHONPATH=RAIZ))
+            if r.returncode != 0:
+                print("[ERRO] Caso %dx%d: %s" % (ativos, anos, (r.stderr.strip().splitlines() or ["?"])[-1]))
+                return 1
+            caso = json.loads(r.stdout.strip().splitlines()[-1])
+        finally:
+            shutil.rmtree(temporario, ignore_errors=True)
+        resultado["casos"].append(caso)
+        etapas = "  ".join("%s %.3f" % (nome, t) for nome, t in caso["etapas_s"].items())
+        print("%5d ativos x %2d anos (%d pregoes): total %.2fs, pico %s MB | %s"
+              % (ativos, anos, caso["pregoes"], caso["total_s"], caso["pico_rss_mb"], etapas))
+
+    saida = args.saida
+    if saida is None:
+        os.makedirs(DIR_RESULTADOS, exist_ok=True)
+        nome = commit or hashlib.sha256(resultado["data"].encode()).hexdigest()[:7]
+        saida = os.path.join(DIR_RESULTADOS, "pipeline-%s.json" % nome.replace("+", "-sujo"))
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print("[OK] Resultado em " + os.path.relpath(saida))
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia)
+        if regressoes:
+            print("[ERRO] %d etapa(s) mais de %.0f%% mais lentas" % (len(regressoes), args.tolerancia * 100))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Cache local de precos
+Guarda o historico OHLCV de cada ativo em data/cache/<ativo>.npz (arrays NumPy
+por coluna) para que cada execucao baixe apenas os pregoes que faltam.
+
+Os indicadores so precisam de datas e fechamentos: carregar_fechamentos le o
+cache como arrays NumPy sem importar pandas. O pandas so e carregado quando ha
+download (carregar/mesclar, usados na atualizacao do cache).
+"""
+
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+DIR_CACHE = os.path.join("data", "cache")
+COLUNAS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Tolerancia relativa para considerar que o Yahoo reajustou o historico
+# (desdobramento ou dividendo com auto_adjust)
+TOLERANCIA_AJUSTE = 1e-4
+
+
+def nome_seguro(ativo):
+    """Nome de arquivo para um ativo (caracteres como '=' e '^' viram '_')"""
+    return re.sub(r"[^A-Za-z0-9.\-]", "_", ativo)
+
+
+def caminho(ativo, diretorio=DIR_CACHE):
+    """Arquivo de cache de um ativo"""
+    return os.path.join(diretorio, nome_seguro(ativo) + ".npz")
+
+
+# Datas (datetime64[D]) e fechamentos (float64) de um ativo, em ordem cronologica
+# maximas/minimas sao opcionais (None quando a fonte so tem fechamentos); o ATR usa as duas
+Fechamentos = namedtuple("Fechamentos", ["datas", "closes", "maximas", "minimas"], defaults=(None, None))
+
+
+def fechamentos(df):
+    """Fechamentos de um DataFrame OHLCV"""
+    return Fechamentos(df.index.values.astype("datetime64[D]"), df["Close"].to_numpy(dtype=np.float64),
+                       df["High"].to_numpy(dtype=np.float64), df["Low"].to_numpy(dtype=np.float64))
+
+
+def carregar_fechamentos(ativo):
+    """Le datas, fechamentos, maximas e minimas do cache, sem pandas, ou None se nao existir"""
+    arquivo = caminho(ativo)
+    if not os.path.exists(arquivo):
+        return None
+    try:
+        with np.load(arquivo) as npz:
+            return Fechamentos(npz["datas"].astype("datetime64[D]"), npz["Close"].astype(np.float64),
+                               npz["High"].astype(np.float64), npz["Low"].astype(np.float64))
+    except Exception as e:
+        print("  [AVISO] Cache corrompido de " + ativo + ": " + str(e)[:80])
+        return None
+
+
+def carregar(ativo, diretorio=DIR_CACHE):
+    """Le o cache de um ativo como DataFrame OHLCV, ou None se nao existir"""
+    import pandas as pd
+    arquivo = caminho(ativo, diretorio)
+    if not os.path.exists(arquivo):
+        return None
+    try:
+        with np.load(arquivo) as npz:
+            datas = pd.to_datetime(npz["datas"].astype("datetime64[D]"))
+            return pd.DataFrame({col: npz[col] for col in COLUNAS}, index=pd.DatetimeIndex(datas, name="Date"))
+    except Exception as e:
+        print("  [AVISO] Cache corrompido de " + ativo + ": " + str(e)[:80])
+        return None
+
+
+def salvar(ativo, df, diretorio=DIR_CACHE):
+    """Grava o DataFrame OHLCV de um ativo no cache.
+
+    O inicio do historico nao e cortado: o estado incremental das medias (estado_sma)
+    depende de a serie comecar sempre no mesmo pregao.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    arrays = {col: df[col].to_numpy(dtype=np.float64) if col in df else np.full(len(df), np.nan) for col in COLUNAS}
+    arrays["datas"] = df.index.values.astype("datetime64[D]").astype(np.int64)
+    # Grava em arquivo temporario e renomeia para nunca deixar um cache pela metade
+    temporario = caminho(ativo, diretorio) + ".tmp.npz"
+    np.savez(temporario, **arrays)
+    os.replace(temporario, caminho(ativo, diretorio))
+
+
+def inicio_incremental(df):
+    """Data a partir da qual buscar: o penultimo pregao guardado.
+
+    O ultimo pregao pode ter sido gravado com o mercado aberto e sera sobrescrito;
+    o penultimo ja esta fechado e serve para detectar reajustes do historico.
+    Retorna None quando nao ha cache suficiente (busca completa).
+    """
+    if df is None or len(df) < 2:
+        return None
+    return df.index[-2]
+
+
+def ajuste_detectado(antigo, novo):
+    """True se o fechamento de um pregao ja fechado mudou entre o cache e o download novo"""
+    referencia = antigo.index[-2]
+    if referencia not in novo.index:
+        return False
+    anterior = float(antigo["Close"].iloc[-2])
+    atual = float(novo.loc[referencia, "Close"])
+    if anterior == 0:
+        return atual != 0
+    return abs(atual - anterior) / abs(anterior) > TOLERANCIA_AJUSTE
+
+
+def mesclar(antigo, novo):
+    """Mantem o cache ate antes do primeiro pregao novo e acrescenta os pregoes baixados"""
+    if antigo is None or len(antigo) == 0:
+        return novo
+    if novo is None or len(novo) == 0:
+        return antigo
+    import pandas as pd
+    novo = novo.reindex(columns=COLUNAS)
+    return pd.concat([antigo[antigo.index < novo.index[0]], novo])
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Calendario de negociacao
+Diz se o mercado de um ativo esta aberto em um dado momento, para que fora do
+pregao o monitor nao busque dados que nao mudaram.
+
+Classes de ativo:
+    cripto   (BTC-USD etc.)  24 horas, todos os dias
+    futuros  (GC=F, SI=F)    CME Globex: domingo 18h a sexta 17h (Nova York),
+                             com pausa diaria das 17h as 18h
+    b3       (*.SA e demais) dias uteis da B3, das 10h as 18h30 (Brasilia),
+                             incluindo o leilao de fechamento e o atraso do Yahoo
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+    NOVA_YORK = ZoneInfo("America/New_York")
+except Exception:
+    NOVA_YORK = timezone(timedelta(hours=-5))
+
+BRT = timezone(timedelta(hours=-3))
+ABERTURA_B3 = time(10, 0)
+FECHAMENTO_B3 = time(18, 30)
+
+# Feriados de data fixa em que a B3 nao abre (mes, dia); 24/12 e 31/12 tambem nao tem pregao
+FERIADOS_FIXOS_B3 = [
+    (1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15), (11, 20), (12, 24), (12, 25), (12, 31),
+]
+
+
+def classe(ativo):
+    """Classe de negociacao de um ativo: 'cripto', 'futuros' ou 'b3'"""
+    if ativo.endswith("-USD") or ativo.endswith("-BRL"):
+        return "cripto"
+    if ativo.endswith("=F"):
+        return "futuros"
+    return "b3"
+
+
+def pascoa(ano):
+    """Domingo de Pascoa (algoritmo de Meeus/Jones/Butcher)"""
+    a = ano % 19
+    b, c = divmod(ano, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return date(ano, mes, dia + 1)
+
+
+def feriados_b3(ano):
+    """Datas sem pregao na B3 no ano (fora fins de semana)"""
+    p = pascoa(ano)
+    moveis = [
+        p - timedelta(days=48),  # Carnaval (segunda)
+        p - timedelta(days=47),  # Carnaval (terca)
+        p - timedelta(days=2),   # Sexta-feira Santa
+        p + timedelta(days=60),  # Corpus Christi
+    ]
+    return set(moveis) | {date(ano, mes, dia) for mes, dia in FERIADOS_FIXOS_B3}
+
+
+def anos_antes(dia, anos):
+    """Mesma data `anos` anos antes (29/02 vira 28/02), como pd.DateOffset(years=anos)"""
+    try:
+        return dia.replace(year=dia.year - anos)
+    except ValueError:
+        return dia.replace(year=dia.year - anos, day=28)
+
+
+def dia_util_b3(dia):
+    return dia.weekday() < 5 and dia not in feriados_b3(dia.year)
+
+
+def mercado_aberto(ativo, momento=None):
+    """True se o mercado do ativo esta aberto em `momento` (datetime com fuso; padrao: agora)"""
+    if momento is None:
+        momento = datetime.now(BRT)
+    tipo = classe(ativo)
+    if tipo == "cripto":
+        return True
+    if tipo == "futuros":
+        ny = momento.astimezone(NOVA_YORK)
+        dia, hora = ny.weekday(), ny.time()
+        if dia == 5:                       # sabado
+            return False
+        if dia == 6:                       # domingo: abre as 18h
+            return hora >= time(18, 0)
+        if dia == 4:                       # sexta: fecha as 17h
+            return hora < time(17, 0)
+        return not (time(17, 0) <= hora < time(18, 0))
+    local = momento.astimezone(BRT)
+    return dia_util_b3(local.date()) and ABERTURA_B3 <= local.time() <= FECHAMENTO_B3
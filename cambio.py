@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Cambio
+Ativos cotados em dolar (cripto -USD e futuros =F, como BTC-USD, GC=F e SI=F) ganham,
+alem dos valores nativos, a versao em reais do fechamento, das medias e da faixa de 5 anos.
+
+A serie diaria do USDBRL (PAR) e uma serie auxiliar do pipeline: vai no primeiro lote de
+download da execucao, junto com os ativos, e fica no mesmo cache incremental (data/cache/),
+sem entrar nos sinais. Cada execucao a baixa uma vez e todos os ativos em dolar usam a mesma.
+
+Os calendarios nao batem (BTC-USD negocia todos os dias, o cambio nao): cada data usa a
+ultima cotacao do USDBRL ate ela (forward-fill); datas anteriores ao inicio do cambio ficam NaN.
+"""
+
+import numpy as np
+
+import calendario
+import cruzamentos
+from cache_precos import Fechamentos
+
+PAR = "USDBRL=X"
+
+
+def moeda(ativo):
+    """Moeda de cotacao do ativo: 'USD' para cripto em dolar e futuros, 'BRL' para o resto (B3)"""
+    if ativo.endswith("-USD") or ativo.endswith("=F"):
+        return "USD"
+    return "BRL"
+
+
+def auxiliares(ativos):
+    """Series auxiliares que o pipeline precisa baixar junto com `ativos`: o cambio, se algum for em dolar"""
+    return [PAR] if any(moeda(ativo) == "USD" for ativo in ativos) else []
+
+
+def taxas(cambio, datas):
+    """USDBRL vigente em cada posicao de `datas` (array datetime64 de qualquer formato; NaT vira NaN)"""
+    validos = ~np.isnan(cambio.closes)
+    cambio_datas = cambio.datas[validos].astype("datetime64[D]")
+    cotacoes = cambio.closes[validos]
+    datas = np.asarray(datas).astype("datetime64[D]")
+    if len(cotacoes) == 0:
+        return np.full(datas.shape, np.nan)
+    posicao = np.searchsorted(cambio_datas, datas, side="right") - 1
+    return np.where((posicao >= 0) & ~np.isnat(datas), cotacoes[np.clip(posicao, 0, None)], np.nan)
+
+
+def converter(series, cambio):
+    """{ativo: Fechamentos em reais} dos ativos em dolar de `series` ({ativo: Fechamentos}).
+
+    As datas de todos os ativos em dolar sao concatenadas e alinhadas ao cambio em uma unica
+    busca; fechamento, maxima e minima sao multiplicados pela cotacao de cada data.
+    """
+    dolar = [ativo for ativo in series if moeda(ativo) == "USD"]
+    if not dolar or cambio is None:
+        return {}
+    tamanhos = [len(series[ativo].datas) for ativo in dolar]
+    fatores = np.split(taxas(cambio, np.concatenate([series[ativo].datas for ativo in dolar])),
+                       np.cumsum(tamanhos)[:-1])
+    convertidas = {}
+    for ativo, fator in zip(dolar, fatores):
+        serie = series[ativo]
+        convertidas[ativo] = Fechamentos(
+            serie.datas, serie.closes * fator,
+            None if serie.maximas is None else serie.maximas * fator,
+            None if serie.minimas is None else serie.minimas * fator)
+    return convertidas
+
+
+def _valor(valor):
+    return None if valor != valor else round(float(valor), 2)
+
+
+def resumo(convertidas, curta=17, longa=72):
+    """Colunas em reais de cada ativo convertido: fechamento, SMAs e minimo/maximo de 5 anos.
+
+    Tudo sobre a matriz (ativos x pregoes) das series convertidas, como em cruzamentos.py.
+    """
+    if not convertidas:
+        return {}
+    ativos, datas, precos = cruzamentos.montar_matriz(
+        {ativo: (serie.datas, serie.closes) for ativo, serie in convertidas.items()})
+    sma_curta = cruzamentos.medias_moveis(precos, curta)[:, -1]
+    sma_longa = cruzamentos.medias_moveis(precos, longa)[:, -1]
+    limites = np.array([np.datetime64(calendario.anos_antes(data.astype(object), 5), "D") for data in datas[:, -1]])
+    janela = np.where(datas >= limites[:, None], precos, np.nan)
+    with np.errstate(invalid="ignore"):
+        minimos = np.fmin.reduce(janela, axis=1)
+        maximos = np.fmax.reduce(janela, axis=1)
+    return {
+        ativo: {
+            "Fechamento BRL": _valor(precos[i, -1]),
+            "SMA%d BRL" % curta: _valor(sma_curta[i]),
+            "SMA%d BRL" % longa: _valor(sma_longa[i]),
+            "Min (5y) BRL": _valor(minimos[i]),
+            "Max (5y) BRL": _valor(maximos[i]),
+        }
+        for i, ativo in enumerate(ativos)
+    }
+
+
+def cotacao(cambio):
+    """{"par", "data", "cotacao"} da ultima cotacao do cambio, para o relatorio"""
+    validos = ~np.isnan(cambio.closes)
+    if not validos.any():
+        return None
+    return {"par": PAR, "data": str(cambio.datas[validos][-1].astype("datetime64[D]")),
+            "cotacao": round(float(cambio.closes[validos][-1]), 4)}
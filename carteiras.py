@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Carteiras monitoradas (carteiras.csv)
+Uma linha por ativo em cada carteira, com o cabecalho "carteira,ativo". A ordem
+do arquivo e a ordem do relatorio; linhas em branco e carteiras comecando com
+'#' sao ignoradas. Incluir ou remover ativos nao exige mexer no codigo.
+
+Para dividir um universo grande entre processos ou runners (monitor.py --shard i/N),
+cada ativo pertence sempre ao mesmo shard, escolhido pelo CRC32 do codigo: incluir
+um ativo novo nao move os outros de shard (e o cache de cada um continua valendo).
+
+Os indicadores extras de cada carteira (RSI, MACD, ATR, Bollinger... veja indicadores.py)
+ficam em indicadores.csv, opcional, com o cabecalho "carteira,indicadores" e os nomes
+separados por espaco, por exemplo: Criptomoedas,rsi14 macd atr14
+"""
+
+import os
+import csv
+import zlib
+import argparse
+
+import indicadores
+
+ARQUIVO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "carteiras.csv")
+ARQUIVO_INDICADORES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "indicadores.csv")
+
+
+def carregar(caminho=ARQUIVO):
+    """{carteira: [ativos]} na ordem do arquivo, sem ativos repetidos dentro de uma carteira"""
+    carteiras = {}
+    with open(caminho, encoding="utf-8", newline="") as f:
+        leitor = csv.DictReader(f)
+        if not {"carteira", "ativo"} <= set(leitor.fieldnames or []):
+            raise ValueError("%s: cabecalho deve ter as colunas carteira,ativo" % caminho)
+        for linha in leitor:
+            carteira = (linha["carteira"] or "").strip()
+            ativo = (linha["ativo"] or "").strip()
+            if not carteira or not ativo or carteira.startswith("#"):
+                continue
+            ativos = carteiras.setdefault(carteira, [])
+            if ativo not in ativos:
+                ativos.append(ativo)
+    return carteiras
+
+
+def carregar_indicadores(caminho=ARQUIVO_INDICADORES):
+    """{carteira: [indicadores.Indicador]}; sem o arquivo, nenhuma carteira tem indicadores extras"""
+    if not os.path.exists(caminho):
+        return {}
+    escolhidos = {}
+    with open(caminho, encoding="utf-8", newline="") as f:
+        leitor = csv.DictReader(f)
+        if not {"carteira", "indicadores"} <= set(leitor.fieldnames or []):
+            raise ValueError("%s: cabecalho deve ter as colunas carteira,indicadores" % caminho)
+        for linha in leitor:
+            carteira = (linha["carteira"] or "").strip()
+            if not carteira or carteira.startswith("#"):
+                continue
+            lista = escolhidos.setdefault(carteira, [])
+            for nome in (linha["indicadores"] or "").split():
+                try:
+                    indicador = indicadores.criar(nome)
+                except ValueError as e:
+                    raise ValueError("%s: %s" % (caminho, e)) from None
+                if indicador.nome not in [existente.nome for existente in lista]:
+                    lista.append(indicador)
+    return escolhidos
+
+
+def shard(ativo, total):
+    """Shard (1..total) de um ativo"""
+    return zlib.crc32(ativo.encode("utf-8")) % total + 1
+
+
+def fatia(ativos, indice, total):
+    """Ativos do shard `indice` de `total`, na ordem original"""
+    return [ativo for ativo in ativos if shard(ativo, total) == indice]
+
+
+def ler_shard(texto):
+    """'i/N' -> (i, N), com 1 <= i <= N (para o argparse)"""
+    try:
+        indice, total = (int(parte) for parte in texto.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("use o formato i/N, por exemplo 2/4")
+    if not 1 <= indice <= total:
+        raise argparse.ArgumentTypeError("shard %s fora do intervalo: 1 <= i <= N" % texto)
+    return indice, total
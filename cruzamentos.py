@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Deteccao vetorizada de cruzamentos de medias
+Monta uma matriz (ativos x pregoes) com todos os ativos de uma vez e encontra
+todos os cruzamentos SMA curta x SMA longa com NumPy, sem lacos por pregao.
+
+Cada ativo tem seu proprio calendario (BTC-USD negocia todos os dias, a B3
+nao), entao as series sao alinhadas pela direita: a ultima coluna e o ultimo
+pregao de cada ativo e o inicio das series mais curtas e preenchido com NaN.
+"""
+
+import numpy as np
+
+
+def montar_matriz(series):
+    """Converte {ativo: pd.Series de fechamentos ou (datas, fechamentos)} em (ativos, datas, precos).
+
+    `datas` e `precos` sao matrizes (ativos x pregoes) alinhadas pela direita;
+    posicoes sem pregao ficam com NaT/NaN.
+    """
+    ativos = list(series)
+    pares = []
+    for ativo in ativos:
+        s = series[ativo]
+        if isinstance(s, tuple):
+            pares.append((np.asarray(s[0]).astype("datetime64[D]"), np.asarray(s[1], dtype=np.float64)))
+        else:
+            pares.append((s.index.values.astype("datetime64[D]"), s.to_numpy(dtype=np.float64)))
+    tamanho = max((len(p) for _, p in pares), default=0)
+    datas = np.full((len(ativos), tamanho), np.datetime64("NaT"), dtype="datetime64[D]")
+    precos = np.full((len(ativos), tamanho), np.nan)
+    for i, (s_datas, s_precos) in enumerate(pares):
+        n = len(s_precos)
+        if n == 0:
+            continue
+        datas[i, tamanho - n:] = s_datas
+        precos[i, tamanho - n:] = s_precos
+    return ativos, datas, precos
+
+
+def medias_moveis(precos, janela):
+    """SMA de `janela` pregoes ao longo de cada linha via soma acumulada (NaN no aquecimento)"""
+    validos = ~np.isnan(precos)
+    acumulado = np.cumsum(np.where(validos, precos, 0.0), axis=1)
+    contagem = np.cumsum(validos, axis=1)
+    soma = acumulado.copy()
+    soma[:, janela:] -= acumulado[:, :-janela]
+    n = contagem.copy()
+    n[:, janela:] -= contagem[:, :-janela]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n == janela, soma / janela, np.nan)
+
+
+def _propagar_sinal(sinal):
+    """Repete o ultimo sinal nao nulo nas posicoes com sinal 0 (medias iguais ou aquecimento)"""
+    linhas, colunas = sinal.shape
+    indices = np.where(sinal != 0, np.arange(colunas), 0)
+    np.maximum.accumulate(indices, axis=1, out=indices)
+    return sinal[np.arange(linhas)[:, None], indices]
+
+
+def detectar(ativos, datas, precos, curta=17, longa=72):
+    """Todos os cruzamentos de cada ativo, em ordem cronologica.
+
+    Retorna {ativo: [{"data", "direcao", "preco", "distancia"}]}, onde `direcao`
+    e COMPRA (SMA curta passou para cima da longa) ou VENDA, `preco` e o
+    fechamento do pregao do cruzamento e `distancia` e (SMA curta - SMA longa) / SMA longa.
+    So conta troca real de lado: o inicio das medias (NaN) nao gera cruzamento.
+    """
+    eventos = {ativo: [] for ativo in ativos}
+    if precos.size == 0:
+        return eventos
+
+    sma_curta = medias_moveis(precos, curta)
+    sma_longa = medias_moveis(precos, longa)
+    diferenca = sma_curta - sma_longa
+    sinal = _propagar_sinal(np.nan_to_num(np.sign(diferenca)).astype(np.int8))
+
+    troca = np.zeros(sinal.shape, dtype=bool)
+    troca[:, 1:] = (sinal[:, 1:] != sinal[:, :-1]) & (sinal[:, :-1] != 0)
+
+    colunas = sinal.shape[1]
+    for posicao in np.flatnonzero(troca):
+        linha, coluna = divmod(int(posicao), colunas)
+        eventos[ativos[linha]].append({
+            "data": str(datas[linha, coluna]),
+            "direcao": "COMPRA" if sinal[linha, coluna] > 0 else "VENDA",
+            "preco": float(precos[linha, coluna]),
+            "distancia": float(diferenca[linha, coluna] / sma_longa[linha, coluna]),
+        })
+    return eventos
+
+
+def ultimos(eventos):
+    """{ativo: ultimo cruzamento} dos ativos que tem algum (o resumo leva so este; a lista vai no historico)"""
+    return {ativo: lista[-1] for ativo, lista in eventos.items() if lista}
+
+
+def recentes(eventos, carteiras, desde):
+    """Cruzamentos a partir de `desde` (data ISO), um registro por carteira em que o ativo aparece.
+
+    O formato e o de `sinais_recentes` lido pelo frontend (ativo, carteira, sinal, data, preco, distancia).
+    """
+    sinais = []
+    for carteira, ativos in carteiras.items():
+        for ativo in ativos:
+            for evento in eventos.get(ativo, []):
+                if evento["data"] >= desde:
+                    sinais.append({
+                        "ativo": ativo,
+                        "carteira": carteira,
+                        "sinal": evento["direcao"],
+                        "data": evento["data"],
+                        "preco": round(evento["preco"], 2),
+                        "distancia": evento["distancia"],
+                    })
+    sinais.sort(key=lambda s: s["data"], reverse=True)
+    return sinais
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Feed de deltas do relatorio
+A cada gravacao o relatorio ganha um numero de versao crescente e, alem do
+data/current-analysis.json completo, sao gravados:
+
+    data/manifest.json         versao atual, hashes do snapshot e do indice do historico
+                               e a lista dos deltas disponiveis (os ultimos MAX_DELTAS)
+    data/deltas/<versao>.json  o que mudou desde a versao anterior:
+        linhas             {carteira: [linhas que mudaram]} (a linha e identificada pelo "Ativo")
+        ordem              {carteira: [ativos]} das carteiras que ganharam, perderam ou
+                           reordenaram ativos; carteiras_removidas lista as que sairam
+        campos             chaves do relatorio que mudaram (timestamp, sinais_recentes,
+                           analise_carteiras...); campos_removidos as que sairam
+        entradas           {chave: {ativo: valor}} das chaves por ativo (POR_ATIVO, ex.:
+                           ultimos_cruzamentos): so os ativos que mudaram; entradas_removidas
+                           {chave: [ativos]} os que sairam
+        historico          {ativo: {"a_partir", "n", "datas", "precos", "sma17", "sma72"}}:
+                           os pontos a partir da primeira data diferente (em geral o ultimo
+                           pregao e os novos); o cliente descarta os seus pontos a partir de
+                           "a_partir", acrescenta estes e fica com os ultimos "n". Se o ativo
+                           tem cruzamentos, "cruzamentos_mantidos" diz quantos dos que o
+                           cliente ja tem continuam valendo e "cruzamentos" traz os seguintes
+    data/deltas/estado.json    hashes de cada linha, campo e entrada da versao atual, para
+                               calcular o proximo delta sem reler o snapshot anterior
+
+Um cliente na versao v busca o manifest; se v + 1 ainda esta entre os deltas, aplica
+os deltas v + 1 .. atual em ordem (veja aplicar); senao, ou se um hash nao bater,
+busca o snapshot completo.
+"""
+
+import os
+import json
+import hashlib
+
+import historico as historico_compacto
+
+DIR_DELTAS = os.path.join("data", "deltas")
+MANIFEST = os.path.join("data", "manifest.json")
+SNAPSHOT = os.path.join("data", "current-analysis.json")
+ESTADO = os.path.join(DIR_DELTAS, "estado.json")
+MAX_DELTAS = 48
+# Chaves do relatorio que nao sao comparadas como campos (vao em linhas/ordem/historico)
+ESTRUTURAIS = ("carteiras", "historico", "versao")
+# Chaves {ativo: valor} comparadas ativo a ativo: um cruzamento novo nao reenvia os dos outros ativos
+POR_ATIVO = ("ultimos_cruzamentos",)
+
+
+def _hash(valor):
+    texto = json.dumps(valor, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def _hash_arquivo(caminho):
+    with open(caminho, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _gravar_json(caminho, valor):
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(valor, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporario, caminho)
+
+
+def carregar_estado(caminho=ESTADO):
+    """Estado da ultima versao publicada, ou um estado vazio (versao 0)"""
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"versao": 0, "linhas": {}, "campos": {}}
+
+
+def _versao(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f).get("versao") or 0
+    except (OSError, ValueError):
+        return 0
+
+
+def proxima_versao(estado):
+    """Versao da proxima gravacao: sempre maior que a do estado, do manifest e do snapshot"""
+    return max(estado["versao"], _versao(MANIFEST), _versao(SNAPSHOT)) + 1
+
+
+def _valores(serie, nome):
+    # NaN (media em aquecimento) vira None, como no arquivo compacto do historico
+    return [None if valor is None or valor != valor else valor for valor in serie.get(nome, [])]
+
+
+def _historico(anterior, serie):
+    """Pontos de `serie` a partir da primeira data que nao existia (ou mudou) em `anterior`"""
+    colunas = [_valores(serie, nome) for nome in historico_compacto.SERIES]
+    inicio = 0
+    if anterior:
+        pontos = dict(zip(anterior["datas"], zip(*(_valores(anterior, nome) for nome in historico_compacto.SERIES))))
+        while inicio < len(serie["datas"]) and \
+                pontos.get(serie["datas"][inicio]) == tuple(coluna[inicio] for coluna in colunas):
+            inicio += 1
+    item = {"a_partir": serie["datas"][inicio] if inicio < len(serie["datas"]) else None,
+            "n": len(serie["datas"]), "datas": serie["datas"][inicio:]}
+    for nome, coluna in zip(historico_compacto.SERIES, colunas):
+        item[nome] = coluna[inicio:]
+    if "cruzamentos" in serie:
+        # Cruzamentos so se acumulam: vai o que veio depois do trecho em comum (no arredondamento do arquivo)
+        novos = [historico_compacto.codificar_cruzamento(evento) for evento in serie["cruzamentos"]]
+        antigos = [historico_compacto.codificar_cruzamento(evento) for evento in (anterior or {}).get("cruzamentos", [])]
+        mantidos = 0
+        while mantidos < min(len(novos), len(antigos)) and novos[mantidos] == antigos[mantidos]:
+            mantidos += 1
+        item["cruzamentos_mantidos"] = mantidos
+        item["cruzamentos"] = [historico_compacto.decodificar_cruzamento(evento) for evento in novos[mantidos:]]
+    return item
+
+
+def calcular(estado, relatorio, versao, anteriores):
+    """(delta, novo estado) da versao do `estado` para `relatorio`.
+
+    `anteriores` ({ativo: serie}) traz o historico antigo dos ativos cujo grafico mudou
+    (veja historico.gravar); ativos novos vem com a serie inteira.
+    """
+    novo = {"versao": versao, "linhas": {}, "campos": {}, "entradas": {}, "historico": {}}
+    delta = {"versao": versao, "anterior": estado["versao"], "linhas": {}, "ordem": {}, "campos": {},
+             "entradas": {}, "historico": {}}
+
+    for carteira, linhas in relatorio.get("carteiras", {}).items():
+        hashes = {linha["Ativo"]: _hash(linha) for linha in linhas}
+        novo["linhas"][carteira] = hashes
+        antes = estado["linhas"].get(carteira, {})
+        mudaram = [linha for linha in linhas if antes.get(linha["Ativo"]) != hashes[linha["Ativo"]]]
+        if mudaram:
+            delta["linhas"][carteira] = mudaram
+        if list(antes) != list(hashes):
+            delta["ordem"][carteira] = list(hashes)
+    removidas = [carteira for carteira in estado["linhas"] if carteira not in novo["linhas"]]
+    if removidas:
+        delta["carteiras_removidas"] = removidas
+
+    for chave, valor in relatorio.items():
+        if chave in ESTRUTURAIS:
+            continue
+        if chave in POR_ATIVO:
+            hashes = {ativo: _hash(item) for ativo, item in valor.items()}
+            novo["entradas"][chave] = hashes
+            antes = estado.get("entradas", {}).get(chave)
+            mudaram = {ativo: item for ativo, item in valor.items() if (antes or {}).get(ativo) != hashes[ativo]}
+            if mudaram or antes is None:
+                delta["entradas"][chave] = mudaram
+            continue
+        novo["campos"][chave] = _hash(valor)
+        if estado["campos"].get(chave) != novo["campos"][chave]:
+            delta["campos"][chave] = valor
+    sairam = [chave for chave in estado["campos"] if chave not in novo["campos"]]
+    if sairam:
+        delta["campos_removidos"] = sairam
+    for chave, antes in estado.get("entradas", {}).items():
+        atuais = novo["entradas"].get(chave)
+        if atuais is None:
+            delta.setdefault("campos_removidos", []).append(chave)
+            continue
+        removidos = [ativo for ativo in antes if ativo not in atuais]
+        if removidos:
+            delta.setdefault("entradas_removidas", {})[chave] = removidos
+
+    series = relatorio.get("historico", {})
+    hashes_historico = estado.get("historico", {})
+    for ativo, serie in series.items():
+        novo["historico"][ativo] = _hash(serie)
+        if hashes_historico.get(ativo) != novo["historico"][ativo]:
+            delta["historico"][ativo] = _historico(anteriores.get(ativo), serie)
+    removidos = [ativo for ativo in hashes_historico if ativo not in series]
+    if removidos:
+        delta["historico_removido"] = removidos
+    return delta, novo
+
+
+def publicar(relatorio, versao, anteriores, estado=None):
+    """Grava o delta da versao, o estado e por ultimo o manifest (chamar depois do snapshot e do historico)"""
+    estado = carregar_estado() if estado is None else estado
+    os.makedirs(DIR_DELTAS, exist_ok=True)
+    delta, novo = calcular(estado, relatorio, versao, anteriores)
+    try:
+        with open(MANIFEST, encoding="utf-8") as f:
+            disponiveis = json.load(f).get("deltas", [])
+    except (OSError, ValueError):
+        disponiveis = []
+    # Sem o estado da versao anterior nao ha de onde partir: a versao so tem o snapshot
+    if estado["versao"] > 0 and estado["versao"] == versao - 1:
+        caminho = os.path.join(DIR_DELTAS, "%d.json" % versao)
+        _gravar_json(caminho, delta)
+        disponiveis.append({"versao": versao, "arquivo": "deltas/%d.json" % versao,
+                            "sha256": _hash_arquivo(caminho), "bytes": os.path.getsize(caminho)})
+    else:
+        disponiveis = []
+    disponiveis = [item for item in disponiveis if item["versao"] > versao - MAX_DELTAS]
+    _gravar_json(ESTADO, novo)
+
+    manter = {os.path.basename(item["arquivo"]) for item in disponiveis} | {os.path.basename(ESTADO)}
+    for nome in os.listdir(DIR_DELTAS):
+        if nome.endswith(".json") and nome not in manter:
+            os.remove(os.path.join(DIR_DELTAS, nome))
+
+    indice = os.path.join(historico_compacto.DIR_HISTORICO, "index.json")
+    manifest = {
+        "versao": versao,
+        "timestamp": relatorio.get("timestamp"),
+        "snapshot": {"arquivo": "current-analysis.json", "sha256": _hash_arquivo(SNAPSHOT),
+                     "bytes": os.path.getsize(SNAPSHOT)},
+        "historico": {"arquivo": "historico/index.json",
+                      "sha256": _hash_arquivo(indice) if os.path.exists(indice) else None},
+        "deltas": disponiveis,
+    }
+    _gravar_json(MANIFEST, manifest)
+    return delta
+
+
+def aplicar(snapshot, delta, historicos=None):
+    """Aplica um delta ao snapshot (sem "historico") e, se informado, a {ativo: serie}. Retorna o snapshot"""
+    if snapshot.get("versao") != delta["anterior"]:
+        raise ValueError("delta %d parte da versao %s, snapshot esta na %s"
+                         % (delta["versao"], delta["anterior"], snapshot.get("versao")))
+    carteiras = snapshot.setdefault("carteiras", {})
+    for carteira in delta.get("carteiras_removidas", []):
+        carteiras.pop(carteira, None)
+    for carteira in set(delta["ordem"]) | set(delta["linhas"]):
+        atuais = {linha["Ativo"]: linha for linha in carteiras.get(carteira, [])}
+        atuais.update((linha["Ativo"], linha) for linha in delta["linhas"].get(carteira, []))
+        ordem = delta["ordem"].get(carteira, [linha["Ativo"] for linha in carteiras.get(carteira, [])])
+        carteiras[carteira] = [atuais[ativo] for ativo in ordem]
+    for chave in delta.get("campos_removidos", []):
+        snapshot.pop(chave, None)
+    snapshot.update(delta["campos"])
+    for chave, ativos in delta.get("entradas_removidas", {}).items():
+        for ativo in ativos:
+            snapshot.get(chave, {}).pop(ativo, None)
+    for chave, entradas in delta.get("entradas", {}).items():
+        snapshot.setdefault(chave, {}).update(entradas)
+    snapshot["versao"] = delta["versao"]
+
+    if historicos is not None:
+        for ativo in delta.get("historico_removido", []):
+            historicos.pop(ativo, None)
+        for ativo, item in delta["historico"].items():
+            serie = historicos.get(ativo) or {"datas": []}
+            corte = len(serie["datas"]) if item["a_partir"] is None else \
+                next((i for i, data in enumerate(serie["datas"]) if data >= item["a_partir"]), len(serie["datas"]))
+            nova = {"datas": (serie["datas"][:corte] + item["datas"])[-item["n"]:] if item["n"] else []}
+            for nome in historico_compacto.SERIES:
+                nova[nome] = (serie.get(nome, [])[:corte] + item[nome])[-item["n"]:] if item["n"] else []
+            if "cruzamentos" in item:
+                nova["cruzamentos"] = serie.get("cruzamentos", [])[:item["cruzamentos_mantidos"]] + item["cruzamentos"]
+            historicos[ativo] = nova
+    return snapshot
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Estado incremental das medias moveis
+Mantem, por ativo, as janelas das ultimas 17 e 72 cotacoes com suas somas
+para atualizar SMA17/SMA72 e o ultimo cruzamento em tempo constante a cada
+pregao novo, sem recalcular o rolling sobre todo o historico.
+
+As somas seguem exatamente o algoritmo de soma compensada (Kahan) do
+`rolling().mean()` do pandas, entao os valores batem bit a bit com ele.
+"""
+
+import os
+import json
+import math
+from collections import deque
+
+import numpy as np
+
+import cache_precos
+
+
+def caminho(ativo):
+    """Arquivo de estado de um ativo, ao lado do cache de precos"""
+    return cache_precos.caminho(ativo)[:-len(".npz")] + ".sma.json"
+
+
+class JanelaMovel:
+    """Media movel simples de tamanho fixo com atualizacao O(1)"""
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self.valores = deque(maxlen=tamanho)
+        self.nobs = 0
+        self.soma = 0.0
+        self.comp_add = 0.0
+        self.comp_remove = 0.0
+        self.negativos = 0
+        self.repetidos = 0
+        self.anterior = None
+
+    def _remover(self, valor):
+        if math.isnan(valor):
+            return
+        self.nobs -= 1
+        y = -valor - self.comp_remove
+        t = self.soma + y
+        self.comp_remove = t - self.soma - y
+        self.soma = t
+        if math.copysign(1.0, valor) < 0:
+            self.negativos -= 1
+
+    def _adicionar(self, valor):
+        if self.anterior is None:
+            self.anterior = valor
+        if math.isnan(valor):
+            return
+        self.nobs += 1
+        y = valor - self.comp_add
+        t = self.soma + y
+        self.comp_add = t - self.soma - y
+        self.soma = t
+        if math.copysign(1.0, valor) < 0:
+            self.negativos += 1
+        if valor == self.anterior:
+            self.repetidos += 1
+        else:
+            self.repetidos = 1
+        self.anterior = valor
+
+    def atualizar(self, valor):
+        """Inclui uma cotacao nova, descartando a mais antiga quando a janela esta cheia"""
+        valor = float(valor)
+        if len(self.valores) == self.tamanho:
+            self._remover(self.valores[0])
+        self.valores.append(valor)
+        self._adicionar(valor)
+
+    def media(self):
+        """Media atual, ou NaN enquanto a janela nao estiver cheia"""
+        if self.nobs < self.tamanho or self.nobs == 0:
+            return float("nan")
+        resultado = self.soma / self.nobs
+        if self.repetidos >= self.nobs:
+            return self.anterior
+        if self.negativos == 0 and resultado < 0:
+            return 0.0
+        if self.negativos == self.nobs and resultado > 0:
+            return 0.0
+        return resultado
+
+    def copiar(self):
+        copia = JanelaMovel(self.tamanho)
+        copia.__dict__.update(self.__dict__)
+        copia.valores = deque(self.valores, maxlen=self.tamanho)
+        return copia
+
+    def para_dict(self):
+        dados = dict(self.__dict__)
+        dados["valores"] = list(self.valores)
+        return dados
+
+    @classmethod
+    def de_dict(cls, dados):
+        janela = cls(dados["tamanho"])
+        janela.__dict__.update(dados)
+        janela.valores = deque(dados["valores"], maxlen=janela.tamanho)
+        return janela
+
+
+class EstadoSMA:
+    """SMA17, SMA72 e ultimo cruzamento de um ativo, atualizados pregao a pregao"""
+
+    def __init__(self, curta=17, longa=72):
+        self.curta = JanelaMovel(curta)
+        self.longa = JanelaMovel(longa)
+        self.primeira_data = None
+        self.ultima_data = None
+        self.ultimo_close = None
+        self.sinal = 0
+        self.ultimo_cruzamento = None
+
+    def atualizar(self, data, close):
+        """Consome um pregao (data ISO 'AAAA-MM-DD' e fechamento)"""
+        self.curta.atualizar(close)
+        self.longa.atualizar(close)
+        sma_curta = self.curta.media()
+        sma_longa = self.longa.media()
+        # Medias iguais ou ainda em aquecimento (NaN) mantem o lado anterior,
+        # com a mesma regra de cruzamentos.detectar
+        sinal = 1 if sma_curta > sma_longa else (-1 if sma_curta < sma_longa else 0)
+        if self.primeira_data is None:
+            self.primeira_data = data
+        if sinal != 0:
+            if self.sinal != 0 and sinal != self.sinal:
+                self.ultimo_cruzamento = data
+            self.sinal = sinal
+        self.ultima_data = data
+        self.ultimo_close = float(close)
+
+    def valores(self):
+        """(sma_curta, sma_longa) atuais"""
+        return self.curta.media(), self.longa.media()
+
+    def copiar(self):
+        copia = EstadoSMA()
+        copia.__dict__.update(self.__dict__)
+        copia.curta = self.curta.copiar()
+        copia.longa = self.longa.copiar()
+        return copia
+
+    def para_dict(self):
+        dados = dict(self.__dict__)
+        dados["curta"] = self.curta.para_dict()
+        dados["longa"] = self.longa.para_dict()
+        return dados
+
+    @classmethod
+    def de_dict(cls, dados):
+        estado = cls()
+        estado.__dict__.update(dados)
+        estado.curta = JanelaMovel.de_dict(dados["curta"])
+        estado.longa = JanelaMovel.de_dict(dados["longa"])
+        return estado
+
+
+def carregar(ativo):
+    """Le o estado persistido de um ativo, ou None"""
+    try:
+        with open(caminho(ativo), encoding="utf-8") as f:
+            return EstadoSMA.de_dict(json.load(f))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print("  [AVISO] Estado SMA invalido de " + ativo + ": " + str(e)[:80])
+        return None
+
+
+def salvar(ativo, estado):
+    os.makedirs(os.path.dirname(caminho(ativo)), exist_ok=True)
+    temporario = caminho(ativo) + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(estado.para_dict(), f, separators=(",", ":"))
+    os.replace(temporario, caminho(ativo))
+
+
+def _posicao(datas, data):
+    """Indice da data ISO `data` no array ordenado de datas (datetime64[D]), ou None"""
+    alvo = np.datetime64(data, "D")
+    i = int(np.searchsorted(datas, alvo))
+    return i if i < len(datas) and datas[i] == alvo else None
+
+
+def _compativel(estado, datas, closes):
+    """O estado so pode ser reaproveitado se o historico que ele consumiu nao mudou"""
+    if estado is None or estado.ultima_data is None or len(datas) == 0:
+        return False
+    if np.datetime64(estado.primeira_data, "D") != datas[0]:
+        return False
+    posicao = _posicao(datas, estado.ultima_data)
+    return posicao is not None and closes[posicao] == estado.ultimo_close
+
+
+def calcular(ativo, datas, closes, estado=None):
+    """Atualiza o estado com os pregoes novos e devolve (estado_atual, estado_fechado).
+
+    `datas` (datetime64[D] ou strings ISO) e `closes` em ordem cronologica; so os pregoes
+    ainda nao consumidos pelo estado viram objetos Python. O ultimo pregao pode estar em
+    aberto: ele entra apenas no estado_atual, enquanto o estado_fechado (que deve ser
+    persistido) para no penultimo. Se o historico foi revisado (desdobramento, dividendo,
+    cache refeito), o estado e reconstruido do zero.
+    """
+    datas = np.asarray(datas, dtype="datetime64[D]")
+    closes = np.asarray(closes, dtype=np.float64)
+    if not _compativel(estado, datas, closes):
+        if estado is not None:
+            print("  [SMA] " + ativo + ": historico revisado, reconstruindo estado")
+        estado = EstadoSMA()
+        inicio = 0
+    else:
+        inicio = _posicao(datas, estado.ultima_data) + 1
+
+    novas = np.datetime_as_string(datas[inicio:], unit="D").tolist()
+    novos = closes[inicio:].tolist()
+    for data, close in zip(novas[:-1], novos[:-1]):
+        estado.atualizar(data, close)
+
+    atual = estado.copiar()
+    if novas and (estado.ultima_data is None or novas[-1] > estado.ultima_data):
+        atual.atualizar(novas[-1], novos[-1])
+    return atual, estado
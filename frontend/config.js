@@ -1,6 +1,7 @@
 // Configuração para ler dados do repositório GitHub
 // Os arquivos JSON são gerados automaticamente pelos workflows:
 // - data/current-analysis.json (a cada hora)
+// - data/manifest.json e data/deltas/ (só o que mudou desde a versão anterior)
 // - data/backtest.json (toda segunda-feira)
 
 // URL base do repositório (raw GitHub content)
@@ -14,7 +15,9 @@ window.APP_CONFIG = {
     // URLs dos arquivos JSON gerados pelo GitHub Actions
     urls: {
         currentAnalysis: `${BASE_RAW_URL}/data/current-analysis.json`,
-        backtest: `${BASE_RAW_URL}/data/backtest.json`
+        backtest: `${BASE_RAW_URL}/data/backtest.json`,
+        // manifest.json e deltas/<versao>.json (feed de deltas da análise)
+        dataBase: `${BASE_RAW_URL}/data`
     },
     
     // Cache para não fazer requisições a cada atualização
@@ -11,10 +11,13 @@ const getDataUrl = (filename) => {
     } else if (window.location.hostname.includes('github.io')) {
         // GitHub Pages: usar caminho relativo que funciona do /Agente-MF/
         return `./data/${filename}`;
-    } else {
+    } else if (filename === 'current-analysis.json' || filename === 'backtest.json') {
         // Fallback: tentar usar URL do GitHub se disponível
         return window.DATA_URLS?.[filename === 'current-analysis.json' ? 'currentAnalysis' : 'backtest'] || 
                `./data/${filename}`;
+    } else {
+        // Manifest e deltas: mesma pasta data/ do GitHub
+        return window.DATA_URLS?.dataBase ? `${window.DATA_URLS.dataBase}/${filename}` : `./data/${filename}`;
     }
 };
 
@@ -111,6 +114,71 @@ function formatPercent(value) {
 
 // ========== ANÁLISE ATUAL ==========
 
+// Feed de deltas (data/manifest.json, veja delta.py): com a versão anterior carregada,
+// busca só os deltas que faltam; muito atrás, ou se um hash não bater, o snapshot completo
+
+async function buscarJsonVerificado(url, sha256) {
+    const response = await fetch(url, { cache: 'no-store' });
+    const bytes = await response.arrayBuffer();
+    if (sha256 && window.crypto?.subtle) {
+        const digest = await crypto.subtle.digest('SHA-256', bytes);
+        const hex = Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+        if (hex !== sha256) throw new Error(`hash diferente em ${url}`);
+    }
+    return JSON.parse(new TextDecoder().decode(bytes));
+}
+
+function aplicarDelta(dados, delta) {
+    if (dados.versao !== delta.anterior) throw new Error(`delta ${delta.versao} não parte da versão ${dados.versao}`);
+    const carteiras = dados.carteiras = dados.carteiras || {};
+    for (const carteira of delta.carteiras_removidas || []) delete carteiras[carteira];
+    const alteradas = new Set([...Object.keys(delta.ordem), ...Object.keys(delta.linhas)]);
+    for (const carteira of alteradas) {
+        const atuais = new Map((carteiras[carteira] || []).map(linha => [linha.Ativo, linha]));
+        for (const linha of delta.linhas[carteira] || []) atuais.set(linha.Ativo, linha);
+        const ordem = delta.ordem[carteira] || (carteiras[carteira] || []).map(linha => linha.Ativo);
+        carteiras[carteira] = ordem.map(ativo => atuais.get(ativo));
+    }
+    for (const chave of delta.campos_removidos || []) delete dados[chave];
+    Object.assign(dados, delta.campos);
+    for (const [chave, ativos] of Object.entries(delta.entradas_removidas || {})) {
+        for (const ativo of ativos) delete (dados[chave] || {})[ativo];
+    }
+    for (const [chave, entradas] of Object.entries(delta.entradas || {})) {
+        dados[chave] = Object.assign(dados[chave] || {}, entradas);
+    }
+    dados.versao = delta.versao;
+    return dados;
+}
+
+async function buscarAnaliseAtual() {
+    const atual = currentData.analiseAtual;
+    let manifest = null;
+    try {
+        manifest = await (await fetch(getDataUrl('manifest.json'), { cache: 'no-store' })).json();
+    } catch (error) {
+        console.warn('Manifest indisponível, usando o snapshot completo', error);
+    }
+    if (manifest && atual && atual.versao === manifest.versao) return atual;
+    if (manifest && atual && atual.versao) {
+        const pendentes = manifest.deltas.filter(item => item.versao > atual.versao);
+        if (pendentes.length === manifest.versao - atual.versao && pendentes[0].versao === atual.versao + 1) {
+            try {
+                let dados = structuredClone(atual);
+                for (const item of pendentes) {
+                    dados = aplicarDelta(dados, await buscarJsonVerificado(getDataUrl(item.arquivo), item.sha256));
+                }
+                console.log(`[OK] ${pendentes.length} delta(s) aplicados até a versão ${manifest.versao}`);
+                return dados;
+            } catch (error) {
+                console.warn('Falha nos deltas, buscando o snapshot completo', error);
+            }
+        }
+    }
+    // O snapshot traz a própria versão; um hash diferente do manifest só indica versão mais nova
+    return buscarJsonVerificado(DATA_DEFAULT.currentAnalysis);
+}
+
 async function loadAnaliseAtual() {
     const statusIndicator = document.getElementById('statusIndicator');
     
@@ -118,9 +186,8 @@ async function loadAnaliseAtual() {
         statusIndicator.textContent = '● Carregando...';
         statusIndicator.classList.remove('offline');
         
-        // Buscar JSON do repositório GitHub
-        const response = await fetch(DATA_DEFAULT.currentAnalysis);
-        const data = await response.json();
+        // Buscar JSON do repositório GitHub (deltas desde a última versão, ou o snapshot)
+        const data = await buscarAnaliseAtual();
         
         currentData.analiseAtual = data;
         currentData.lastFetch = new Date();
@@ -266,12 +333,14 @@ async function loadBacktest() {
         const response = await fetch(DATA_DEFAULT.backtest);
         const data = await response.json();
         
-        if (data.status === 'aguardando' || !data.dados) {
+        // backtest.py grava os campos na raiz; "dados" é o formato antigo
+        const dados = data.dados || data;
+        if (data.status === 'aguardando' || !dados.resumo || !dados.resumo.ativos_analisados) {
             throw new Error('Backtest ainda não foi executado. Ele roda toda segunda-feira automaticamente.');
         }
         
         currentData.backtest = data;
-        renderBacktest(data.dados);
+        renderBacktest(dados);
         
         statusContainer.style.display = 'none';
         container.style.display = 'block';
@@ -398,6 +467,11 @@ function renderBacktest(data) {
                         </div>
                     </div>
                     
+                    <div class="metric">
+                        <div class="metric-label">Drawdown Máx</div>
+                        <div class="metric-value negative">${formatPercent(ativo.drawdown_maximo || 0)}</div>
+                    </div>
+                    
                     <div class="metric">
                         <div class="metric-label">Retorno Médio/Op</div>
                         <div class="metric-value">${formatPercent(ativo.retorno_medio_por_operacao)}</div>
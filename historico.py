@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Historico compacto para os graficos
+Grava os ultimos 365 pregoes de cada ativo (e todos os seus cruzamentos) em
+data/historico/<ativo>.json, separado do resumo em data/current-analysis.json,
+para que o grafico de um ativo so seja baixado quando for aberto.
+
+Formato (versao 1), um eixo de datas para as tres series:
+    d0      dia do primeiro pregao (dias desde 1970-01-01)
+    dd      intervalo em dias entre pregoes consecutivos (len = n - 1)
+    escala  fator do ponto fixo (100 = 2 casas decimais)
+    precos, sma17, sma72
+            inteiros em ponto fixo codificados por diferenca: o primeiro valor
+            e absoluto e os demais sao a diferenca para o ultimo valor nao nulo;
+            null marca pregao sem valor (ex.: media ainda em aquecimento)
+    cruzamentos
+            opcional: todos os cruzamentos do ativo (nao so os 365 dias), cada um
+            [dia, direcao, preco, distancia] com o preco em 2 casas e a distancia em 6
+"""
+
+import os
+import json
+import math
+import hashlib
+from datetime import date, timedelta
+
+import cache_precos
+
+DIR_HISTORICO = os.path.join("data", "historico")
+VERSAO = 1
+ESCALA = 100
+SERIES = ("precos", "sma17", "sma72")
+_EPOCA = date(1970, 1, 1)
+
+
+def _codificar_serie(valores, escala):
+    saida = []
+    anterior = None
+    for valor in valores:
+        if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+            saida.append(None)
+            continue
+        inteiro = int(round(valor * escala))
+        saida.append(inteiro if anterior is None else inteiro - anterior)
+        anterior = inteiro
+    return saida
+
+
+def _decodificar_serie(valores, escala):
+    saida = []
+    anterior = None
+    for valor in valores:
+        if valor is None:
+            saida.append(None)
+            continue
+        anterior = valor if anterior is None else anterior + valor
+        saida.append(anterior / escala)
+    return saida
+
+
+def codificar_cruzamento(evento):
+    """Cruzamento {"data", "direcao", "preco", "distancia"} no formato compacto [dia, direcao, preco, distancia]"""
+    return [(date.fromisoformat(evento["data"]) - _EPOCA).days, evento["direcao"],
+            round(evento["preco"], 2), round(evento["distancia"], 6)]
+
+
+def decodificar_cruzamento(item):
+    dia, direcao, preco, distancia = item
+    return {"data": (_EPOCA + timedelta(days=dia)).isoformat(), "direcao": direcao,
+            "preco": preco, "distancia": distancia}
+
+
+def codificar(ativo, serie, escala=ESCALA):
+    """Converte {"datas", "precos", "sma17", "sma72"} (listas) e, se houver, "cruzamentos" no formato compacto"""
+    dias = [(date.fromisoformat(d) - _EPOCA).days for d in serie["datas"]]
+    doc = {
+        "v": VERSAO,
+        "ativo": ativo,
+        "escala": escala,
+        "d0": dias[0] if dias else None,
+        "dd": [b - a for a, b in zip(dias, dias[1:])],
+    }
+    for nome in SERIES:
+        doc[nome] = _codificar_serie(serie.get(nome, []), escala)
+    if "cruzamentos" in serie:
+        doc["cruzamentos"] = [codificar_cruzamento(evento) for evento in serie["cruzamentos"]]
+    return doc
+
+
+def decodificar(doc):
+    """Inverso de codificar: volta para listas de datas ISO e floats"""
+    datas = []
+    if doc["d0"] is not None:
+        dia = doc["d0"]
+        datas.append(dia)
+        for delta in doc["dd"]:
+            dia += delta
+            datas.append(dia)
+    serie = {"datas": [(_EPOCA + timedelta(days=dia)).isoformat() for dia in datas]}
+    for nome in SERIES:
+        serie[nome] = _decodificar_serie(doc.get(nome, []), doc["escala"])
+    if "cruzamentos" in doc:
+        serie["cruzamentos"] = [decodificar_cruzamento(item) for item in doc["cruzamentos"]]
+    return serie
+
+
+def serializar(doc):
+    """JSON sem indentacao nem espacos"""
+    return json.dumps(doc, ensure_ascii=False, separators=(",", ":"))
+
+
+def arquivo(ativo):
+    """Nome do arquivo de historico de um ativo dentro de DIR_HISTORICO"""
+    return cache_precos.nome_seguro(ativo) + ".json"
+
+
+def _gravar_atomico(caminho, conteudo):
+    """Grava em um temporario e renomeia: o arquivo nunca fica pela metade"""
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+def gravar(historico, diretorio=DIR_HISTORICO, anteriores=None):
+    """Grava um arquivo compacto por ativo e o indice {ativo: {"arquivo", "hash"}}. Retorna o indice.
+
+    O hash do conteudo vai na URL usada pelo HTML (?v=<hash>), entao o navegador pode
+    manter cada grafico em cache ate que ele mude de fato. Arquivos com o mesmo hash do
+    indice anterior nao sao regravados. Com `anteriores` (dict), cada ativo que mudou
+    recebe nele a serie que estava gravada antes (decodificada), para o feed de deltas.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    try:
+        with open(os.path.join(diretorio, "index.json"), encoding="utf-8") as f:
+            indice_anterior = json.load(f)
+    except (OSError, ValueError):
+        indice_anterior = {}
+    indice = {}
+    for ativo, serie in historico.items():
+        nome = arquivo(ativo)
+        conteudo = serializar(codificar(ativo, serie)).encode("utf-8")
+        indice[ativo] = {"arquivo": nome, "hash": hashlib.sha256(conteudo).hexdigest()[:12]}
+        caminho = os.path.join(diretorio, nome)
+        existe = os.path.exists(caminho)
+        if existe and indice_anterior.get(ativo) == indice[ativo]:
+            continue
+        if anteriores is not None and existe:
+            try:
+                with open(caminho, encoding="utf-8") as f:
+                    anteriores[ativo] = decodificar(json.load(f))
+            except (OSError, ValueError, KeyError):
+                pass
+        _gravar_atomico(caminho, conteudo)
+    _gravar_atomico(os.path.join(diretorio, "index.json"), serializar(indice).encode("utf-8"))
+    # Remove historicos de ativos que sairam das carteiras
+    arquivos = {item["arquivo"] for item in indice.values()}
+    for nome in os.listdir(diretorio):
+        if nome.endswith(".json") and nome != "index.json" and nome not in arquivos:
+            os.remove(os.path.join(diretorio, nome))
+    return indice
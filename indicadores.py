@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Motor de indicadores
+Cada indicador do REGISTRO declara os nos de que depende (medias moveis, EMAs,
+fechamento anterior, true range...). O Motor junta os nos de todos os indicadores
+pedidos, calculando uma unica vez os que se repetem (as EMAs 12/26 do MACD e da
+EMA12 avulsa, a media de 20 do Bollinger e da SMA20), e faz tudo em uma passada
+sobre a matriz (ativos x pregoes) alinhada pela direita de cruzamentos.montar_matriz.
+
+No fim da passada cada no guarda o seu estado no ultimo pregao (janela da media,
+ultimo valor da EMA, fechamento anterior) e Motor.avancar recebe o pregao seguinte
+e atualiza os indicadores em O(1) por ativo, com as mesmas formulas da passada.
+atualizar usa isso entre execucoes (modo servico): o motor da execucao anterior so
+avanca os pregoes novos, e a passada em lote so e refeita se o historico mudou.
+
+Indicadores (nomes usados no indicadores.csv):
+    smaN, emaN     media simples e exponencial de N pregoes
+    rsiN           RSI com a suavizacao de Wilder (padrao 14)
+    macd           MACD 12/26 com linha de sinal de 9
+    atrN           ATR de Wilder (padrao 14) a partir de maxima/minima/fechamento
+    bollingerN     bandas de Bollinger de N pregoes e 2 desvios (padrao 20)
+
+As EMAs comecam no primeiro valor da serie (como pandas ewm(adjust=False)) e so
+viram indicador depois de N pregoes.
+"""
+
+import re
+import abc
+import copy
+
+import numpy as np
+
+import cruzamentos
+from cache_precos import Fechamentos
+
+REGISTRO = {}
+
+
+# ---------------------------------------------------------------- nos intermediarios
+
+class No(abc.ABC):
+    """No do grafo de calculo: `lote` calcula a matriz inteira, `passo` um pregao por ativo.
+
+    `chave` identifica o no: dois indicadores que pedem a mesma chave compartilham o calculo.
+    """
+    fontes = ()
+
+    @abc.abstractmethod
+    def lote(self, entradas):
+        """Matriz (ativos x pregoes) do no a partir das matrizes das fontes"""
+
+    def iniciar(self, entradas, saida):
+        """Estado no ultimo pregao da passada em lote"""
+        return None
+
+    @abc.abstractmethod
+    def passo(self, estado, entradas, linhas):
+        """Valor do novo pregao para as `linhas` (ativos) informadas, atualizando o estado"""
+
+
+class Entrada:
+    """Serie bruta (close, maxima, minima) no grafo: o Motor a preenche, nao e calculada"""
+    fontes = ()
+
+    def __init__(self, nome):
+        self.chave = (nome,)
+
+
+class Anterior(No):
+    """Valor do pregao anterior da fonte"""
+
+    def __init__(self, fonte):
+        self.chave = ("anterior", fonte)
+        self.fontes = (fonte,)
+
+    def lote(self, entradas):
+        x = entradas[0]
+        saida = np.full_like(x, np.nan)
+        saida[:, 1:] = x[:, :-1]
+        return saida
+
+    def iniciar(self, entradas, saida):
+        return entradas[0][:, -1].copy()
+
+    def passo(self, estado, entradas, linhas):
+        saida = estado[linhas].copy()
+        estado[linhas] = entradas[0]
+        return saida
+
+
+class Funcao(No):
+    """No sem estado: combinacao ponto a ponto das fontes (vale para matriz e para um pregao)"""
+
+    def __init__(self, nome, funcao, *fontes):
+        self.chave = (nome,) + fontes
+        self.funcao = funcao
+        self.fontes = fontes
+
+    def lote(self, entradas):
+        with np.errstate(invalid="ignore"):
+            return self.funcao(*entradas)
+
+    def passo(self, estado, entradas, linhas):
+        with np.errstate(invalid="ignore"):
+            return self.funcao(*entradas)
+
+
+class Media(No):
+    """Media movel simples de `n` pregoes (NaN ate completar a janela)"""
+
+    def __init__(self, fonte, n):
+        self.chave = ("media", fonte, n)
+        self.fontes = (fonte,)
+        self.n = n
+
+    def lote(self, entradas):
+        x = entradas[0]
+        validos = ~np.isnan(x)
+        acumulado = np.cumsum(np.where(validos, x, 0.0), axis=1)
+        contagem = np.cumsum(validos, axis=1)
+        soma = acumulado.copy()
+        soma[:, self.n:] -= acumulado[:, :-self.n]
+        quantos = contagem.copy()
+        quantos[:, self.n:] -= contagem[:, :-self.n]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(quantos == self.n, soma / self.n, np.nan)
+
+    def iniciar(self, entradas, saida):
+        x = entradas[0]
+        janela = np.full((x.shape[0], self.n), np.nan)
+        ultimos = x[:, -self.n:]
+        janela[:, self.n - ultimos.shape[1]:] = ultimos
+        # Janela circular: a posicao 0 e a mais antiga
+        return {"janela": janela, "posicao": np.zeros(x.shape[0], dtype=np.int64),
+                "soma": np.nansum(janela, axis=1), "quantos": np.sum(~np.isnan(janela), axis=1)}
+
+    def passo(self, estado, entradas, linhas):
+        x = entradas[0]
+        posicao = estado["posicao"][linhas]
+        antigo = estado["janela"][linhas, posicao]
+        antigo_valido = ~np.isnan(antigo)
+        novo_valido = ~np.isnan(x)
+        estado["soma"][linhas] += np.where(novo_valido, x, 0.0) - np.where(antigo_valido, antigo, 0.0)
+        estado["quantos"][linhas] += novo_valido.astype(np.int64) - antigo_valido
+        estado["janela"][linhas, posicao] = x
+        estado["posicao"][linhas] = (posicao + 1) % self.n
+        quantos = estado["quantos"][linhas]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(quantos == self.n, estado["soma"][linhas] / self.n, np.nan)
+
+
+class EMA(No):
+    """Media exponencial com fator `alfa`, iniciada no primeiro valor; NaN nos primeiros `n` pregoes"""
+
+    def __init__(self, fonte, alfa, n):
+        self.chave = ("ema", fonte, alfa, n)
+        self.fontes = (fonte,)
+        self.alfa = alfa
+        self.n = n
+
+    def _avancar(self, media, quantos, x):
+        valido = ~np.isnan(x)
+        media = np.where(valido, np.where(np.isnan(media), x, media + self.alfa * (x - media)), media)
+        quantos = quantos + valido
+        return media, quantos
+
+    def lote(self, entradas):
+        x = entradas[0]
+        saida = np.full_like(x, np.nan)
+        media = np.full(x.shape[0], np.nan)
+        quantos = np.zeros(x.shape[0], dtype=np.int64)
+        # Recorrencia ao longo dos pregoes, vetorizada entre os ativos
+        for t in range(x.shape[1]):
+            media, quantos = self._avancar(media, quantos, x[:, t])
+            saida[:, t] = np.where(quantos >= self.n, media, np.nan)
+        self._final = (media, quantos)
+        return saida
+
+    def iniciar(self, entradas, saida):
+        media, quantos = self._final
+        del self._final
+        return {"media": media.copy(), "quantos": quantos.copy()}
+
+    def passo(self, estado, entradas, linhas):
+        media, quantos = self._avancar(estado["media"][linhas], estado["quantos"][linhas], entradas[0])
+        estado["media"][linhas] = media
+        estado["quantos"][linhas] = quantos
+        return np.where(quantos >= self.n, media, np.nan)
+
+
+def _ganho(close, anterior):
+    return np.maximum(close - anterior, 0.0)
+
+
+def _perda(close, anterior):
+    return np.maximum(anterior - close, 0.0)
+
+
+def _true_range(maxima, minima, anterior):
+    # fmax/fmin ignoram o NaN do primeiro pregao (sem fechamento anterior)
+    return np.fmax(maxima, anterior) - np.fmin(minima, anterior)
+
+
+def _diferenca(a, b):
+    return a - b
+
+
+def _quadrado(x):
+    return x * x
+
+
+def _desvio(media, media_quadrados):
+    return np.sqrt(np.maximum(media_quadrados - media * media, 0.0))
+
+
+# ---------------------------------------------------------------- indicadores
+
+def registrar(classe):
+    REGISTRO[classe.familia] = classe
+    return classe
+
+
+def _ema(fonte, n):
+    return EMA(fonte, 2.0 / (n + 1), n)
+
+
+def _wilder(fonte, n):
+    return EMA(fonte, 1.0 / n, n)
+
+
+class Indicador(abc.ABC):
+    """Indicador do registro: declara os nos (`nos`) e combina os valores deles (`combinar`).
+
+    `combinar` so usa operacoes ponto a ponto, entao serve tanto para as matrizes da
+    passada em lote quanto para os vetores de um pregao em Motor.avancar.
+    """
+    familia = None
+    padrao = None
+
+    def __init__(self, n=None):
+        self.n = n or self.padrao
+        self.janela = self.n
+
+    @property
+    def nome(self):
+        return "%s%d" % (self.familia.upper(), self.n)
+
+    def colunas(self):
+        return [self.nome]
+
+    @abc.abstractmethod
+    def nos(self):
+        """Nos do grafo de que o indicador precisa"""
+
+    @abc.abstractmethod
+    def combinar(self, valores):
+        """{coluna: valores} a partir de {chave do no: valores}"""
+
+
+@registrar
+class SMA(Indicador):
+    familia = "sma"
+    padrao = 20
+
+    def nos(self):
+        return [Media(("close",), self.n)]
+
+    def combinar(self, valores):
+        return {self.nome: valores[self.nos()[0].chave]}
+
+
+@registrar
+class EMAIndicador(Indicador):
+    familia = "ema"
+    padrao = 20
+
+    def nos(self):
+        return [_ema(("close",), self.n)]
+
+    def combinar(self, valores):
+        return {self.nome: valores[self.nos()[0].chave]}
+
+
+@registrar
+class RSI(Indicador):
+    familia = "rsi"
+    padrao = 14
+
+    def nos(self):
+        anterior = Anterior(("close",))
+        ganho = Funcao("ganho", _ganho, ("close",), anterior.chave)
+        perda = Funcao("perda", _perda, ("close",), anterior.chave)
+        return [anterior, ganho, perda, _wilder(ganho.chave, self.n), _wilder(perda.chave, self.n)]
+
+    def combinar(self, valores):
+        _, _, _, ganho, perda = (valores[no.chave] for no in self.nos())
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsi = np.where(perda == 0, 100.0, 100.0 - 100.0 / (1.0 + ganho / perda))
+        return {self.nome: np.where(np.isnan(ganho) | np.isnan(perda), np.nan, rsi)}
+
+
+@registrar
+class MACD(Indicador):
+    familia = "macd"
+    padrao = 12
+    LONGA = 26
+    SINAL = 9
+
+    def __init__(self, n=None):
+        super().__init__(n)
+        self.janela = self.LONGA + self.SINAL
+
+    @property
+    def nome(self):
+        return "MACD" if self.n == self.padrao else "MACD%d" % self.n
+
+    def colunas(self):
+        return [self.nome, self.nome + " Sinal", self.nome + " Hist"]
+
+    def nos(self):
+        curta, longa = _ema(("close",), self.n), _ema(("close",), self.LONGA)
+        linha = Funcao("diferenca", _diferenca, curta.chave, longa.chave)
+        return [curta, longa, linha, _ema(linha.chave, self.SINAL)]
+
+    def combinar(self, valores):
+        _, _, linha, sinal = (valores[no.chave] for no in self.nos())
+        return {self.nome: linha, self.nome + " Sinal": sinal, self.nome + " Hist": linha - sinal}
+
+
+@registrar
+class ATR(Indicador):
+    familia = "atr"
+    padrao = 14
+
+    def nos(self):
+        anterior = Anterior(("close",))
+        tr = Funcao("true_range", _true_range, ("maxima",), ("minima",), anterior.chave)
+        return [anterior, tr, _wilder(tr.chave, self.n)]
+
+    def combinar(self, valores):
+        return {self.nome: valores[self.nos()[-1].chave]}
+
+
+@registrar
+class Bollinger(Indicador):
+    familia = "bollinger"
+    padrao = 20
+    DESVIOS = 2.0
+
+    @property
+    def nome(self):
+        return "BB%d" % self.n
+
+    def colunas(self):
+        return [self.nome + " Sup", self.nome + " Inf"]
+
+    def nos(self):
+        quadrado = Funcao("quadrado", _quadrado, ("close",))
+        media = Media(("close",), self.n)
+        media_quadrados = Media(quadrado.chave, self.n)
+        return [quadrado, media, media_quadrados,
+                Funcao("desvio", _desvio, media.chave, media_quadrados.chave)]
+
+    def combinar(self, valores):
+        _, media, _, desvio = (valores[no.chave] for no in self.nos())
+        return {self.nome + " Sup": media + self.DESVIOS * desvio, self.nome + " Inf": media - self.DESVIOS * desvio}
+
+
+def criar(especificacao):
+    """Indicador a partir do nome no indicadores.csv ('rsi14', 'macd', 'bollinger20'...)"""
+    m = re.fullmatch(r"([a-z]+)(\d*)", especificacao.strip().lower())
+    if not m or m.group(1) not in REGISTRO:
+        raise ValueError("indicador desconhecido: %s (use %s)" % (especificacao, ", ".join(sorted(REGISTRO))))
+    n = int(m.group(2)) if m.group(2) else None
+    if n is not None and n < 1:
+        raise ValueError("janela invalida em " + especificacao)
+    return REGISTRO[m.group(1)](n)
+
+
+# ---------------------------------------------------------------- motor
+
+class Motor:
+    """Calcula um conjunto de indicadores para varios ativos de uma vez.
+
+    calcular: passada em lote sobre matrizes (ativos x pregoes) alinhadas pela direita;
+    avancar: um pregao novo por ativo, O(1), a partir do estado deixado por calcular.
+    """
+
+    def __init__(self, indicadores):
+        self.indicadores = list({ind.nome: ind for ind in indicadores}.values())
+        self.nos = {}
+        for indicador in self.indicadores:
+            for no in indicador.nos():
+                self._incluir(no)
+        self.ativos = []
+        self.estados = {}
+        # {ativo: (primeira data, data e fechamento do ultimo pregao consumido)}, preenchido por atualizar
+        self.consumidos = {}
+
+    def copiar(self):
+        """Motor independente com o mesmo estado (os nos sao compartilhados, os estados copiados)"""
+        copia = Motor.__new__(Motor)
+        copia.__dict__.update(self.__dict__)
+        copia.ativos = list(self.ativos)
+        copia.estados = copy.deepcopy(self.estados)
+        copia.consumidos = dict(self.consumidos)
+        return copia
+
+    def _incluir(self, no):
+        if no.chave in self.nos:
+            return
+        for fonte in no.fontes:
+            if fonte not in self.nos:
+                self._incluir(Entrada(fonte[0]))
+        # Os nos entram depois das suas fontes: a ordem do dicionario e a ordem de calculo
+        self.nos[no.chave] = no
+
+    def _entradas(self, close, maxima, minima):
+        # Sem maxima/minima (fonte so com fechamentos) o true range vira a variacao do fechamento
+        return {("close",): close,
+                ("maxima",): close if maxima is None else maxima,
+                ("minima",): close if minima is None else minima}
+
+    def _saida(self, valores):
+        saida = {}
+        for indicador in self.indicadores:
+            saida.update(indicador.combinar(valores))
+        return saida
+
+    def calcular(self, ativos, close, maxima=None, minima=None, completo=True):
+        """{coluna: matriz (ativos x pregoes)} de todos os indicadores; guarda o estado final.
+
+        Com completo=False cada no so mantem a ultima coluna depois que todos os que dependem
+        dele foram calculados, e a saida tem uma coluna so: a memoria fica em poucas matrizes
+        mesmo com muitos indicadores.
+        """
+        self.ativos = list(ativos)
+        valores = self._entradas(close, maxima, minima)
+        pendentes = {chave: 0 for chave in self.nos}
+        for no in self.nos.values():
+            for fonte in no.fontes:
+                pendentes[fonte] += 1
+        self.estados = {}
+        for chave, no in self.nos.items():
+            if isinstance(no, Entrada):
+                continue
+            entradas = [valores[fonte] for fonte in no.fontes]
+            valores[chave] = no.lote(entradas)
+            self.estados[chave] = no.iniciar(entradas, valores[chave])
+            if completo:
+                continue
+            for fonte in no.fontes:
+                pendentes[fonte] -= 1
+            for usado in no.fontes + (chave,):
+                if pendentes[usado] == 0:
+                    valores[usado] = valores[usado][:, -1:]
+        return self._saida(valores)
+
+    def avancar(self, barras):
+        """Acrescenta um pregao: {ativo: (fechamento, maxima, minima)} -> {ativo: {coluna: valor}}"""
+        posicao = {ativo: i for i, ativo in enumerate(self.ativos)}
+        nomes = [ativo for ativo in barras if ativo in posicao]
+        linhas = np.array([posicao[ativo] for ativo in nomes], dtype=np.int64)
+        close = np.array([barras[ativo][0] for ativo in nomes], dtype=np.float64)
+        maxima = np.array([barras[ativo][1] for ativo in nomes], dtype=np.float64)
+        minima = np.array([barras[ativo][2] for ativo in nomes], dtype=np.float64)
+        valores = self._entradas(close, maxima, minima)
+        for chave, no in self.nos.items():
+            if isinstance(no, Entrada):
+                continue
+            valores[chave] = no.passo(self.estados[chave], [valores[fonte] for fonte in no.fontes], linhas)
+        saida = self._saida(valores)
+        return {ativo: {coluna: _valor(vetor[i]) for coluna, vetor in saida.items()}
+                for i, ativo in enumerate(nomes)}
+
+    def ultimos(self, saida):
+        """{ativo: {coluna: valor}} com o ultimo pregao de cada ativo de uma saida de calcular"""
+        return {ativo: {coluna: _valor(matriz[i, -1]) for coluna, matriz in saida.items()}
+                for i, ativo in enumerate(self.ativos)}
+
+
+def _valor(x):
+    return None if np.isnan(x) else round(float(x), 2)
+
+
+def calcular(series, lista):
+    """Valor atual de cada indicador: {ativo: cache_precos.Fechamentos} -> (Motor, {ativo: {coluna: valor}})"""
+    ativos, _, close = cruzamentos.montar_matriz({ativo: (serie.datas, serie.closes) for ativo, serie in series.items()})
+    extremos = [cruzamentos.montar_matriz({
+        ativo: (serie.datas, serie.closes if getattr(serie, campo) is None else getattr(serie, campo))
+        for ativo, serie in series.items()})[2] for campo in ("maximas", "minimas")]
+    motor = Motor(lista)
+    return motor, motor.ultimos(motor.calcular(ativos, close, *extremos, completo=False))
+
+
+def _barra(serie, i):
+    """(fechamento, maxima, minima) do pregao `i` da serie, no formato de Motor.avancar"""
+    return (serie.closes[i], serie.closes[i] if serie.maximas is None else serie.maximas[i],
+            serie.closes[i] if serie.minimas is None else serie.minimas[i])
+
+
+def _retomar(anterior, series, lista):
+    """{ativo: primeiro pregao que o motor `anterior` ainda nao consumiu}, ou None se o estado nao serve"""
+    if anterior is None or {ind.nome for ind in anterior.indicadores} != {ind.nome for ind in lista}:
+        return None
+    if set(anterior.ativos) != set(series) or set(anterior.consumidos) != set(series):
+        return None
+    inicios = {}
+    for ativo, serie in series.items():
+        primeira, ultima, close = anterior.consumidos[ativo]
+        i = int(np.searchsorted(serie.datas, ultima))
+        # O historico consumido tem de continuar igual: mesmo inicio e mesmo fechamento no ultimo pregao
+        if serie.datas[0] != primeira or i >= len(serie.datas) - 1 or serie.datas[i] != ultima or serie.closes[i] != close:
+            return None
+        inicios[ativo] = i + 1
+    return inicios
+
+
+def atualizar(series, lista, anterior=None):
+    """Como calcular, mas reaproveitando o Motor `anterior` (de uma chamada anterior de atualizar).
+
+    O motor devolvido guarda o estado ate o penultimo pregao de cada ativo, porque o ultimo
+    pode estar em aberto. Se `anterior` tem os mesmos indicadores e ativos e o historico que
+    consumiu nao mudou, so os pregoes fechados desde entao passam por Motor.avancar; senao a
+    passada em lote e refeita. `anterior` nao e alterado. Retorna (motor, {ativo: {coluna: valor}}).
+    """
+    series = {ativo: serie for ativo, serie in series.items() if len(serie.closes) >= 2}
+    if not series:
+        return Motor(lista), {}
+    inicios = _retomar(anterior, series, lista)
+    if inicios is None:
+        motor, _ = calcular({ativo: Fechamentos(*(None if campo is None else campo[:-1] for campo in serie))
+                             for ativo, serie in series.items()}, lista)
+    else:
+        motor = anterior.copiar()
+        fins = {ativo: len(serie.closes) - 1 for ativo, serie in series.items()}
+        for passo in range(max(fins[ativo] - inicios[ativo] for ativo in series)):
+            motor.avancar({ativo: _barra(serie, inicios[ativo] + passo) for ativo, serie in series.items()
+                           if inicios[ativo] + passo < fins[ativo]})
+    motor.consumidos = {ativo: (serie.datas[0], serie.datas[-2], serie.closes[-2]) for ativo, serie in series.items()}
+    return motor, motor.copiar().avancar({ativo: _barra(serie, -1) for ativo, serie in series.items()})
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Sinais intradiarios (python monitor.py --intradiario)
+Baixa barras de 15 minutos dos ativos com mercado aberto e as agrega em
+streaming, barra a barra:
+    - em barras de 60 minutos, com SMA17/SMA72 proprias (sinal intradiario);
+    - no pregao do dia em andamento, cujo fechamento parcial entra no calculo
+      diario e pode marcar um cruzamento provisorio (veja monitor.processar_ativo).
+
+Cada ativo guarda apenas a barra em formacao e as janelas de tamanho fixo das
+medias (estado_sma.JanelaMovel), entao a memoria nao cresce com o tempo de
+execucao no modo servico.
+"""
+
+import math
+
+import monitor
+import estado_sma
+
+INTERVALO_BASE = "15m"
+MINUTOS_TIMEFRAME = 60
+# Historico da primeira busca de um ativo (aquecimento da SMA72 de 60 min, cerca de
+# 10 pregoes da B3) e das buscas seguintes, que so precisam cobrir o intervalo
+PERIODO_INICIAL = "1mo"
+PERIODO_INCREMENTAL = "5d"
+
+
+class Agregador:
+    """Agrega as barras intradiarias de um ativo em barras de `minutos` e no pregao do dia"""
+
+    def __init__(self, minutos=MINUTOS_TIMEFRAME):
+        self.minutos = minutos
+        self.estado = estado_sma.EstadoSMA()
+        self.parcial = None   # [inicio, abertura, maxima, minima, fechamento] da barra em formacao
+        self.ultimo = None    # horario local ('AAAA-MM-DDTHH:MM') da ultima barra base consumida
+        self.dia = None       # (data ISO, fechamento) do pregao mais recente
+
+    def _inicio(self, momento):
+        """Inicio da barra de `minutos` que contem `momento` (horario local ISO)"""
+        minuto = int(momento[11:13]) * 60 + int(momento[14:16])
+        minuto -= minuto % self.minutos
+        return "%sT%02d:%02d" % (momento[:10], minuto // 60, minuto % 60)
+
+    def adicionar(self, momento, abertura, maxima, minima, fechamento):
+        """Consome uma barra base. Barras anteriores a ultima sao ignoradas; a ultima pode ser
+        repetida (ainda estava em formacao no download anterior) e so atualiza a barra atual."""
+        if self.ultimo is not None and momento < self.ultimo:
+            return
+        inicio = self._inicio(momento)
+        if self.parcial is not None and inicio != self.parcial[0]:
+            # Barra de `minutos` completa: entra nas medias
+            self.estado.atualizar(self.parcial[0], self.parcial[4])
+            self.parcial = None
+        if self.parcial is None:
+            self.parcial = [inicio, abertura, maxima, minima, fechamento]
+        else:
+            self.parcial[2] = max(self.parcial[2], maxima)
+            self.parcial[3] = min(self.parcial[3], minima)
+            self.parcial[4] = fechamento
+        self.ultimo = momento
+        self.dia = (momento[:10], fechamento)
+
+    def atual(self):
+        """Estado das medias incluindo a barra em formacao"""
+        atual = self.estado.copiar()
+        if self.parcial is not None:
+            atual.atualizar(self.parcial[0], self.parcial[4])
+        return atual
+
+
+def _valor(x):
+    return None if x is None or math.isnan(x) else round(x, 2)
+
+
+def atualizar(ativos, agregadores):
+    """Baixa as barras de INTERVALO_BASE dos ativos e alimenta os agregadores (criados quando faltam).
+
+    Retorna {ativo: (data ISO, fechamento)} com o pregao em andamento de cada ativo atualizado.
+    """
+    grupos = {}
+    for ativo in ativos:
+        periodo = PERIODO_INCREMENTAL if ativo in agregadores else PERIODO_INICIAL
+        grupos.setdefault(periodo, []).append(ativo)
+
+    parciais = {}
+    for periodo, grupo in grupos.items():
+        dados = monitor.baixar_precos(grupo, periodo=periodo, intervalo=INTERVALO_BASE)
+        for ativo, df in dados.items():
+            agregador = agregadores.setdefault(ativo, Agregador())
+            momentos = df.index.strftime('%Y-%m-%dT%H:%M')
+            colunas = zip(momentos, df['Open'].tolist(), df['High'].tolist(), df['Low'].tolist(), df['Close'].tolist())
+            for momento, abertura, maxima, minima, fechamento in colunas:
+                agregador.adicionar(momento, abertura, maxima, minima, fechamento)
+            if agregador.dia is not None:
+                parciais[ativo] = agregador.dia
+    return parciais
+
+
+def resumo(agregadores, ativos):
+    """Sinal intradiario de cada ativo, no formato de relatorio["intradiario"]"""
+    saida = {}
+    for ativo in ativos:
+        agregador = agregadores.get(ativo)
+        if agregador is None or agregador.parcial is None:
+            continue
+        atual = agregador.atual()
+        sma17, sma72 = atual.valores()
+        if math.isnan(sma17) or math.isnan(sma72):
+            sinal = "N/A"
+        else:
+            sinal = "COMPRA" if sma17 > sma72 else ("VENDA" if sma17 < sma72 else "NEUTRO")
+        saida[ativo] = {
+            "timeframe": "%dm" % agregador.minutos,
+            "barra": agregador.parcial[0],
+            "fechamento": _valor(agregador.parcial[4]),
+            "sma17": _valor(sma17),
+            "sma72": _valor(sma72),
+            "sinal": sinal,
+            "ultimo_cruzamento": atual.ultimo_cruzamento,
+        }
+    return saida
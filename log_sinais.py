@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Log de sinais (data/log-sinais.sqlite)
+Cada execucao que grava o relatorio acrescenta uma linha por ativo com o
+fechamento, SMA17, SMA72 e o sinal naquele momento. As linhas nunca sao
+alteradas; a compactacao so apaga as fotos intermediarias de pregoes antigos,
+mantendo a ultima de cada pregao (o fechamento do dia).
+
+Consultas pela linha de comando:
+    python log_sinais.py viradas --carteira "Carteira Ações" --de COMPRA --para VENDA --dias 90
+    python log_sinais.py historico PETR3.SA --dias 30
+    python log_sinais.py compactar
+"""
+
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import datetime, timedelta, timezone
+
+ARQUIVO = os.path.join("data", "log-sinais.sqlite")
+# Pregoes mais antigos que isto ficam com uma unica foto (a ultima do dia)
+DIAS_INTRADIARIOS = 7
+SINAIS = {"COMPRA": 1, "VENDA": -1, "NEUTRO": 0}
+NOMES = {valor: nome for nome, valor in SINAIS.items()}
+BRT = timezone(timedelta(hours=-3))
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS sinais (
+    ativo       TEXT    NOT NULL,
+    momento     INTEGER NOT NULL,  -- execucao, em segundos desde 1970 (UTC)
+    pregao      TEXT    NOT NULL,  -- ultimo pregao do ativo nessa execucao (AAAA-MM-DD)
+    fechamento  REAL,
+    sma17       REAL,
+    sma72       REAL,
+    sinal       INTEGER NOT NULL,  -- 1 COMPRA, -1 VENDA, 0 NEUTRO
+    provisorio  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sinais_ativo_momento ON sinais (ativo, momento);
+CREATE INDEX IF NOT EXISTS sinais_momento ON sinais (momento);
+"""
+
+
+def conectar(caminho=ARQUIVO):
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    conexao = sqlite3.connect(caminho)
+    conexao.executescript(ESQUEMA)
+    return conexao
+
+
+def _epoca(iso):
+    return int(datetime.fromisoformat(iso).timestamp())
+
+
+def _iso(epoca):
+    return datetime.fromtimestamp(epoca, BRT).isoformat()
+
+
+def linhas_do_relatorio(relatorio):
+    """Uma linha por ativo (mesmo que esteja em varias carteiras) para a tabela sinais"""
+    momento = _epoca(relatorio["timestamp"])
+    historico = relatorio.get("historico", {})
+    linhas = {}
+    for itens in relatorio.get("carteiras", {}).values():
+        for item in itens:
+            ativo = item["Ativo"]
+            datas = historico.get(ativo, {}).get("datas")
+            if ativo in linhas or not datas:
+                continue
+            linhas[ativo] = (ativo, momento, datas[-1], item["Fechamento"], item["SMA17"], item["SMA72"],
+                             SINAIS.get(item["Sinal"], 0), int(bool(item.get("Cruzamento Provisório"))))
+    return list(linhas.values())
+
+
+def compactar(conexao, hoje=None, dias=DIAS_INTRADIARIOS):
+    """Mantem so a ultima foto de cada (ativo, pregao) anterior a `dias` atras. Retorna quantas linhas sairam"""
+    hoje = hoje or datetime.now(BRT).date()
+    limite = (hoje - timedelta(days=dias)).isoformat()
+    cursor = conexao.execute("""
+        DELETE FROM sinais WHERE pregao < :limite AND rowid NOT IN (
+            SELECT rowid FROM (
+                SELECT rowid, ROW_NUMBER() OVER (PARTITION BY ativo, pregao ORDER BY momento DESC) AS n
+                FROM sinais WHERE pregao < :limite
+            ) WHERE n = 1
+        )""", {"limite": limite})
+    return cursor.rowcount
+
+
+def registrar(relatorio, caminho=ARQUIVO):
+    """Acrescenta as linhas do relatorio e compacta os pregoes antigos, em uma unica transacao"""
+    linhas = linhas_do_relatorio(relatorio)
+    conexao = conectar(caminho)
+    try:
+        with conexao:
+            conexao.executemany("INSERT INTO sinais VALUES (?, ?, ?, ?, ?, ?, ?, ?)", linhas)
+            compactar(conexao, datetime.fromisoformat(relatorio["timestamp"]).date())
+    finally:
+        conexao.close()
+    return len(linhas)
+
+
+def viradas(ativos, de="COMPRA", para="VENDA", dias=90, caminho=ARQUIVO, agora=None):
+    """Mudancas de sinal `de` -> `para` dos `ativos` nos ultimos `dias`, em ordem cronologica.
+
+    Fotos NEUTRO sao ignoradas (o sinal anterior vale ate ser invertido), com a mesma
+    regra de cruzamentos.detectar.
+    """
+    desde = int((agora or datetime.now(BRT)).timestamp()) - dias * 86400
+    marcas = ",".join("?" * len(ativos))
+    conexao = conectar(caminho)
+    try:
+        cursor = conexao.execute("""
+            SELECT ativo, momento, pregao, fechamento, sma17, sma72, provisorio FROM (
+                SELECT *, LAG(sinal) OVER (PARTITION BY ativo ORDER BY momento) AS anterior
+                FROM sinais WHERE ativo IN (%s) AND sinal != 0
+            ) WHERE anterior = ? AND sinal = ? AND momento >= ?
+            ORDER BY momento""" % marcas, list(ativos) + [SINAIS[de], SINAIS[para], desde])
+        return [{"ativo": ativo, "momento": _iso(momento), "pregao": pregao, "fechamento": fechamento,
+                 "sma17": sma17, "sma72": sma72, "provisorio": bool(provisorio)}
+                for ativo, momento, pregao, fechamento, sma17, sma72, provisorio in cursor]
+    finally:
+        conexao.close()
+
+
+def historico(ativo, dias=30, caminho=ARQUIVO, agora=None):
+    """Fotos de um ativo nos ultimos `dias`, em ordem cronologica"""
+    desde = int((agora or datetime.now(BRT)).timestamp()) - dias * 86400
+    conexao = conectar(caminho)
+    try:
+        cursor = conexao.execute(
+            "SELECT momento, pregao, fechamento, sma17, sma72, sinal, provisorio FROM sinais "
+            "WHERE ativo = ? AND momento >= ? ORDER BY momento", (ativo, desde))
+        return [{"momento": _iso(momento), "pregao": pregao, "fechamento": fechamento, "sma17": sma17,
+                 "sma72": sma72, "sinal": NOMES[sinal], "provisorio": bool(provisorio)}
+                for momento, pregao, fechamento, sma17, sma72, sinal, provisorio in cursor]
+    finally:
+        conexao.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="VIGILANTE - Consultas ao log de sinais")
+    parser.add_argument("--arquivo", default=ARQUIVO)
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("viradas", help="mudancas de sinal em uma carteira (ou em todas)")
+    p.add_argument("--carteira", help="nome da carteira (padrao: todas)")
+    p.add_argument("--de", default="COMPRA", choices=["COMPRA", "VENDA"])
+    p.add_argument("--para", default="VENDA", choices=["COMPRA", "VENDA"])
+    p.add_argument("--dias", type=int, default=90)
+    p = sub.add_parser("historico", help="fotos de um ativo")
+    p.add_argument("ativo")
+    p.add_argument("--dias", type=int, default=30)
+    sub.add_parser("compactar", help="consolida as fotos de pregoes antigos")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        if args.comando == "viradas":
+            import monitor
+            if args.carteira:
+                if args.carteira not in monitor.CARTEIRAS:
+                    print("[ERRO] Carteira desconhecida: " + args.carteira)
+                    return 1
+                ativos = monitor.CARTEIRAS[args.carteira]
+            else:
+                ativos = monitor.universo()
+            for v in viradas(ativos, args.de, args.para, args.dias, args.arquivo):
+                print("%s  %-10s %s -> %s  pregao %s  %.2f%s" % (v["momento"][:16], v["ativo"], args.de, args.para,
+                      v["pregao"], v["fechamento"], "  (provisorio)" if v["provisorio"] else ""))
+        elif args.comando == "historico":
+            for f in historico(args.ativo, args.dias, args.arquivo):
+                print("%s  pregao %s  %10.2f  SMA17 %10.2f  SMA72 %10.2f  %s" % (f["momento"][:16], f["pregao"],
+                      f["fechamento"], f["sma17"], f["sma72"], f["sinal"]))
+        else:
+            conexao = conectar(args.arquivo)
+            with conexao:
+                removidas = compactar(conexao)
+            conexao.execute("VACUUM")
+            conexao.close()
+            print("[OK] Compactacao: %d fotos removidas" % removidas)
+        return 0
+    except Exception as e:
+        print("[ERRO FATAL]:", str(e))
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
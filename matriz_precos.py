@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Matriz de precos compartilhada
+Fechamentos diarios de todo o universo em um unico arquivo mapeado em memoria, para o
+monitor, o backtest, a varredura e jobs de pesquisa lerem o mesmo historico sem baixar
+de novo nem montar DataFrames:
+
+    data/matriz/indice.json         versao, arquivo da matriz, ativos (colunas) e datas (linhas)
+    data/matriz/precos-<n>.f64      float64 cru, um pregao por linha e um ativo por coluna
+
+O calendario e a uniao dos calendarios dos ativos (BTC-USD todos os dias, B3 dias uteis);
+ativo sem pregao na data fica NaN. abrir devolve a matriz ativos x pregoes como vista
+transposta de um np.memmap somente leitura: varios processos leem o mesmo arquivo pelo
+cache de paginas do sistema operacional, sem copia e sem duplicar a matriz na memoria.
+
+Escrita (atualizar; escritores concorrentes se revezam por uma trava de arquivo):
+- pregoes novos sao acrescentados ao fim do arquivo e so depois o indice e trocado
+  (temporario + os.replace): quem leu o indice antigo mapeia so as linhas que conhece;
+- celulas de pregoes ja gravados que mudaram (ultimo pregao gravado com o mercado aberto,
+  reajuste do historico) sao regravadas no lugar, e pregoes que sumiram da serie voltam a NaN;
+- ativo novo ou historico anterior a primeira data geram um arquivo novo (<n> seguinte),
+  publicado pelo indice; quem ja mapeou o anterior continua lendo o anterior.
+
+Uso: python matriz_precos.py [--cache] [--diretorio DIR]
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+import cache_precos
+from cache_precos import Fechamentos
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+DIR_MATRIZ = os.path.join("data", "matriz")
+INDICE = "indice.json"
+TRAVA = ".trava"
+
+
+def _ler_indice(diretorio):
+    try:
+        with open(os.path.join(diretorio, INDICE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_indice(diretorio, indice):
+    temporario = os.path.join(diretorio, INDICE + ".tmp")
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(indice, f, separators=(",", ":"))
+    os.replace(temporario, os.path.join(diretorio, INDICE))
+
+
+def _mapear(caminho, dias, colunas, modo="r"):
+    """np.memmap (pregoes x ativos) das `dias` primeiras linhas do arquivo"""
+    if dias == 0 or colunas == 0:
+        return np.empty((dias, colunas))
+    return np.memmap(caminho, dtype=np.float64, mode=modo, shape=(dias, colunas))
+
+
+class Matriz:
+    """Matriz de precos aberta: `precos` (ativos x pregoes) e vista do arquivo mapeado"""
+
+    def __init__(self, indice, diretorio):
+        self.versao = indice["versao"]
+        self.ativos = indice["ativos"]
+        self.datas = np.array(indice["datas"], dtype="datetime64[D]")
+        self.posicao = {ativo: i for i, ativo in enumerate(self.ativos)}
+        self.precos = _mapear(os.path.join(diretorio, indice["arquivo"]), len(self.datas), len(self.ativos)).T
+
+    def linha(self, ativo):
+        """Fechamentos do ativo em todas as datas da matriz (vista, NaN onde nao houve pregao)"""
+        return self.precos[self.posicao[ativo]]
+
+    def fechamentos(self, ativo, desde=None):
+        """Fechamentos (cache_precos.Fechamentos) so dos pregoes do ativo, a partir de `desde`"""
+        inicio = 0 if desde is None else int(np.searchsorted(self.datas, np.datetime64(desde, "D")))
+        linha = self.linha(ativo)[inicio:]
+        validos = ~np.isnan(linha)
+        if validos.all():
+            return Fechamentos(self.datas[inicio:], linha)
+        return Fechamentos(self.datas[inicio:][validos], linha[validos])
+
+    def series(self, ativos=None, desde=None):
+        """{ativo: Fechamentos} dos `ativos` (padrao: todos) presentes na matriz"""
+        ativos = self.ativos if ativos is None else [ativo for ativo in ativos if ativo in self.posicao]
+        return {ativo: self.fechamentos(ativo, desde) for ativo in ativos}
+
+
+def abrir(diretorio=DIR_MATRIZ):
+    """Matriz somente leitura do `diretorio`, ou None se ainda nao existir"""
+    for _ in range(3):
+        indice = _ler_indice(diretorio)
+        if indice is None:
+            return None
+        try:
+            return Matriz(indice, diretorio)
+        except FileNotFoundError:
+            # Reconstruida entre a leitura do indice e a abertura: o indice novo ja aponta o arquivo novo
+            continue
+    return None
+
+
+def _datas(serie):
+    return np.asarray(serie.datas).astype("datetime64[D]")
+
+
+def _reconstruir(indice, series, diretorio):
+    """Novo arquivo com a uniao das datas e dos ativos antigos e de `series`"""
+    antigos = indice["ativos"] if indice else []
+    datas_antigas = np.array(indice["datas"] if indice else [], dtype="datetime64[D]")
+    ativos = antigos + [ativo for ativo in series if ativo not in antigos]
+    datas = np.unique(np.concatenate([datas_antigas] + [_datas(serie) for serie in series.values()]))
+    precos = np.full((len(datas), len(ativos)), np.nan)
+    if indice and len(datas_antigas) and antigos:
+        anterior = _mapear(os.path.join(diretorio, indice["arquivo"]), len(datas_antigas), len(antigos))
+        precos[np.searchsorted(datas, datas_antigas), :len(antigos)] = anterior
+        del anterior
+    for coluna, ativo in enumerate(ativos):
+        if ativo in series:
+            precos[np.searchsorted(datas, _datas(series[ativo])), coluna] = series[ativo].closes
+
+    versao = (indice["versao"] if indice else 0) + 1
+    arquivo = "precos-%d.f64" % versao
+    temporario = os.path.join(diretorio, arquivo + ".tmp")
+    with open(temporario, "wb") as f:
+        f.write(precos.tobytes())
+    os.replace(temporario, os.path.join(diretorio, arquivo))
+    _gravar_indice(diretorio, {"versao": versao, "arquivo": arquivo, "ativos": ativos,
+                               "datas": np.datetime_as_string(datas, unit="D").tolist()})
+    for nome in os.listdir(diretorio):
+        if nome.startswith("precos-") and nome != arquivo:
+            os.remove(os.path.join(diretorio, nome))
+    return {"acrescentados": len(datas) - len(datas_antigas), "regravados": 0, "reconstruida": True}
+
+
+def _atualizar(series, diretorio):
+    indice = _ler_indice(diretorio)
+    if indice is not None and not os.path.exists(os.path.join(diretorio, indice["arquivo"])):
+        # Arquivo da matriz perdido: recomeca so com `series`, mantendo a numeracao das versoes
+        indice = dict(indice, ativos=[], datas=[])
+    if indice is None or any(ativo not in indice["ativos"] for ativo in series):
+        return _reconstruir(indice, series, diretorio)
+    datas = np.array(indice["datas"], dtype="datetime64[D]")
+    ultima = datas[-1] if len(datas) else None
+    if ultima is None:
+        return _reconstruir(indice, series, diretorio)
+    for serie in series.values():
+        antigas = _datas(serie)[_datas(serie) <= ultima]
+        if not np.isin(antigas, datas).all():
+            return _reconstruir(indice, series, diretorio)
+
+    caminho = os.path.join(diretorio, indice["arquivo"])
+    colunas = {ativo: i for i, ativo in enumerate(indice["ativos"])}
+    n = len(colunas)
+
+    # Pregoes ja gravados: so as celulas que mudaram, direto no arquivo mapeado. Do primeiro
+    # pregao da serie ao ultimo gravado a coluna fica igual a serie: pregao que sumiu dela
+    # volta a NaN; antes do inicio da serie (historico mais longo do backtest) nada muda
+    regravados = 0
+    mapa = _mapear(caminho, len(datas), n, "r+")
+    for ativo, serie in series.items():
+        dias = _datas(serie)
+        gravados = dias <= ultima
+        inicio = int(np.searchsorted(datas, dias[0]))
+        esperado = np.full(len(datas) - inicio, np.nan)
+        esperado[np.searchsorted(datas, dias[gravados]) - inicio] = serie.closes[gravados]
+        atual = mapa[inicio:, colunas[ativo]]
+        mudou = ~((atual == esperado) | (np.isnan(atual) & np.isnan(esperado)))
+        if mudou.any():
+            mapa[inicio + np.flatnonzero(mudou), colunas[ativo]] = esperado[mudou]
+            regravados += int(mudou.sum())
+    if regravados:
+        mapa.flush()
+    del mapa
+
+    # Pregoes novos: acrescentados ao fim do arquivo antes de o indice passar a conte-los
+    novas = np.unique(np.concatenate([_datas(serie)[_datas(serie) > ultima] for serie in series.values()]))
+    if len(novas):
+        bloco = np.full((len(novas), n), np.nan)
+        for ativo, serie in series.items():
+            dias = _datas(serie)
+            depois = dias > ultima
+            bloco[np.searchsorted(novas, dias[depois]), colunas[ativo]] = serie.closes[depois]
+        with open(caminho, "r+b") as f:
+            # Sobra de uma escrita interrompida, alem do que o indice conhece, e descartada
+            f.truncate(len(datas) * n * 8)
+            f.seek(0, os.SEEK_END)
+            f.write(bloco.tobytes())
+        indice["datas"] += np.datetime_as_string(novas, unit="D").tolist()
+        indice["versao"] += 1
+        _gravar_indice(diretorio, indice)
+    return {"acrescentados": len(novas), "regravados": regravados, "reconstruida": False}
+
+
+def atualizar(series, diretorio=DIR_MATRIZ):
+    """Incorpora {ativo: Fechamentos} a matriz (criando-a se preciso).
+
+    Retorna {"acrescentados": pregoes novos, "regravados": celulas alteradas, "reconstruida": bool}.
+    """
+    series = {ativo: serie for ativo, serie in series.items() if serie is not None and len(serie.datas)}
+    os.makedirs(diretorio, exist_ok=True)
+    with open(os.path.join(diretorio, TRAVA), "w") as trava:
+        if fcntl is not None:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        if not series:
+            return {"acrescentados": 0, "regravados": 0, "reconstruida": False}
+        return _atualizar(series, diretorio)
+
+
+def atualizar_do_cache(ativos, diretorio=DIR_MATRIZ):
+    """Atualiza a matriz com os fechamentos diarios de `ativos` no cache local (data/cache/)"""
+    return atualizar({ativo: cache_precos.carregar_fechamentos(ativo) for ativo in ativos}, diretorio)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="VIGILANTE - Matriz de precos compartilhada")
+    parser.add_argument("--cache", action="store_true",
+                        help="atualiza a matriz com o cache local de precos (data/cache/) antes de resumir")
+    parser.add_argument("--diretorio", default=DIR_MATRIZ, help="diretorio da matriz (padrao: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cache:
+        import monitor
+        import cambio
+        mudancas = atualizar_do_cache(monitor.universo() + cambio.auxiliares(monitor.universo()), args.diretorio)
+        print("[OK] Matriz atualizada: %(acrescentados)d pregoes novos, %(regravados)d celulas regravadas" % mudancas)
+    matriz = abrir(args.diretorio)
+    if matriz is None:
+        print("[ERRO] Matriz inexistente em " + args.diretorio)
+        return 1
+    print("[INFO] Matriz v%d: %d ativos x %d pregoes (%s a %s)" % (
+        matriz.versao, len(matriz.ativos), len(matriz.datas),
+        matriz.datas[0] if len(matriz.datas) else "-", matriz.datas[-1] if len(matriz.datas) else "-"))
+    for ativo in matriz.ativos:
+        serie = matriz.fechamentos(ativo)
+        print("  %-12s %5d pregoes, ultimo %s" % (ativo, len(serie.datas), serie.datas[-1] if len(serie.datas) else "-"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
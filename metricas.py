@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Metricas de cada execucao
+Cada execucao do monitor (ou rodada do modo servico) tem uma Execucao que junta:
+
+    etapas_s     tempo de cada etapa (pipeline, cruzamentos, analise, html, json...)
+    contadores   ativos, ativos baixados, lotes e barras recebidas no download
+    download_s   latencia do download por ativo (a do lote em que ele veio): p50, p95, max
+    indicadores_s  tempo dos indicadores por ativo: p50, p95, max
+    lentos       os ativos mais lentos (download + indicadores)
+    bytes        tamanho do JSON, do HTML e do historico gravados
+    erros        erros por etapa (download, indicadores)
+
+No fim a execucao vira uma linha JSON em data/metrics/AAAA-MM-DD.jsonl (um arquivo
+por dia; os de mais de RETENCAO_DIAS dias sao apagados) e, com --prometheus ARQUIVO,
+tambem um arquivo no formato texto do Prometheus (para o textfile collector do
+node_exporter). No modo servico o mesmo texto sai em /metrics?formato=prometheus.
+
+Tendencia das ultimas semanas (sai com 1 se alguma etapa piorou alem da tolerancia):
+    python metricas.py tendencia [--dias 7] [--tolerancia 0.5]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+
+DIR_METRICAS = os.path.join("data", "metrics")
+RETENCAO_DIAS = 60
+LENTOS = 10
+# Etapas mais rapidas que isso nao entram na tendencia (so ruido)
+MINIMO_TENDENCIA_S = 0.05
+
+
+def _quantil(valores, q):
+    """Quantil pelo posto mais proximo (valores ja ordenados)"""
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, max(0, int(round(q * len(valores))) - 1))]
+
+
+def _distribuicao(valores):
+    valores = sorted(valores)
+    if not valores:
+        return None
+    return {"p50": round(_quantil(valores, 0.5), 4), "p95": round(_quantil(valores, 0.95), 4),
+            "max": round(valores[-1], 4)}
+
+
+class Execucao:
+    """Medicoes de uma execucao; os metodos podem ser chamados das threads do pipeline"""
+
+    def __init__(self, comando="completo", momento=None):
+        self.momento = momento or datetime.now(timezone.utc)
+        self.comando = comando
+        self.inicio = time.perf_counter()
+        self.etapas = {}
+        self.contadores = {}
+        self.ativos = {}
+        self.bytes = {}
+        self.erros = {}
+        self.status = None
+        self.trava = threading.Lock()
+
+    @contextmanager
+    def etapa(self, nome):
+        """Soma o tempo do bloco na etapa `nome` (uma etapa pode rodar mais de uma vez)"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.trava:
+                self.etapas[nome] = self.etapas.get(nome, 0.0) + time.perf_counter() - inicio
+
+    def contar(self, nome, quantidade=1):
+        with self.trava:
+            self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    def ativo(self, ativo, **medidas):
+        """Acumula medidas de um ativo (download_s, barras, indicadores_s)"""
+        with self.trava:
+            registro = self.ativos.setdefault(ativo, {})
+            for campo, valor in medidas.items():
+                registro[campo] = registro.get(campo, 0) + valor
+
+    def tamanho(self, nome, caminho):
+        """Bytes de um arquivo ou diretorio gravado"""
+        if os.path.isdir(caminho):
+            total = sum(entrada.stat().st_size for entrada in os.scandir(caminho) if entrada.is_file())
+        elif os.path.exists(caminho):
+            total = os.path.getsize(caminho)
+        else:
+            return
+        with self.trava:
+            self.bytes[nome] = total
+
+    def registrar_erros(self, erros):
+        with self.trava:
+            for erro in erros:
+                self.erros[erro["etapa"]] = self.erros.get(erro["etapa"], 0) + 1
+
+    def resumo(self):
+        """Linha gravada em data/metrics/ (sem o detalhe de cada ativo)"""
+        with self.trava:
+            ativos = {ativo: dict(registro) for ativo, registro in self.ativos.items()}
+            resumo = {
+                "momento": self.momento.isoformat(),
+                "comando": self.comando,
+                "status": self.status,
+                "duracao_s": round(time.perf_counter() - self.inicio, 3),
+                "etapas_s": {nome: round(tempo, 4) for nome, tempo in self.etapas.items()},
+                "contadores": dict(self.contadores),
+                "bytes": dict(self.bytes),
+                "erros": dict(self.erros),
+            }
+        resumo["download_s"] = _distribuicao([r["download_s"] for r in ativos.values() if "download_s" in r])
+        resumo["indicadores_s"] = _distribuicao([r["indicadores_s"] for r in ativos.values() if "indicadores_s" in r])
+        resumo["lentos"] = []
+        for ativo, registro in sorted(ativos.items(), key=lambda item: -sum(
+                item[1].get(campo, 0) for campo in ("download_s", "indicadores_s")))[:LENTOS]:
+            lento = {"ativo": ativo}
+            lento.update((campo, round(valor, 4)) for campo, valor in registro.items())
+            resumo["lentos"].append(lento)
+        return resumo
+
+
+_atual = Execucao()
+
+
+def atual():
+    """Execucao em andamento (uma vazia se ninguem chamou nova)"""
+    return _atual
+
+
+def nova(comando="completo", momento=None):
+    global _atual
+    _atual = Execucao(comando, momento)
+    return _atual
+
+
+def gravar(execucao, status, diretorio=DIR_METRICAS, prometheus_arquivo=None):
+    """Acrescenta a execucao ao arquivo do dia, apaga os antigos e grava o texto Prometheus se pedido"""
+    execucao.status = status
+    resumo = execucao.resumo()
+    os.makedirs(diretorio, exist_ok=True)
+    dia = execucao.momento.date()
+    with open(os.path.join(diretorio, dia.isoformat() + ".jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(resumo, ensure_ascii=False, separators=(",", ":")) + "\n")
+    limite = (dia - timedelta(days=RETENCAO_DIAS)).isoformat()
+    for nome in os.listdir(diretorio):
+        if nome.endswith(".jsonl") and nome[:10] < limite:
+            os.remove(os.path.join(diretorio, nome))
+    if prometheus_arquivo:
+        temporario = prometheus_arquivo + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(prometheus(resumo))
+        os.replace(temporario, prometheus_arquivo)
+    return resumo
+
+
+def _rotulo(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus(resumo, extras=None):
+    """Resumo de uma execucao no formato texto do Prometheus (todas as metricas como gauge).
+
+    `extras` ({nome: (ajuda, valor)}) entra junto; sem `resumo` (nenhuma execucao ainda) so ele.
+    """
+    series = []
+    if resumo:
+        series = [
+            ("vigilante_execucao_segundos", "Duracao total da execucao", [({}, resumo["duracao_s"])]),
+            ("vigilante_execucao_timestamp_segundos", "Inicio da execucao (epoch)",
+             [({}, round(datetime.fromisoformat(resumo["momento"]).timestamp(), 3))]),
+            ("vigilante_execucao_sucesso", "1 se a execucao terminou sem falha",
+             [({}, 0 if resumo["status"] == "falha" else 1)]),
+            ("vigilante_etapa_segundos", "Tempo de cada etapa",
+             [({"etapa": nome}, tempo) for nome, tempo in resumo["etapas_s"].items()]),
+            ("vigilante_contador", "Contadores da execucao (ativos, lotes, barras)",
+             [({"nome": nome}, valor) for nome, valor in resumo["contadores"].items()]),
+            ("vigilante_bytes_gravados", "Tamanho dos arquivos gravados",
+             [({"arquivo": nome}, valor) for nome, valor in resumo["bytes"].items()]),
+            ("vigilante_erros", "Erros por etapa",
+             [({"etapa": nome}, valor) for nome, valor in resumo["erros"].items()]),
+        ]
+        for nome, campo, ajuda in (("vigilante_download_ativo_segundos", "download_s", "Latencia do download por ativo"),
+                                   ("vigilante_indicadores_ativo_segundos", "indicadores_s", "Tempo dos indicadores por ativo")):
+            distribuicao = resumo.get(campo) or {}
+            series.append((nome, ajuda, [({"quantil": quantil}, valor) for quantil, valor in distribuicao.items()]))
+    for nome, (ajuda, valor) in (extras or {}).items():
+        series.append((nome, ajuda, [({}, valor)]))
+
+    linhas = []
+    for nome, ajuda, amostras in series:
+        if not amostras:
+            continue
+        linhas.append("# HELP %s %s" % (nome, ajuda))
+        linhas.append("# TYPE %s gauge" % nome)
+        for rotulos, valor in amostras:
+            texto = ",".join('%s="%s"' % (chave, _rotulo(v)) for chave, v in rotulos.items())
+            linhas.append("%s%s %s" % (nome, "{" + texto + "}" if texto else "", valor))
+    return "\n".join(linhas) + "\n"
+
+
+def ler(dias, diretorio=DIR_METRICAS, hoje=None):
+    """Execucoes gravadas nos ultimos `dias` dias, da mais antiga para a mais recente"""
+    hoje = hoje or datetime.now(timezone.utc).date()
+    limite = (hoje - timedelta(days=dias - 1)).isoformat()
+    execucoes = []
+    if not os.path.isdir(diretorio):
+        return execucoes
+    for nome in sorted(os.listdir(diretorio)):
+        if not nome.endswith(".jsonl") or nome[:10] < limite:
+            continue
+        with open(os.path.join(diretorio, nome), encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    execucoes.append(json.loads(linha))
+                except ValueError:
+                    # Linha cortada por uma execucao interrompida no meio da gravacao
+                    continue
+    return execucoes
+
+
+def tendencia(execucoes, dias, tolerancia, hoje=None):
+    """Compara a mediana de cada etapa nos ultimos `dias` com os `dias` anteriores.
+
+    Retorna [(etapa, mediana anterior, mediana recente)] das etapas que pioraram alem da tolerancia.
+    """
+    hoje = hoje or datetime.now(timezone.utc).date()
+    corte = (hoje - timedelta(days=dias - 1)).isoformat()
+    janelas = {"anterior": {}, "recente": {}}
+    for execucao in execucoes:
+        if execucao.get("status") == "falha":
+            continue
+        janela = janelas["recente" if execucao["momento"][:10] >= corte else "anterior"]
+        janela.setdefault("total", []).append(execucao["duracao_s"])
+        for nome, tempo in execucao["etapas_s"].items():
+            janela.setdefault(nome, []).append(tempo)
+    piores = []
+    print("%-22s %10s %10s %8s" % ("etapa", "anterior", "recente", "var"))
+    for nome in sorted(janelas["recente"]):
+        recente = _quantil(sorted(janelas["recente"][nome]), 0.5)
+        anterior = _quantil(sorted(janelas["anterior"].get(nome, [])), 0.5)
+        if anterior is None:
+            print("%-22s %10s %10.3f %8s" % (nome, "-", recente, "-"))
+            continue
+        variacao = recente / anterior - 1 if anterior else 0.0
+        piorou = anterior >= MINIMO_TENDENCIA_S and variacao > tolerancia
+        print("%-22s %10.3f %10.3f %+7.0f%%%s" % (nome, anterior, recente, variacao * 100, "  <- piorou" if piorou else ""))
+        if piorou:
+            piores.append((nome, anterior, recente))
+    return piores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="VIGILANTE - Metricas das execucoes (data/metrics/)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("tendencia", help="compara os ultimos dias com o periodo anterior de mesmo tamanho")
+    p.add_argument("--dias", type=int, default=7, help="tamanho de cada janela em dias (padrao: %(default)s)")
+    p.add_argument("--tolerancia", type=float, default=0.5,
+                   help="piora maxima da mediana de cada etapa, 0.5 = 50%% (padrao: %(default)s)")
+    p.add_argument("--diretorio", default=DIR_METRICAS)
+    args = parser.parse_args(argv)
+
+    execucoes = ler(2 * args.dias, args.diretorio)
+    if not execucoes:
+        print("[INFO] Nenhuma execucao em " + args.diretorio)
+        return 0
+    print("[INFO] %d execucoes nos ultimos %d dias" % (len(execucoes), 2 * args.dias))
+    piores = tendencia(execucoes, args.dias, args.tolerancia)
+    for nome, anterior, recente in piores:
+        print("[AVISO] %s: mediana de %.3fs para %.3fs" % (nome, anterior, recente))
+    return 1 if piores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
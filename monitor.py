@@ -7,596 +7,676 @@ Apenas busca dados, calcula SMA17/SMA72 e gera HTML
 
 import os
 import sys
+import argparse
 import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
-try:
-    import yfinance as yf
-    import pandas as pd
-except:
-    print("[ERRO] Instale: pip install yfinance pandas")
-    sys.exit(1)
+import numpy as np
+
+# yfinance e pandas levam quase um segundo para importar e só são carregados quando
+# há download (veja provedores.py). Indicadores a partir do cache local usam só NumPy.
+import cache_precos
+import estado_sma
+import cruzamentos
+import historico
+import renderizador
+import calendario
+import log_sinais
+import analise_carteiras
+import carteiras
+import provedores
+import indicadores
+import metricas
+import delta
+import cambio
+import matriz_precos
 
 # Configurações
 BRT = timezone(timedelta(hours=-3))
-CARTEIRAS = {
-    "Carteira Ações": ["ITSA4.SA", "BBSE3.SA", "BBDC4.SA", "LREN3.SA", "RDOR3.SA", "GOAU4.SA", "KLBN4.SA", "FLRY3.SA", "JHSF3.SA", "SAUD3.SA", "TAEE11.SA", "VALE3.SA"],
-    "Carteira ETF": ["IVVB11.SA", "DIVO11.SA", "GOLD11.SA", "HASH11.SA", "WRLD11.SA"],
-    "Watchlist": ["PETR3.SA", "BTC-USD", "GC=F", "SI=F"],
-    "Especulação": ["RDOR3.SA"]
-}
+# Carteiras e ativos vêm de carteiras.csv (veja carteiras.py); com --carteiras/--indicadores
+# o main carrega outro arquivo e passa a composição e os extras adiante como argumentos
+CARTEIRAS = carteiras.carregar()
+INDICADORES = carteiras.carregar_indicadores()
+DIAS_SINAIS_RECENTES = 14
+WORKERS_PADRAO = 4
+LOTE_DOWNLOAD = 50
 
 def agora():
     return datetime.now(BRT)
 
-def buscar_e_processar():
-    """Busca dados e gera relatorio"""
-    print("[INFO] Iniciando - " + agora().strftime('%d/%m/%Y %H:%M:%S BRT'))
+def universo(composicao=None):
+    """Ativos unicos de todas as carteiras ({carteira: [ativos]}, padrao CARTEIRAS), na ordem em que aparecem"""
+    composicao = CARTEIRAS if composicao is None else composicao
+    return list(dict.fromkeys(ativo for ativos in composicao.values() for ativo in ativos))
+
+def baixar_precos(ativos, inicio=None, periodo="5y", intervalo="1d"):
+    """Baixa barras de `intervalo` (padrao: diarias) de todos os ativos em uma unica requisicao em lote.
+
+    Sem `inicio` busca o `periodo` inteiro (5 anos); com `inicio` busca apenas a partir dessa data.
+    O download passa pelo provedor resiliente (limite de taxa, novas tentativas e disjuntor,
+    veja provedores.py) e traz apenas os ativos que vieram com dados.
+    """
+    t0 = time.perf_counter()
+    dados = provedores.atual().baixar(ativos, inicio, periodo, intervalo)
+    duracao = time.perf_counter() - t0
+    print("[TEMPO] Download em lote: %.2fs para %d ativos (%d com dados)" % (duracao, len(ativos), len(dados)))
+    execucao = metricas.atual()
+    execucao.contar("lotes_download")
+    execucao.contar("ativos_pedidos", len(ativos))
+    execucao.contar("barras_baixadas", sum(len(df) for df in dados.values()))
+    for ativo in ativos:
+        execucao.ativo(ativo, download_s=duracao, barras=len(dados[ativo]) if ativo in dados else 0)
+    return dados
+
+def atualizar_precos(ativos, memoria=None, defasados=None):
+    """Le o cache local, baixa apenas os pregoes que faltam e grava o cache atualizado.
+
+    Ativos sem cache (ou com historico reajustado por desdobramento/dividendo) sao
+    baixados por completo. Se o download falhar, fica o que estava no cache e o ativo
+    entra em `defasados` (set), quando informado.
+    Com `memoria` ({ativo: DataFrame}, usado pelo modo servico) o cache vem dela e nao do disco.
+    """
+    defasados = set() if defasados is None else defasados
+    memoria = memoria or {}
+    cache = {ativo: memoria[ativo] if ativo in memoria else cache_precos.carregar(ativo) for ativo in ativos}
+    
+    # Agrupa por data de inicio para que cada grupo seja um unico download em lote
+    grupos = {}
+    for ativo in ativos:
+        grupos.setdefault(cache_precos.inicio_incremental(cache[ativo]), []).append(ativo)
+    
+    dados = {}
+    refazer = []
+    for inicio, grupo in grupos.items():
+        if inicio is None:
+            print("[CACHE] Busca completa: " + ", ".join(grupo))
+            refazer.extend(grupo)
+            continue
+        print("[CACHE] Incremental desde " + inicio.strftime('%d/%m/%Y') + ": " + str(len(grupo)) + " ativos")
+        novos = baixar_precos(grupo, inicio)
+        for ativo in grupo:
+            antigo = cache[ativo]
+            novo = novos.get(ativo)
+            if novo is None:
+                defasados.add(ativo)
+            elif cache_precos.ajuste_detectado(antigo, novo):
+                print("  [CACHE] " + ativo + ": historico reajustado, refazendo download completo")
+                refazer.append(ativo)
+                continue
+            dados[ativo] = cache_precos.mesclar(antigo, novo)
+    
+    if refazer:
+        completos = baixar_precos(refazer)
+        for ativo in refazer:
+            if ativo in completos:
+                dados[ativo] = completos[ativo]
+            elif cache[ativo] is not None:
+                dados[ativo] = cache[ativo]
+                defasados.add(ativo)
+    
+    for ativo, df in dados.items():
+        if df is not cache[ativo]:
+            try:
+                cache_precos.salvar(ativo, df)
+            except Exception as e:
+                print("  [AVISO] Falha ao gravar cache de " + ativo + ": " + str(e)[:80])
+    
+    return dados
+
+def baixar_precos_serial(ativos):
+    """Baixa um ativo por vez (comportamento antigo), usado apenas para comparar o tempo"""
+    yf = provedores.yfinance()
+    import pandas as pd
+    inicio = time.perf_counter()
+    dados = {}
+    for ativo in ativos:
+        try:
+            df = yf.download(ativo, period="5y", interval="1d", progress=False)
+            if df is not None and len(df) > 0:
+                if isinstance(df.columns, pd.MultiIndex):
+                    df.columns = df.columns.get_level_values(0)
+                dados[ativo] = df
+        except Exception as e:
+            print("  [ERRO] " + ativo + ": " + str(e)[:80])
+    duracao = time.perf_counter() - inicio
+    print("[TEMPO] Download serial: %.2fs para %d ativos (%d com dados)" % (duracao, len(ativos), len(dados)))
+    return dados
+
+def comparar_download():
+    """Mede o tempo do download em lote contra o laco ativo por ativo"""
+    ativos = universo()
+    inicio = time.perf_counter()
+    baixar_precos_serial(ativos)
+    serial = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    baixar_precos(ativos)
+    lote = time.perf_counter() - inicio
+    print("[TEMPO] Serial %.2fs x Lote %.2fs (%.1fx mais rapido)" % (serial, lote, serial / lote if lote else 0))
+
+def processar_ativo(ativo, serie, estados=None):
+    """Calcula SMA17/SMA72, sinal e ultimo cruzamento de um ativo. Retorna (linha, grafico) ou None.
+
+    `serie` sao os fechamentos do ativo (cache_precos.Fechamentos): o calculo usa so NumPy.
+    Com `estados` ({ativo: EstadoSMA}, usado pelo modo servico) o estado das medias fica em
+    memoria entre execucoes e so e regravado em disco quando um pregao novo fecha.
+    """
+    if serie is None or len(serie.closes) < 72:
+        print("  [SKIP] " + ativo + ": Dados insuficientes")
+        return None
+    
+    # SMA17/SMA72 e último cruzamento a partir do estado salvo: só os pregões novos são processados
+    anterior = estados.get(ativo) if estados is not None else None
+    if anterior is None:
+        anterior = estado_sma.carregar(ativo)
+    ultima_data = anterior.ultima_data if anterior is not None else None
+    atual, fechado = estado_sma.calcular(ativo, serie.datas, serie.closes, anterior)
+    if estados is not None:
+        estados[ativo] = fechado
+    if estados is None or fechado is not anterior or fechado.ultima_data != ultima_data:
+        try:
+            estado_sma.salvar(ativo, fechado)
+        except Exception as e:
+            print("  [AVISO] Falha ao gravar estado SMA de " + ativo + ": " + str(e)[:80])
+    
+    # Extrair ultimos valores
+    close = float(serie.closes[-1])
+    ultima = np.datetime_as_string(serie.datas[-1], unit='D')
+    sma17_val, sma72_val = atual.valores()
+    inicio_5y = np.searchsorted(serie.datas, np.datetime64(calendario.anos_antes(serie.datas[-1].astype(object), 5), 'D'))
+    closes_5y = serie.closes[inicio_5y:]
+    min5y = float(np.nanmin(closes_5y))
+    max5y = float(np.nanmax(closes_5y))
+    
+    # Determinar sinal
+    if sma17_val > sma72_val:
+        sinal = "COMPRA"
+    elif sma17_val < sma72_val:
+        sinal = "VENDA"
+    else:
+        sinal = "NEUTRO"
+    
+    # Com o pregão de hoje em andamento, um cruzamento que só existe por causa dele é provisório:
+    # pode desaparecer até o fechamento
+    em_andamento = ultima >= agora().date().isoformat() and calendario.mercado_aberto(ativo, agora())
+    provisorio = em_andamento and fechado.sinal != 0 and atual.sinal != 0 and atual.sinal != fechado.sinal
+    
+    # Data do último cruzamento
+    ultimo_cruzamento = "N/A"
+    if atual.ultimo_cruzamento:
+        ultimo_cruzamento = datetime.strptime(atual.ultimo_cruzamento, '%Y-%m-%d').strftime('%d/%m/%Y')
+    
+    linha = {
+        "Ativo": ativo,
+        "Moeda": cambio.moeda(ativo),
+        "Fechamento": round(close, 2),
+        "SMA17": round(sma17_val, 2),
+        "SMA72": round(sma72_val, 2),
+        "Min (5y)": round(min5y, 2),
+        "Max (5y)": round(max5y, 2),
+        "Sinal": sinal,
+        "Último Cruzamento": ultimo_cruzamento,
+        "Cruzamento Provisório": provisorio,
+        "Defasado": False
+    }
+    
+    # Salvar últimos 365 dias para gráficos (as médias só precisam de 71 pregões antes da janela)
+    trecho = serie.closes[-(365 + 71):][None, :]
+    sma17 = cruzamentos.medias_moveis(trecho, 17)[0, -365:]
+    sma72 = cruzamentos.medias_moveis(trecho, 72)[0, -365:]
+    grafico = {
+        "datas": np.datetime_as_string(serie.datas[-365:], unit='D').tolist(),
+        "precos": np.round(serie.closes[-365:], 2).tolist(),
+        "sma17": np.round(sma17, 2).tolist(),
+        "sma72": np.round(sma72, 2).tolist()
+    }
+    
+    return linha, grafico
+
+def _processar_medido(ativo, serie, estados=None):
+    """processar_ativo registrando o tempo do ativo nas métricas da execução"""
+    inicio = time.perf_counter()
+    try:
+        return processar_ativo(ativo, serie, estados)
+    finally:
+        metricas.atual().ativo(ativo, indicadores_s=time.perf_counter() - inicio)
+
+def _com_pregao_parcial(serie, parcial):
+    """Fechamentos com o pregão em andamento (data ISO, fechamento) vindo das barras intradiárias"""
+    data, close = np.datetime64(parcial[0], 'D'), float(parcial[1])
+    if len(serie.datas) and serie.datas[-1] > data:
+        return serie
+    if len(serie.datas) and serie.datas[-1] == data:
+        closes = serie.closes.copy()
+        closes[-1] = close
+        if serie.maximas is None:
+            return cache_precos.Fechamentos(serie.datas, closes)
+        # A máxima e a mínima do dia passam a incluir o último preço intradiário
+        maximas, minimas = serie.maximas.copy(), serie.minimas.copy()
+        maximas[-1], minimas[-1] = np.fmax(maximas[-1], close), np.fmin(minimas[-1], close)
+        return cache_precos.Fechamentos(serie.datas, closes, maximas, minimas)
+    if serie.maximas is None:
+        return cache_precos.Fechamentos(np.append(serie.datas, data), np.append(serie.closes, close))
+    return cache_precos.Fechamentos(np.append(serie.datas, data), np.append(serie.closes, close),
+                                    np.append(serie.maximas, close), np.append(serie.minimas, close))
+
+def _fechamentos_locais(ativo, memoria=None):
+    """Fechamentos sem download: do cache em disco (sem pandas) ou da memoria do modo servico"""
+    if memoria is None:
+        return cache_precos.carregar_fechamentos(ativo)
+    if ativo not in memoria:
+        df = cache_precos.carregar(ativo)
+        if df is None:
+            return None
+        memoria[ativo] = df
+    return cache_precos.fechamentos(memoria[ativo])
+
+def executar_pipeline(ativos, workers=WORKERS_PADRAO, baixar=None, memoria=None, estados=None, parciais=None,
+                      auxiliares=()):
+    """Executa as etapas download -> indicadores/serializacao em um pool limitado de threads.
+
+    O universo e dividido em lotes de LOTE_DOWNLOAD ativos. Assim que um lote termina de
+    baixar, os indicadores dos seus ativos entram no pool e rodam enquanto os proximos lotes
+    ainda estao na rede. Ativos fora de `baixar` (padrao: todos) usam apenas o cache local,
+    a menos que ainda nao tenham cache. Retorna (dados, resultados, erros), com um registro
+    em `erros` por ativo que falhou e a etapa em que falhou.
+
+    `dados` traz os fechamentos (cache_precos.Fechamentos) de cada ativo. Sem download o
+    pandas nem chega a ser importado. `memoria` e `estados` (modo servico) mantem precos
+    (DataFrames) e medias entre execucoes; `memoria` e atualizada com os precos desta execucao.
+    `parciais` ({ativo: (data, fechamento)}, modo intradiario) substitui o pregao em andamento
+    nos fechamentos usados nos indicadores; o cache continua so com os dados diarios.
+    Ativos cujo download falhou seguem com o cache local, marcados com "Defasado" na linha.
+    `auxiliares` (o cambio, veja cambio.py) vao no primeiro lote e para `dados`, sem indicadores.
+    """
+    parciais = parciais or {}
+    dados = {}
+    resultados = {}
+    erros = []
+    defasados = set()
+    baixar = set(ativos) if baixar is None else set(baixar)
+    auxiliares = [ativo for ativo in auxiliares if ativo not in ativos]
+    for ativo in auxiliares + list(ativos):
+        if ativo not in baixar:
+            serie = _fechamentos_locais(ativo, memoria)
+            if serie is None:
+                baixar.add(ativo)
+            else:
+                dados[ativo] = _com_pregao_parcial(serie, parciais[ativo]) if ativo in parciais else serie
+    para_baixar = [ativo for ativo in auxiliares + list(ativos) if ativo in baixar]
+    lotes = [para_baixar[i:i + LOTE_DOWNLOAD] for i in range(0, len(para_baixar), LOTE_DOWNLOAD)]
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        calculos = {pool.submit(_processar_medido, ativo, df, estados): ativo
+                    for ativo, df in dados.items() if ativo not in auxiliares}
+        downloads = {pool.submit(atualizar_precos, lote, memoria, defasados): lote for lote in lotes}
+        
+        for futuro in as_completed(downloads):
+            lote = downloads[futuro]
+            try:
+                baixados = futuro.result()
+            except Exception as e:
+                erros.extend({"ativo": ativo, "etapa": "download", "erro": str(e)[:200]} for ativo in lote)
+                continue
+            for ativo in lote:
+                if ativo not in baixados:
+                    print("  [ERRO] " + ativo + ": sem dados no download")
+                    erros.append({"ativo": ativo, "etapa": "download", "erro": "sem dados no download"})
+                    continue
+                if ativo in defasados:
+                    ultimo = baixados[ativo].index[-1].strftime('%d/%m/%Y')
+                    print("  [AVISO] " + ativo + ": download falhou, usando o cache ate " + ultimo)
+                    erros.append({"ativo": ativo, "etapa": "download", "erro": "download falhou; usando o cache local ate " + ultimo})
+                if memoria is not None:
+                    memoria[ativo] = baixados[ativo]
+                dados[ativo] = cache_precos.fechamentos(baixados[ativo])
+                if ativo in auxiliares:
+                    continue
+                if ativo in parciais:
+                    dados[ativo] = _com_pregao_parcial(dados[ativo], parciais[ativo])
+                calculos[pool.submit(_processar_medido, ativo, dados[ativo], estados)] = ativo
+        
+        for futuro in as_completed(calculos):
+            ativo = calculos[futuro]
+            try:
+                resultados[ativo] = futuro.result()
+                if resultados[ativo] is None:
+                    erros.append({"ativo": ativo, "etapa": "indicadores", "erro": "Dados insuficientes"})
+            except Exception as e:
+                print("  [ERRO] " + ativo + ": " + str(e)[:80])
+                erros.append({"ativo": ativo, "etapa": "indicadores", "erro": str(e)[:200]})
+    
+    for ativo in defasados:
+        if resultados.get(ativo):
+            resultados[ativo][0]["Defasado"] = True
+    
+    ordem = {ativo: i for i, ativo in enumerate(auxiliares + list(ativos))}
+    erros.sort(key=lambda erro: ordem[erro["ativo"]])
+    return dados, resultados, erros
+
+def impressao_digital(relatorio, dados):
+    """Hash do último pregão de cada ativo e dos sinais calculados (ignora o timestamp)"""
+    ultimos = {ativo: [str(serie.datas[-1]), repr(float(serie.closes[-1]))]
+               for ativo, serie in dados.items() if len(serie.closes) > 0}
+    base = {
+        "ultimos": ultimos,
+        "carteiras": relatorio.get("carteiras"),
+        "sinais_recentes": relatorio.get("sinais_recentes"),
+        "erros": relatorio.get("erros"),
+    }
+    texto = json.dumps(base, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+def impressao_anterior(caminho="data/current-analysis.json"):
+    """Impressão digital gravada na execução anterior, ou None"""
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f).get("fingerprint")
+    except Exception:
+        return None
+
+def buscar(ativos, workers=WORKERS_PADRAO, forcar=False, baixar=None, memoria=None, estados=None,
+           agregadores=None):
+    """Busca dados e calcula os indicadores de `ativos`. Retorna (relatorio parcial, dados, resultados).
+
+    Fora do horário de negociação de um ativo (veja calendario.py) ele não é baixado: os
+    sinais saem do cache local. Com `forcar`, todos os ativos são baixados; com `baixar`,
+    apenas os indicados (o modo serviço decide pela cadência de cada classe de ativo).
+    Com `agregadores` ({ativo: intradiario.Agregador}) liga o modo intradiário.
+    O câmbio (cambio.PAR) vem junto quando há ativos em dólar e é baixado sempre que algum deles for.
+    """
+    momento = agora()
+    print("[INFO] Iniciando - " + momento.strftime('%d/%m/%Y %H:%M:%S BRT'))
     
     relatorio = {
-        "timestamp": agora().isoformat(),
+        "timestamp": momento.isoformat(),
         "carteiras": {},
         "historico": {}
     }
     
-    for carteira, ativos in CARTEIRAS.items():
+    if baixar is None:
+        baixar = set(ativos) if forcar else {ativo for ativo in ativos if calendario.mercado_aberto(ativo, momento)}
+    if len(baixar) < len(ativos):
+        print("[CALENDARIO] Mercado fechado para %d de %d ativos: usando o cache local" % (len(ativos) - len(baixar), len(ativos)))
+    
+    # Barras de 15 min dos ativos com mercado aberto: sinal de 60 min e pregão de hoje em andamento
+    parciais = None
+    if agregadores is not None:
+        import intradiario
+        inicio = time.perf_counter()
+        with metricas.atual().etapa("intradiario"):
+            parciais = intradiario.atualizar([ativo for ativo in ativos if ativo in baixar], agregadores)
+            relatorio["intradiario"] = intradiario.resumo(agregadores, ativos)
+        print("[TEMPO] Intradiario: %.2fs para %d ativos" % (time.perf_counter() - inicio, len(parciais)))
+    
+    # Cada ativo é baixado uma única vez, mesmo que esteja em várias carteiras,
+    # e apenas os pregões que ainda não estão no cache local
+    auxiliares = cambio.auxiliares(ativos)
+    if auxiliares and any(cambio.moeda(ativo) == "USD" for ativo in baixar):
+        baixar = set(baixar) | set(auxiliares)
+    inicio = time.perf_counter()
+    execucao = metricas.atual()
+    execucao.contar("ativos", len(ativos))
+    execucao.contar("ativos_baixados", len(baixar))
+    with execucao.etapa("pipeline"):
+        dados, resultados, erros = executar_pipeline(ativos, workers, baixar, memoria, estados, parciais, auxiliares)
+    print("[TEMPO] Pipeline: %.2fs com %d workers" % (time.perf_counter() - inicio, workers))
+    relatorio["erros"] = erros
+    return relatorio, dados, resultados
+
+def montar_relatorio(relatorio, dados, resultados, motores=None, composicao=None, extras=None):
+    """Carteiras, cruzamentos, análise por carteira e impressão digital a partir dos resultados por ativo.
+
+    Com `motores` (dict, usado pelo modo serviço) o motor dos indicadores extras fica em memória
+    entre execuções e só avança os pregões novos (veja indicadores.atualizar).
+    `composicao` ({carteira: [ativos]}) e `extras` ({carteira: [indicadores]}) vêm de
+    carteiras.carregar/carregar_indicadores; o padrão são CARTEIRAS e INDICADORES.
+    """
+    execucao = metricas.atual()
+    composicao = CARTEIRAS if composicao is None else composicao
+    extras = INDICADORES if extras is None else extras
+    
+    # Montagem na ordem das carteiras, independente da ordem em que os ativos terminaram
+    for carteira, ativos in composicao.items():
         print("[CARTEIRA] " + carteira)
         relatorio["carteiras"][carteira] = []
         
         for ativo in ativos:
-            try:
-                # Buscar dados (yfinance retorna MultiIndex para coluna Close)
-                df = yf.download(ativo, period="5y", interval="1d", progress=False)
-                
-                if df is None or len(df) < 72:
-                    print("  [SKIP] " + ativo + ": Dados insuficientes")
-                    continue
-                
-                # Se tem MultiIndex, extrair a coluna correta
-                if isinstance(df.columns, pd.MultiIndex):
-                    # MultiIndex como ('Close', 'ITSA4.SA')
-                    close_col = [col for col in df.columns if col[0] == 'Close'][0]
-                    df_close = df[close_col].copy()
-                else:
-                    # Single index normal
-                    df_close = df['Close'].copy()
-                
-                # Calcular SMA
-                sma17 = df_close.rolling(17).mean()
-                sma72 = df_close.rolling(72).mean()
-                
-                # Extrair ultimos valores
-                close = float(df_close.iloc[-1])
-                sma17_val = float(sma17.iloc[-1])
-                sma72_val = float(sma72.iloc[-1])
-                min5y = float(df_close.min())
-                max5y = float(df_close.max())
-                
-                # Determinar sinal
-                if sma17_val > sma72_val:
-                    sinal = "COMPRA"
-                elif sma17_val < sma72_val:
-                    sinal = "VENDA"
-                else:
-                    sinal = "NEUTRO"
-                
-                # Calcular data do último cruzamento
-                ultimo_cruzamento = "N/A"
-                try:
-                    # Criar DataFrame com as duas SMAs
-                    df_sma = pd.DataFrame({
-                        'sma17': sma17,
-                        'sma72': sma72
-                    })
-                    # Calcular diferença (positivo = SMA17 acima, negativo = SMA17 abaixo)
-                    df_sma['diff'] = df_sma['sma17'] - df_sma['sma72']
-                    # Detectar mudança de sinal (cruzamento)
-                    df_sma['signal'] = df_sma['diff'].apply(lambda x: 1 if x > 0 else (-1 if x < 0 else 0))
-                    df_sma['cross'] = df_sma['signal'].diff().abs() > 0
-                    
-                    # Pegar índices onde houve cruzamento
-                    crosses = df_sma[df_sma['cross'] == True].index
-                    
-                    if len(crosses) > 0:
-                        ultima_data_cross = crosses[-1]
-                        ultimo_cruzamento = ultima_data_cross.strftime('%d/%m/%Y')
-                except:
-                    ultimo_cruzamento = "N/A"
-                
-                relatorio["carteiras"][carteira].append({
-                    "Ativo": ativo,
-                    "Fechamento": round(close, 2),
-                    "SMA17": round(sma17_val, 2),
-                    "SMA72": round(sma72_val, 2),
-                    "Min (5y)": round(min5y, 2),
-                    "Max (5y)": round(max5y, 2),
-                    "Sinal": sinal,
-                    "Último Cruzamento": ultimo_cruzamento
-                })
-                
-                # Salvar últimos 365 dias para gráficos
-                df_chart = df_close.tail(365).reset_index()
-                if isinstance(df_chart.columns, pd.MultiIndex):
-                    df_chart.columns = ['Date', 'Close']
-                else:
-                    df_chart.columns = ['Date', 'Close']
-                
-                sma17_chart = sma17.tail(365).reset_index()
-                if isinstance(sma17_chart.columns, pd.MultiIndex):
-                    sma17_chart.columns = ['Date', 'SMA17']
-                else:
-                    sma17_chart.columns = ['Date', 'SMA17']
-                    
-                sma72_chart = sma72.tail(365).reset_index()
-                if isinstance(sma72_chart.columns, pd.MultiIndex):
-                    sma72_chart.columns = ['Date', 'SMA72']
-                else:
-                    sma72_chart.columns = ['Date', 'SMA72']
-                
-                relatorio["historico"][ativo] = {
-                    "datas": df_chart['Date'].dt.strftime('%Y-%m-%d').tolist(),
-                    "precos": df_chart['Close'].round(2).tolist(),
-                    "sma17": sma17_chart['SMA17'].round(2).tolist(),
-                    "sma72": sma72_chart['SMA72'].round(2).tolist()
-                }
-                
-                print("  [OK] " + ativo + ": " + sinal)
-                
-            except Exception as e:
-                print("  [ERRO] " + ativo + ": " + str(e)[:80])
+            resultado = resultados.get(ativo)
+            if resultado is None:
                 continue
+            
+            linha, grafico = resultado
+            relatorio["carteiras"][carteira].append(dict(linha))
+            relatorio["historico"][ativo] = grafico
+            
+            print("  [OK] " + ativo + ": " + linha["Sinal"])
+    
+    # Todos os cruzamentos de todos os ativos de uma vez, sobre a matriz de fechamentos
+    series = {ativo: dados[ativo] for ativo, resultado in resultados.items() if resultado}
+    try:
+        with execucao.etapa("cruzamentos"):
+            ativos, datas, precos = cruzamentos.montar_matriz(series)
+            eventos = cruzamentos.detectar(ativos, datas, precos)
+            # No resumo (baixado a cada consulta) só o último de cada ativo; a lista completa vai
+            # no arquivo do gráfico em data/historico/, baixado quando o gráfico é aberto
+            relatorio["ultimos_cruzamentos"] = cruzamentos.ultimos(eventos)
+            for ativo, lista in eventos.items():
+                if ativo in relatorio["historico"]:
+                    relatorio["historico"][ativo]["cruzamentos"] = lista
+            desde = (agora().date() - timedelta(days=DIAS_SINAIS_RECENTES)).isoformat()
+            relatorio["sinais_recentes"] = cruzamentos.recentes(eventos, composicao, desde)
+        print("[INFO] Cruzamentos nos ultimos " + str(DIAS_SINAIS_RECENTES) + " dias: " + str(len(relatorio["sinais_recentes"])))
+    except Exception as e:
+        print("[ERRO] Cruzamentos: " + str(e)[:80])
+    
+    # Ativos em dólar convertidos para reais de uma vez, com o câmbio da própria execução
+    reais = series
+    if dados.get(cambio.PAR) is not None:
+        try:
+            with execucao.etapa("cambio"):
+                convertidas = cambio.converter(series, dados[cambio.PAR])
+                colunas = cambio.resumo(convertidas)
+                for linhas in relatorio["carteiras"].values():
+                    for linha in linhas:
+                        linha.update(colunas.get(linha["Ativo"], {}))
+                relatorio["cambio"] = cambio.cotacao(dados[cambio.PAR])
+                reais = {**series, **convertidas}
+            if relatorio["cambio"]:
+                print("[CAMBIO] %s %.4f em %s: %d ativos em dolar convertidos"
+                      % (cambio.PAR, relatorio["cambio"]["cotacao"], relatorio["cambio"]["data"], len(convertidas)))
+        except Exception as e:
+            print("[ERRO] Cambio: " + str(e)[:80])
+    
+    # Resumo por carteira sobre a uniao dos calendarios (BTC-USD todos os dias, B3 dias uteis),
+    # com os ativos em dólar já em reais
+    try:
+        inicio = time.perf_counter()
+        with execucao.etapa("analise_carteiras"):
+            alinhada = analise_carteiras.alinhar(reais)
+            sinais = {ativo: resultado[0]["Sinal"] for ativo, resultado in resultados.items() if resultado}
+            relatorio["analise_carteiras"] = analise_carteiras.analisar(*alinhada, composicao, sinais)
+        print("[TEMPO] Analise de carteiras: %.2fs" % (time.perf_counter() - inicio))
+    except Exception as e:
+        print("[ERRO] Analise de carteiras: " + str(e)[:80])
+    
+    # Indicadores extras (indicadores.csv): uma passada só para os ativos das carteiras que pedem algum
+    escolhidos = {carteira: lista for carteira, lista in extras.items() if lista and carteira in composicao}
+    if escolhidos:
+        try:
+            inicio = time.perf_counter()
+            with execucao.etapa("indicadores_extras"):
+                membros = {ativo: series[ativo] for carteira in escolhidos for ativo in composicao[carteira] if ativo in series}
+                anterior = motores.get("indicadores") if motores is not None else None
+                motor, valores = indicadores.atualizar(membros, [ind for lista in escolhidos.values() for ind in lista], anterior)
+                if motores is not None:
+                    motores["indicadores"] = motor
+                relatorio["indicadores"] = {}
+                for carteira, lista in escolhidos.items():
+                    colunas = [coluna for ind in lista for coluna in ind.colunas()]
+                    relatorio["indicadores"][carteira] = colunas
+                    for linha in relatorio["carteiras"][carteira]:
+                        linha.update((coluna, valores.get(linha["Ativo"], {}).get(coluna)) for coluna in colunas)
+            print("[TEMPO] Indicadores (%d ativos): %.2fs" % (len(membros), time.perf_counter() - inicio))
+        except Exception as e:
+            print("[ERRO] Indicadores: " + str(e)[:80])
     
+    with execucao.etapa("fingerprint"):
+        relatorio["fingerprint"] = impressao_digital(relatorio, dados)
     return relatorio
 
-def gerar_html_simples(relatorio):
-    """Gera HTML com design profissional e gráficos interativos"""
-    
-    html = """<!DOCTYPE html>
-<html lang="pt-BR">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>VIGILANTE - Análise de Médias Móveis</title>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }
-        .container {
-            max-width: 1400px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 12px;
-            box-shadow: 0 10px 40px rgba(0, 0, 0, 0.15);
-            overflow: hidden;
-        }
-        
-        .header {
-            background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%);
-            color: white;
-            padding: 40px;
-            text-align: center;
-            border-bottom: 4px solid #ffc107;
-        }
-        .header h1 {
-            font-size: 2.5em;
-            margin-bottom: 10px;
-            font-weight: 600;
-            letter-spacing: 1px;
-        }
-        .header .subtitle {
-            font-size: 1.1em;
-            opacity: 0.9;
-            margin-bottom: 15px;
-        }
-        .header .info-row {
-            display: flex;
-            justify-content: center;
-            gap: 40px;
-            font-size: 0.95em;
-            margin-top: 15px;
-            flex-wrap: wrap;
-        }
-        .info-item {
-            display: flex;
-            align-items: center;
-            gap: 8px;
-        }
-        .info-item label {
-            font-weight: 600;
-            opacity: 0.8;
-        }
-        
-        .content {
-            padding: 40px;
-        }
-        
-        .section {
-            margin-bottom: 40px;
-        }
-        .section h2 {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 15px 20px;
-            border-radius: 8px;
-            margin-bottom: 25px;
-            font-size: 1.4em;
-            font-weight: 600;
-            border-left: 5px solid #ffc107;
-        }
-        
-        table {
-            width: 100%;
-            border-collapse: collapse;
-            margin-bottom: 20px;
-            font-size: 0.95em;
-            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-            border-radius: 8px;
-            overflow: hidden;
-        }
-        thead {
-            background: #f8f9fa;
-            border-bottom: 2px solid #ddd;
-        }
-        th {
-            padding: 18px;
-            text-align: left;
-            font-weight: 600;
-            color: #333;
-            border-right: 1px solid #eee;
-            width: 12.5%;
-        }
-        th:last-child {
-            border-right: none;
-        }
-        td {
-            padding: 16px 18px;
-            border-bottom: 1px solid #eee;
-            border-right: 1px solid #eee;
-            width: 12.5%;
-        }
-        td:last-child {
-            border-right: none;
-        }
-        tbody tr:hover {
-            background: #f0f8ff;
-            transition: background 0.2s ease;
-        }
-        tbody tr:last-child td {
-            border-bottom: none;
-        }
-        
-        .ativo-link {
-            color: #2a5298;
-            font-weight: 600;
-            cursor: pointer;
-            border-bottom: 2px dotted #2a5298;
-            transition: 0.3s;
-        }
-        .ativo-link:hover {
-            color: #764ba2;
-            border-bottom-color: #764ba2;
-        }
-        
-        .sinal {
-            padding: 8px 12px;
-            border-radius: 6px;
-            font-weight: 600;
-            text-align: center;
-            display: inline-block;
-            min-width: 90px;
-        }
-        .compra {
-            background: #d4edda;
-            color: #155724;
-            border: 1px solid #c3e6cb;
-        }
-        .venda {
-            background: #f8d7da;
-            color: #721c24;
-            border: 1px solid #f5c6cb;
-        }
-        .neutro {
-            background: #e2e3e5;
-            color: #383d41;
-            border: 1px solid #d6d8db;
-        }
-        
-        .footer {
-            background: #f8f9fa;
-            padding: 30px;
-            text-align: center;
-            border-top: 1px solid #ddd;
-            color: #666;
-            font-size: 0.9em;
-        }
-        .footer p {
-            margin: 5px 0;
-        }
-        
-        .modal {
-            display: none;
-            position: fixed;
-            z-index: 1000;
-            left: 0;
-            top: 0;
-            width: 100%;
-            height: 100%;
-            background: rgba(0, 0, 0, 0.5);
-            animation: fadeIn 0.3s ease;
-        }
-        @keyframes fadeIn {
-            from { opacity: 0; }
-            to { opacity: 1; }
-        }
-        .modal-content {
-            background: white;
-            margin: 5% auto;
-            padding: 30px;
-            border-radius: 12px;
-            width: 90%;
-            max-width: 1000px;
-            box-shadow: 0 10px 50px rgba(0, 0, 0, 0.3);
-            animation: slideIn 0.3s ease;
-        }
-        @keyframes slideIn {
-            from {
-                transform: translateY(-50px);
-                opacity: 0;
-            }
-            to {
-                transform: translateY(0);
-                opacity: 1;
-            }
-        }
-        .modal-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 20px;
-            border-bottom: 2px solid #eee;
-            padding-bottom: 15px;
-        }
-        .modal-header h2 {
-            font-size: 1.5em;
-            color: #333;
-        }
-        .close-btn {
-            background: #dc3545;
-            color: white;
-            border: none;
-            padding: 8px 15px;
-            font-size: 1em;
-            border-radius: 6px;
-            cursor: pointer;
-            transition: 0.3s;
-        }
-        .close-btn:hover {
-            background: #c82333;
-        }
-        .chart-container {
-            position: relative;
-            height: 400px;
-            margin-bottom: 20px;
-        }
-        
-        @media (max-width: 768px) {
-            .header { padding: 25px; }
-            .header h1 { font-size: 1.8em; }
-            .header .info-row { gap: 20px; }
-            .content { padding: 20px; }
-            th, td { font-size: 0.85em; padding: 12px; width: auto; }
-            .modal-content { width: 95%; margin: 20% auto; }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>VIGILANTE</h1>
-            <div class="subtitle">Análise de Médias Móveis - SMA17 vs SMA72</div>
-            <div class="info-row">
-                <div class="info-item">
-                    <label>Atualizado em:</label>
-                    <span>{TIMESTAMP}</span>
-                </div>
-                <div class="info-item">
-                    <label>Próxima atualização:</label>
-                    <span>Próxima hora cheia</span>
-                </div>
-            </div>
-        </div>
-        
-        <div class="content">
-"""
+def buscar_e_processar(workers=WORKERS_PADRAO, forcar=False, baixar=None, memoria=None, estados=None,
+                       agregadores=None, motores=None, composicao=None, extras=None):
+    """Busca dados de todo o universo e gera o relatorio (veja buscar e montar_relatorio)"""
+    relatorio, dados, resultados = buscar(universo(composicao), workers, forcar, baixar, memoria, estados, agregadores)
+    return montar_relatorio(relatorio, dados, resultados, motores, composicao, extras)
+
+def partes_html(relatorio, indice_historico=None):
+    """Gera o HTML com design profissional e gráficos interativos, como lista de partes.
+
+    Com `indice_historico` (retorno de historico.gravar) o HTML leva só as tabelas e cada
+    gráfico é buscado em data/historico/ quando aberto. Sem ele, o histórico compacto vai
+    embutido no próprio HTML (arquivo único, funciona offline ou anexado em email).
+    """
+    if indice_historico is not None:
+        urls = {ativo: historico.DIR_HISTORICO.replace(os.sep, "/") + "/" + item["arquivo"] + "?v=" + item["hash"]
+                for ativo, item in indice_historico.items()}
+        embutido = {}
+    else:
+        urls = {}
+        embutido = {ativo: historico.codificar(ativo, serie)
+                    for ativo, serie in relatorio.get("historico", {}).items()}
     
-    for carteira, dados in relatorio.get("carteiras", {}).items():
-        if not dados:
-            continue
-        
-        html += '<div class="section">\n'
-        html += '<h2>' + carteira + '</h2>\n'
-        html += '<table>\n'
-        html += '<thead><tr>'
-        html += '<th>Ativo</th>'
-        html += '<th>Fechamento</th>'
-        html += '<th>SMA17</th>'
-        html += '<th>SMA72</th>'
-        html += '<th>Mín (5y)</th>'
-        html += '<th>Máx (5y)</th>'
-        html += '<th>Último Cruzamento</th>'
-        html += '<th>Sinal</th>'
-        html += '</tr></thead>\n'
-        html += '<tbody>\n'
-        
-        for item in dados:
-            cls = "compra" if "COMPRA" in item["Sinal"] else ("venda" if "VENDA" in item["Sinal"] else "neutro")
-            ativo = item['Ativo']
-            
-            html += '<tr>'
-            html += '<td><span class="ativo-link" onclick="abrirGrafico(\'' + ativo + '\')">' + ativo + '</span></td>'
-            html += '<td>R$ ' + str(item['Fechamento']) + '</td>'
-            html += '<td>' + str(item['SMA17']) + '</td>'
-            html += '<td>' + str(item['SMA72']) + '</td>'
-            html += '<td>R$ ' + str(item['Min (5y)']) + '</td>'
-            html += '<td>R$ ' + str(item['Max (5y)']) + '</td>'
-            html += '<td>' + str(item.get('Último Cruzamento', 'N/A')) + '</td>'
-            html += '<td><span class="sinal ' + cls + '">' + item['Sinal'] + '</span></td>'
-            html += '</tr>\n'
-        
-        html += '</tbody>\n'
-        html += '</table>\n'
-        html += '</div>\n'
+    return renderizador.relatorio_html(relatorio, agora().strftime("%d/%m/%Y %H:%M:%S BRT"), urls, embutido)
+
+def gerar_html_simples(relatorio, indice_historico=None):
+    """Gera o HTML do relatório como uma única string (veja partes_html)"""
+    return "".join(partes_html(relatorio, indice_historico))
+
+
+def gravar_saidas(relatorio, html_embutido=False, composicao=None):
+    """Grava current-analysis.json, o histórico dos gráficos e o HTML.
+
+    Cada arquivo é escrito em um temporário e renomeado, então quem lê (o navegador,
+    o commit do workflow ou o modo serviço no meio de uma rodada) nunca vê um arquivo pela metade.
+    """
+    execucao = metricas.atual()
+    # Cada gravação é uma versão nova do feed de deltas (veja delta.py)
+    estado = delta.carregar_estado()
+    relatorio["versao"] = delta.proxima_versao(estado)
     
-    html += """
-        </div>
-        
-        <div class="footer">
-            <p><strong>Método:</strong> Análise técnica baseada em Médias Móveis Simples (SMA)</p>
-            <p><strong>Sinal COMPRA:</strong> SMA17 acima de SMA72 | <strong>Sinal VENDA:</strong> SMA17 abaixo de SMA72</p>
-            <p style="margin-top: 15px; color: #999; font-size: 0.85em;">Sistema automatizado - Atualização horária - Dados do Yahoo Finance</p>
-        </div>
-    </div>
-    
-    <div id="chartModal" class="modal">
-        <div class="modal-content">
-            <div class="modal-header">
-                <h2 id="modalTitle">Gráfico</h2>
-                <button class="close-btn" onclick="fecharGrafico()">Fechar</button>
-            </div>
-            <div class="chart-container">
-                <canvas id="myChart"></canvas>
-            </div>
-        </div>
-    </div>
-    
-    <script>
-        const historico = """ + json.dumps(relatorio.get("historico", {})) + """;
-        
-        function abrirGrafico(ativo) {
-            if (!historico[ativo]) {
-                alert('Dados não disponíveis para ' + ativo);
-                return;
-            }
-            
-            document.getElementById('modalTitle').textContent = 'Gráfico - ' + ativo;
-            document.getElementById('chartModal').style.display = 'block';
-            
-            const dados = historico[ativo];
-            const ctx = document.getElementById('myChart').getContext('2d');
-            
-            if (window.currentChart instanceof Chart) {
-                window.currentChart.destroy();
-            }
-            
-            window.currentChart = new Chart(ctx, {
-                type: 'line',
-                data: {
-                    labels: dados.datas,
-                    datasets: [
-                        {
-                            label: 'Preço de Fechamento',
-                            data: dados.precos,
-                            borderColor: '#2a5298',
-                            backgroundColor: 'rgba(42, 82, 152, 0.1)',
-                            borderWidth: 2,
-                            fill: true,
-                            tension: 0.3,
-                            pointRadius: 2,
-                            pointHoverRadius: 5
-                        },
-                        {
-                            label: 'SMA17 (Curto Prazo)',
-                            data: dados.sma17,
-                            borderColor: '#ffc107',
-                            backgroundColor: 'transparent',
-                            borderWidth: 2,
-                            fill: false,
-                            tension: 0.3,
-                            pointRadius: 1
-                        },
-                        {
-                            label: 'SMA72 (Longo Prazo)',
-                            data: dados.sma72,
-                            borderColor: '#dc3545',
-                            backgroundColor: 'transparent',
-                            borderWidth: 2,
-                            fill: false,
-                            tension: 0.3,
-                            pointRadius: 1
-                        }
-                    ]
-                },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    interaction: { mode: 'index', intersect: false },
-                    plugins: {
-                        legend: {
-                            display: true,
-                            position: 'top',
-                            labels: { padding: 15, font: { size: 11 } }
-                        },
-                        title: {
-                            display: true,
-                            text: 'Análise de Preço e Médias Móveis - Últimos 365 dias'
-                        }
-                    },
-                    scales: {
-                        y: {
-                            beginAtZero: false,
-                            grid: { color: 'rgba(0, 0, 0, 0.05)' }
-                        },
-                        x: {
-                            grid: { color: 'rgba(0, 0, 0, 0.05)' },
-                            maxTicksLimit: 10
-                        }
-                    }
-                }
-            });
-        }
-        
-        function fecharGrafico() {
-            document.getElementById('chartModal').style.display = 'none';
-        }
-        
-        window.onclick = function(event) {
-            const modal = document.getElementById('chartModal');
-            if (event.target === modal) {
-                modal.style.display = 'none';
-            }
-        }
-    </script>
-</body>
-</html>
-"""
+    # Salvar JSON: resumo em current-analysis.json, gráficos em um arquivo compacto por ativo
+    os.makedirs("data", exist_ok=True)
+    with execucao.etapa("json"):
+        resumo = {chave: valor for chave, valor in relatorio.items() if chave != "historico"}
+        with open("data/current-analysis.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(resumo, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace("data/current-analysis.json.tmp", "data/current-analysis.json")
+    execucao.tamanho("json", "data/current-analysis.json")
+    print("[OK] Dados salvos em data/current-analysis.json")
+    anteriores = {}
+    with execucao.etapa("historico"):
+        indice = historico.gravar(relatorio.get("historico", {}), anteriores=anteriores)
+    execucao.tamanho("historico", historico.DIR_HISTORICO)
+    print("[OK] Historico salvo em " + historico.DIR_HISTORICO)
+    
+    # Gerar HTML
+    with execucao.etapa("html"):
+        partes = partes_html(relatorio, None if html_embutido else indice)
+        renderizador.gravar("relatorio_monitor.html", partes)
+    execucao.tamanho("html", "relatorio_monitor.html")
+    print("[OK] HTML gerado em relatorio_monitor.html")
+    
+    # Delta desde a versão anterior e manifest, depois do snapshot e do histórico já gravados
+    try:
+        with execucao.etapa("delta"):
+            mudancas = delta.publicar(relatorio, relatorio["versao"], anteriores, estado)
+        caminho = os.path.join(delta.DIR_DELTAS, "%d.json" % relatorio["versao"])
+        if os.path.exists(caminho):
+            execucao.tamanho("delta", caminho)
+            print("[OK] Delta v%d: %d linhas e %d historicos alterados" % (
+                relatorio["versao"], sum(len(linhas) for linhas in mudancas["linhas"].values()), len(mudancas["historico"])))
+        else:
+            print("[OK] Versao %d publicada so com o snapshot completo" % relatorio["versao"])
+    except Exception as e:
+        print("[AVISO] Falha ao gravar o delta: " + str(e)[:80])
+    
+    # Uma foto por ativo no log de sinais (só acrescenta; pregões antigos são compactados)
+    try:
+        with execucao.etapa("log_sinais"):
+            log_sinais.registrar(relatorio)
+        print("[OK] Sinais registrados em " + log_sinais.ARQUIVO)
+    except Exception as e:
+        print("[AVISO] Falha ao gravar o log de sinais: " + str(e)[:80])
     
-    return html.replace("{TIMESTAMP}", agora().strftime("%d/%m/%Y %H:%M:%S BRT"))
+    # Fechamentos diários do cache na matriz compartilhada com backtest, varredura e pesquisa
+    try:
+        with execucao.etapa("matriz"):
+            ativos = universo(composicao)
+            mudancas = matriz_precos.atualizar_do_cache(ativos + cambio.auxiliares(ativos))
+        print("[OK] Matriz de precos: %(acrescentados)d pregoes novos, %(regravados)d celulas regravadas" % mudancas)
+    except Exception as e:
+        print("[AVISO] Falha ao atualizar a matriz de precos: " + str(e)[:80])
 
+def gravar_metricas(execucao, status, prometheus_arquivo=None):
+    """Acrescenta a execução em data/metrics/ (veja metricas.py); uma falha aqui não derruba a execução"""
+    try:
+        resumo = metricas.gravar(execucao, status, prometheus_arquivo=prometheus_arquivo)
+        print("[TEMPO] Execucao: %.2fs (%s) - metricas em %s" % (resumo["duracao_s"], status, metricas.DIR_METRICAS))
+        return resumo
+    except Exception as e:
+        print("[AVISO] Falha ao gravar as metricas: " + str(e)[:80])
+        return None
 
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    if args.comparar_download:
+        comparar_download()
+        return 0
+    if args.provedor:
+        provedores.configurar(args.provedor)
+    composicao = carteiras.carregar(args.carteiras) if args.carteiras else CARTEIRAS
+    extras = carteiras.carregar_indicadores(args.indicadores) if args.indicadores else INDICADORES
+    if args.serve:
+        import servidor
+        return servidor.servir(args.workers, args.html_embutido, args.porta, args.intradiario, composicao, extras)
+    
+    comando = "shard %d/%d" % args.shard if args.shard else ("juntar %d" % args.juntar if args.juntar else "completo")
+    execucao = metricas.nova(comando, agora())
+    status = "falha"
     try:
-        # Processar dados
-        relatorio = buscar_e_processar()
+        # Processar dados: o universo inteiro, uma fatia (--shard) ou a junção das fatias (--juntar)
+        if args.shard:
+            import shards
+            saida = shards.executar(*args.shard, args.workers, args.forcar, args.intradiario, composicao)
+            execucao.registrar_erros(saida["erros"])
+            status = "shard"
+            return 0
+        if args.juntar:
+            import shards
+            relatorio = shards.juntar(args.juntar, composicao, extras)
+        else:
+            relatorio = buscar_e_processar(args.workers, args.forcar, agregadores={} if args.intradiario else None,
+                                           composicao=composicao, extras=extras)
+        execucao.registrar_erros(relatorio.get("erros", []))
         
-        # Salvar JSON
-        os.makedirs("data", exist_ok=True)
-        with open("data/current-analysis.json", "w", encoding="utf-8") as f:
-            json.dump(relatorio, f, ensure_ascii=False, indent=2)
-        print("[OK] Dados salvos em data/current-analysis.json")
+        # Alerta diário por email (a partir das 19h, só cruzamentos ainda não enviados)
+        import alertas
+        with execucao.etapa("alertas"):
+            alertas.processar(relatorio)
         
-        # Gerar HTML
-        html = gerar_html_simples(relatorio)
-        with open("relatorio_monitor.html", "w", encoding="utf-8") as f:
-            f.write(html)
-        print("[OK] HTML gerado em relatorio_monitor.html")
+        # Nada mudou (mesmos pregões e mesmos sinais): não regrava nem gera commit
+        if not args.forcar and relatorio["fingerprint"] == impressao_anterior():
+            print("[INFO] Sem mudancas desde a ultima execucao - nenhum arquivo gravado")
+            status = "sem_mudancas"
+            return 0
         
+        gravar_saidas(relatorio, args.html_embutido, composicao)
+        status = "ok"
         print("[SUCESSO] Finalizacao - " + agora().strftime('%d/%m/%Y %H:%M:%S BRT'))
         return 0
         
@@ -605,6 +685,39 @@ def main():
         import traceback
         traceback.print_exc()
         return 1
+    finally:
+        gravar_metricas(execucao, status, args.prometheus)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="VIGILANTE - Monitor de SMA17/SMA72")
+    parser.add_argument("--comparar-download", action="store_true",
+                        help="mede o download em lote contra o download ativo por ativo e sai")
+    parser.add_argument("--forcar", action="store_true",
+                        help="baixa todos os ativos e grava os arquivos mesmo sem mudancas ou com mercado fechado")
+    parser.add_argument("--html-embutido", action="store_true",
+                        help="embute o historico dos graficos no HTML (arquivo unico, para uso offline)")
+    parser.add_argument("--workers", type=int, default=WORKERS_PADRAO,
+                        help="threads do pool de download/indicadores (padrao: %(default)s)")
+    parser.add_argument("--intradiario", action="store_true",
+                        help="barras de 15 min: sinal de 60 min e cruzamento provisorio com o pregao de hoje")
+    parser.add_argument("--serve", action="store_true",
+                        help="modo servico: processo continuo com agenda por classe de ativo e endpoint de saude")
+    parser.add_argument("--porta", type=int, default=8765,
+                        help="porta do endpoint /health e /metrics do modo servico (padrao: %(default)s)")
+    parser.add_argument("--provedor", metavar="NOME",
+                        help="fonte das cotacoes: yahoo ou fixtures:<diretorio> (padrao: $VIGILANTE_PROVEDOR ou yahoo)")
+    parser.add_argument("--carteiras", metavar="ARQUIVO",
+                        help="CSV carteira,ativo com o universo monitorado (padrao: carteiras.csv)")
+    parser.add_argument("--indicadores", metavar="ARQUIVO",
+                        help="CSV carteira,indicadores com os indicadores extras de cada carteira (padrao: indicadores.csv)")
+    parser.add_argument("--prometheus", metavar="ARQUIVO",
+                        help="grava tambem as metricas da execucao no formato texto do Prometheus (textfile collector)")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument("--shard", type=carteiras.ler_shard, metavar="i/N",
+                       help="processa so a fatia i de N do universo e grava em data/shards/ (sem relatorio)")
+    grupo.add_argument("--juntar", type=int, metavar="N",
+                       help="monta o relatorio a partir dos N shards gravados em data/shards/")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
     sys.exit(main())
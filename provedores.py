@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Provedores de cotacoes e camada de resiliencia do download
+Todo download passa por um Provedor (baixar(ativos, inicio, periodo, intervalo)
+-> {ativo: DataFrame OHLCV}) embrulhado em Resiliente, que acrescenta:
+
+    - balde de fichas (uma ficha por ativo pedido) para nao estourar o limite do Yahoo;
+    - novas tentativas so dos ativos que faltaram, com espera exponencial sorteada;
+    - disjuntor: depois de varias falhas seguidas o provedor fica em repouso e as
+      chamadas voltam vazias na hora (o monitor usa o cache local, marcado como defasado).
+
+Provedores:
+    yahoo              yfinance (padrao)
+    fixtures:<dir>     provedor falso, sem rede, que serve arquivos gravados no formato
+                       do cache (data/cache); so tem barras diarias
+
+Escolha com monitor.py --provedor ou VIGILANTE_PROVEDOR. Para gravar fixtures:
+    python provedores.py gravar fixtures/              # baixa 5 anos do universo
+    python provedores.py gravar fixtures/ --do-cache   # copia o data/cache, sem rede
+"""
+
+import os
+import abc
+import sys
+import time
+import random
+import argparse
+import threading
+from datetime import timedelta
+
+import cache_precos
+import calendario
+
+# Balde de fichas: o yfinance faz uma requisicao por ativo de cada lote
+FICHAS_POR_SEGUNDO = 20
+CAPACIDADE_BALDE = 100
+TENTATIVAS = 3
+ESPERA_BASE = 1.0
+ESPERA_MAXIMA = 30.0
+FALHAS_PARA_ABRIR = 5
+REPOUSO_DISJUNTOR = 60.0
+
+
+class LimiteExcedido(Exception):
+    """O provedor recusou por excesso de requisicoes (HTTP 429)"""
+
+
+class Provedor(abc.ABC):
+    """Interface dos provedores de cotacoes"""
+    nome = "?"
+
+    @abc.abstractmethod
+    def baixar(self, ativos, inicio=None, periodo="5y", intervalo="1d"):
+        """{ativo: DataFrame OHLCV indexado por data} com os ativos que vieram com dados.
+
+        Sem `inicio` busca o `periodo` inteiro; com `inicio` (Timestamp) apenas a partir dele.
+        Falha da chamada inteira levanta excecao; ativos sem dados simplesmente ficam de fora.
+        """
+
+
+def yfinance():
+    """Importa o yfinance (e, com ele, o pandas) apenas na primeira vez que for preciso baixar"""
+    try:
+        import yfinance
+    except ImportError:
+        print("[ERRO] Instale: pip install yfinance pandas")
+        raise
+    return yfinance
+
+
+def separar_por_ativo(df, ativos):
+    """Separa o DataFrame do download em lote (MultiIndex ativo/campo) em um DataFrame por ativo"""
+    import pandas as pd
+    dados = {}
+    for ativo in ativos:
+        try:
+            if isinstance(df.columns, pd.MultiIndex):
+                if ativo not in df.columns.get_level_values(0):
+                    continue
+                df_ativo = df[ativo]
+            else:
+                # Download de um unico ativo vem sem MultiIndex
+                df_ativo = df
+            # Calendarios diferentes (BTC-USD negocia no fim de semana) deixam linhas vazias
+            df_ativo = df_ativo.dropna(subset=['Close'])
+            if len(df_ativo) > 0:
+                dados[ativo] = df_ativo
+        except Exception as e:
+            print("  [ERRO] " + ativo + ": " + str(e)[:80])
+    return dados
+
+
+class ProvedorYahoo(Provedor):
+    nome = "yahoo"
+
+    # yf.download guarda o resultado em variaveis globais do modulo: dois downloads
+    # simultaneos se atropelam. O paralelismo de rede fica com threads=True do proprio yfinance.
+    _trava = threading.Lock()
+
+    def baixar(self, ativos, inicio=None, periodo="5y", intervalo="1d"):
+        yf = yfinance()
+        with self._trava:
+            if inicio is None:
+                df = yf.download(ativos, period=periodo, interval=intervalo, group_by="ticker",
+                                 threads=True, progress=False)
+            else:
+                df = yf.download(ativos, start=inicio.strftime('%Y-%m-%d'), interval=intervalo,
+                                 group_by="ticker", threads=True, progress=False)
+            # O yfinance nao levanta os erros de cada ativo, so os guarda em shared._ERRORS
+            erros = dict(getattr(getattr(yf, "shared", None), "_ERRORS", None) or {})
+        dados = separar_por_ativo(df, ativos) if df is not None else {}
+        if not dados and erros and all("rate limit" in str(erro).lower() or "too many requests" in str(erro).lower()
+                                       for erro in erros.values()):
+            raise LimiteExcedido("Yahoo: excesso de requisicoes")
+        return dados
+
+
+def _limite_periodo(ultimo, periodo):
+    """Primeiro dia de um periodo do yfinance ('5y', '1mo', '5d') terminando em `ultimo`"""
+    quantidade = int(periodo.rstrip("ymod"))
+    if periodo.endswith("y"):
+        return calendario.anos_antes(ultimo, quantidade)
+    return ultimo - timedelta(days=quantidade * (30 if periodo.endswith("mo") else 1))
+
+
+class ProvedorFixtures(Provedor):
+    """Provedor falso, sem rede: serve os arquivos de `diretorio` (formato do cache de precos).
+
+    `roteiro` injeta falhas, uma entrada por chamada: None (normal), uma excecao a levantar
+    ou um conjunto de ativos a omitir da resposta. `chamadas` registra os ativos pedidos.
+    """
+    nome = "fixtures"
+
+    def __init__(self, diretorio, roteiro=None):
+        self.diretorio = diretorio
+        self.roteiro = list(roteiro or [])
+        self.chamadas = []
+        self._trava = threading.Lock()
+
+    def baixar(self, ativos, inicio=None, periodo="5y", intervalo="1d"):
+        with self._trava:
+            self.chamadas.append(list(ativos))
+            passo = self.roteiro.pop(0) if self.roteiro else None
+        if isinstance(passo, Exception):
+            raise passo
+        if intervalo != "1d":
+            return {}
+        dados = {}
+        for ativo in ativos:
+            df = None if passo and ativo in passo else cache_precos.carregar(ativo, self.diretorio)
+            if df is None or len(df) == 0:
+                continue
+            desde = inicio if inicio is not None else _limite_periodo(df.index[-1], periodo)
+            df = df[df.index >= desde]
+            if len(df):
+                dados[ativo] = df
+        return dados
+
+
+class BaldeDeFichas:
+    """Limitador de taxa: `taxa` fichas por segundo, acumulando ate `capacidade`.
+
+    Quem pede mais fichas do que ha fica devendo e espera o tempo de repor a divida, na
+    ordem dos pedidos; pedidos maiores que a capacidade custam a capacidade.
+    """
+
+    def __init__(self, taxa=FICHAS_POR_SEGUNDO, capacidade=CAPACIDADE_BALDE, relogio=time.monotonic, dormir=time.sleep):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.relogio = relogio
+        self.dormir = dormir
+        self.fichas = float(capacidade)
+        self.instante = relogio()
+        self._trava = threading.Lock()
+
+    def retirar(self, quantidade=1):
+        """Consome `quantidade` fichas, esperando se preciso. Retorna a espera em segundos"""
+        with self._trava:
+            agora = self.relogio()
+            self.fichas = min(self.capacidade, self.fichas + (agora - self.instante) * self.taxa)
+            self.instante = agora
+            self.fichas -= min(quantidade, self.capacidade)
+            espera = max(0.0, -self.fichas / self.taxa)
+        if espera:
+            self.dormir(espera)
+        return espera
+
+
+class Disjuntor:
+    """Fechado ate `limite` falhas seguidas; entao aberto (recusa tudo) por `repouso` segundos e
+    meio aberto: uma unica chamada de teste passa, e o resultado dela fecha ou reabre o circuito."""
+
+    def __init__(self, limite=FALHAS_PARA_ABRIR, repouso=REPOUSO_DISJUNTOR, relogio=time.monotonic):
+        self.limite = limite
+        self.repouso = repouso
+        self.relogio = relogio
+        self.estado = "fechado"
+        self.falhas = 0
+        self.reabre = None
+        self._trava = threading.Lock()
+
+    def permitir(self):
+        with self._trava:
+            if self.estado == "aberto" and self.relogio() >= self.reabre:
+                self.estado = "meio aberto"
+                return True
+            return self.estado == "fechado"
+
+    def sucesso(self):
+        with self._trava:
+            self.estado = "fechado"
+            self.falhas = 0
+
+    def falha(self):
+        with self._trava:
+            self.falhas += 1
+            if self.estado == "meio aberto" or self.falhas >= self.limite:
+                self.estado = "aberto"
+                self.reabre = self.relogio() + self.repouso
+
+
+class Resiliente(Provedor):
+    """Provedor com balde de fichas, novas tentativas com espera sorteada e disjuntor.
+
+    Nunca levanta excecao: devolve o que conseguiu baixar (talvez nada) e quem chama
+    decide o que fazer com os ativos que faltaram.
+    """
+
+    def __init__(self, provedor, balde=None, disjuntor=None, tentativas=TENTATIVAS,
+                 espera_base=ESPERA_BASE, espera_maxima=ESPERA_MAXIMA, dormir=time.sleep, sorteio=random.uniform):
+        self.provedor = provedor
+        self.nome = provedor.nome
+        self.balde = balde or BaldeDeFichas()
+        self.disjuntor = disjuntor or Disjuntor()
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.dormir = dormir
+        self.sorteio = sorteio
+
+    def espera(self, tentativa):
+        """Espera antes da `tentativa` (1 = primeira repeticao): sorteada entre 0 e o teto exponencial"""
+        return self.sorteio(0, min(self.espera_maxima, self.espera_base * 2 ** (tentativa - 1)))
+
+    def baixar(self, ativos, inicio=None, periodo="5y", intervalo="1d"):
+        dados = {}
+        faltando = list(ativos)
+        for tentativa in range(self.tentativas):
+            if tentativa:
+                print("[AVISO] %s: %d ativo(s) sem dados, tentativa %d de %d"
+                      % (self.nome, len(faltando), tentativa + 1, self.tentativas))
+                self.dormir(self.espera(tentativa))
+            if not self.disjuntor.permitir():
+                print("[AVISO] %s: disjuntor aberto, %d ativo(s) ficam com o cache local" % (self.nome, len(faltando)))
+                break
+            self.balde.retirar(len(faltando))
+            try:
+                novos = self.provedor.baixar(faltando, inicio, periodo, intervalo)
+            except Exception as e:
+                print("[ERRO] Download em lote (%s): %s" % (self.nome, str(e)[:80]))
+                self.disjuntor.falha()
+                continue
+            # O provedor respondeu: ativos que faltaram nao contam contra o disjuntor
+            self.disjuntor.sucesso()
+            dados.update(novos)
+            faltando = [ativo for ativo in faltando if ativo not in dados]
+            if not faltando:
+                break
+        return dados
+
+
+def criar(especificacao):
+    """Provedor a partir de 'yahoo' ou 'fixtures:<diretorio>'"""
+    nome, _, argumento = especificacao.partition(":")
+    if nome == "yahoo":
+        return ProvedorYahoo()
+    if nome == "fixtures" and argumento:
+        return ProvedorFixtures(argumento)
+    raise ValueError("provedor desconhecido: %s (use yahoo ou fixtures:<diretorio>)" % especificacao)
+
+
+_atual = None
+_trava_atual = threading.Lock()
+
+
+def configurar(especificacao_ou_provedor):
+    """Troca o provedor do processo (especificacao de `criar` ou um Provedor pronto)"""
+    global _atual
+    provedor = especificacao_ou_provedor
+    if isinstance(provedor, str):
+        provedor = criar(provedor)
+    with _trava_atual:
+        _atual = provedor if isinstance(provedor, Resiliente) else Resiliente(provedor)
+    return _atual
+
+
+def atual():
+    """Provedor resiliente do processo; o padrao vem de VIGILANTE_PROVEDOR (ou yahoo)"""
+    with _trava_atual:
+        if _atual is not None:
+            return _atual
+    return configurar(os.getenv("VIGILANTE_PROVEDOR", "yahoo"))
+
+
+def gravar_fixtures(ativos, diretorio, do_cache=False):
+    """Grava fixtures de `ativos` em `diretorio`: copia do cache local ou 5 anos baixados do Yahoo"""
+    if do_cache:
+        dados = {ativo: cache_precos.carregar(ativo) for ativo in ativos}
+        dados = {ativo: df for ativo, df in dados.items() if df is not None}
+    else:
+        dados = Resiliente(ProvedorYahoo()).baixar(ativos)
+    for ativo, df in dados.items():
+        cache_precos.salvar(ativo, df, diretorio)
+    print("[OK] %d de %d ativos gravados em %s" % (len(dados), len(ativos), diretorio))
+    return len(dados)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="VIGILANTE - Provedores de cotacoes")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("gravar", help="grava fixtures para o provedor fixtures:<diretorio>")
+    p.add_argument("diretorio")
+    p.add_argument("ativos", nargs="*", help="padrao: todo o universo de carteiras.csv")
+    p.add_argument("--do-cache", action="store_true", help="copia o data/cache em vez de baixar")
+    args = parser.parse_args(argv)
+    try:
+        import monitor
+        gravar_fixtures(args.ativos or monitor.universo(), args.diretorio, args.do_cache)
+        return 0
+    except Exception as e:
+        print("[ERRO FATAL]:", str(e))
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
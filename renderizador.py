@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Renderizacao do relatorio HTML
+Os trechos de HTML ficam em templates/ com campos no formato $campo
+(string.Template). Cada template e lido e quebrado em partes fixas e campos
+uma unica vez por processo; renderizar so intercala os valores ja escapados
+em uma lista de partes, unida (ou gravada) no final.
+"""
+
+import os
+import json
+import html
+from functools import lru_cache
+from string import Template
+
+DIR_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+# Simbolo da moeda de cotacao de cada ativo (coluna "Moeda" das linhas, veja cambio.moeda)
+SIMBOLOS = {"BRL": "R$", "USD": "US$"}
+
+
+class Seguro(str):
+    """Texto que ja e HTML/JS valido e nao deve ser escapado"""
+
+
+def escapar(valor):
+    if isinstance(valor, Seguro):
+        return valor
+    return html.escape(str(valor))
+
+
+def json_script(valor, **kwargs):
+    """JSON para dentro de <script>: impede que um '</script>' nos dados feche a tag"""
+    return Seguro(json.dumps(valor, **kwargs).replace("</", "<\\/"))
+
+
+class Modelo:
+    """Template $campo pre-compilado em uma sequencia de textos fixos e nomes de campos"""
+
+    def __init__(self, texto):
+        self.partes = []
+        inicio = 0
+        for m in Template.pattern.finditer(texto):
+            fixo = texto[inicio:m.start()]
+            if m.group("escaped") is not None:
+                fixo += "$"
+            self._texto(fixo)
+            nome = m.group("named") or m.group("braced")
+            if nome:
+                self.partes.append((nome,))
+            elif m.group("invalid") is not None:
+                raise ValueError("Campo invalido no template na posicao %d" % m.start())
+            inicio = m.end()
+        self._texto(texto[inicio:])
+
+    def _texto(self, fixo):
+        if not fixo:
+            return
+        if self.partes and isinstance(self.partes[-1], str):
+            self.partes[-1] += fixo
+        else:
+            self.partes.append(fixo)
+
+    def renderizar(self, saida, **valores):
+        """Acrescenta o template preenchido em `saida` (lista de str), escapando os valores.
+
+        Um valor do tipo lista e tratado como partes ja renderizadas e entra sem copia.
+        """
+        for parte in self.partes:
+            if isinstance(parte, str):
+                saida.append(parte)
+                continue
+            valor = valores[parte[0]]
+            if isinstance(valor, list):
+                saida.extend(valor)
+            else:
+                saida.append(escapar(valor))
+        return saida
+
+
+@lru_cache(maxsize=None)
+def modelo(nome):
+    """Template de templates/<nome>.html, compilado uma vez por processo"""
+    with open(os.path.join(DIR_TEMPLATES, nome + ".html"), encoding="utf-8") as f:
+        return Modelo(f.read())
+
+
+def _classe_sinal(sinal):
+    return "compra" if "COMPRA" in sinal else ("venda" if "VENDA" in sinal else "neutro")
+
+
+def _horario(momento):
+    """'AAAA-MM-DDTHH:MM' -> 'DD/MM HH:MM'"""
+    if not momento:
+        return "N/A"
+    return "%s/%s %s" % (momento[8:10], momento[5:7], momento[11:16])
+
+
+def _numero(valor):
+    return "N/A" if valor is None else valor
+
+
+def _em_reais(modelo_brl, item, chave):
+    """Partes com o valor em reais de um ativo cotado em dolar (vazio para ativos em reais)"""
+    valor = item.get(chave + " BRL")
+    return modelo_brl.renderizar([], valor=valor) if valor is not None else ""
+
+
+def relatorio_html(relatorio, timestamp, historico_urls, historico_embutido):
+    """Lista de partes do relatorio_monitor.html (use "".join ou gravar)"""
+    conteudo = []
+    linha_ativo = modelo("linha_ativo")
+    fim_tabela = modelo("fim_tabela")
+
+    analise = relatorio.get("analise_carteiras")
+    if analise:
+        modelo("resumo_carteiras").renderizar(conteudo)
+        linha_resumo = modelo("linha_resumo_carteira")
+        for carteira, item in analise.items():
+            linha_resumo.renderizar(
+                conteudo,
+                carteira=carteira,
+                ativos=item["ativos"],
+                amplitude=_numero(item["amplitude"]),
+                indice=item["indice"],
+                retorno_1m=_numero(item["retorno_1m"]),
+                retorno_1a=_numero(item["retorno_1a"]),
+                queda_do_topo=_numero(item["queda_do_topo"]),
+                correlacao_media=_numero(item["correlacao_media"]),
+                dist_min=_numero(item["dist_min"]),
+                dist_max=_numero(item["dist_max"]),
+            )
+        fim_tabela.renderizar(conteudo)
+
+    # Ativos em dolar: valor nativo com US$ e, abaixo, o equivalente em reais (veja cambio.py)
+    valor_brl = modelo("valor_brl")
+    coluna_indicador = modelo("coluna_indicador")
+    celula_indicador = modelo("celula_indicador")
+    for carteira, dados in relatorio.get("carteiras", {}).items():
+        if not dados:
+            continue
+        # Indicadores extras escolhidos para a carteira (indicadores.csv), depois do ultimo cruzamento
+        extras = relatorio.get("indicadores", {}).get(carteira, [])
+        colunas = []
+        for coluna in extras:
+            coluna_indicador.renderizar(colunas, coluna=coluna)
+        modelo("carteira").renderizar(conteudo, carteira=carteira, colunas=colunas)
+        for item in dados:
+            celulas = []
+            for coluna in extras:
+                celula_indicador.renderizar(celulas, valor=_numero(item.get(coluna)))
+            linha_ativo.renderizar(
+                conteudo,
+                ativo=item["Ativo"],
+                ativo_js=json.dumps(item["Ativo"]),
+                moeda=SIMBOLOS.get(item.get("Moeda"), "R$"),
+                fechamento=item["Fechamento"],
+                fechamento_brl=_em_reais(valor_brl, item, "Fechamento"),
+                defasado=" (cache)" if item.get("Defasado") else "",
+                sma17=item["SMA17"],
+                sma17_brl=_em_reais(valor_brl, item, "SMA17"),
+                sma72=item["SMA72"],
+                sma72_brl=_em_reais(valor_brl, item, "SMA72"),
+                min5y=item["Min (5y)"],
+                min5y_brl=_em_reais(valor_brl, item, "Min (5y)"),
+                max5y=item["Max (5y)"],
+                max5y_brl=_em_reais(valor_brl, item, "Max (5y)"),
+                ultimo_cruzamento=item.get("Último Cruzamento", "N/A") + (" (provisório)" if item.get("Cruzamento Provisório") else ""),
+                indicadores=celulas,
+                classe=_classe_sinal(item["Sinal"]),
+                sinal=item["Sinal"],
+            )
+        fim_tabela.renderizar(conteudo)
+
+    intradiario = relatorio.get("intradiario")
+    if intradiario:
+        modelo("intradiario").renderizar(conteudo, timeframe=next(iter(intradiario.values()))["timeframe"])
+        linha_intradiario = modelo("linha_intradiario")
+        for ativo, item in intradiario.items():
+            linha_intradiario.renderizar(
+                conteudo,
+                ativo=ativo,
+                barra=_horario(item["barra"]),
+                fechamento=_numero(item["fechamento"]),
+                sma17=_numero(item["sma17"]),
+                sma72=_numero(item["sma72"]),
+                ultimo_cruzamento=_horario(item["ultimo_cruzamento"]),
+                classe=_classe_sinal(item["sinal"]),
+                sinal=item["sinal"],
+            )
+        fim_tabela.renderizar(conteudo)
+
+    erros = relatorio.get("erros", [])
+    if erros:
+        modelo("erros").renderizar(conteudo)
+        for erro in erros:
+            modelo("linha_erro").renderizar(conteudo, **erro)
+        fim_tabela.renderizar(conteudo)
+
+    cambio = []
+    if relatorio.get("cambio"):
+        item = relatorio["cambio"]
+        modelo("cambio").renderizar(cambio, par=item["par"], cotacao="%.4f" % item["cotacao"],
+                                    data="/".join(reversed(item["data"].split("-"))))
+
+    return modelo("relatorio").renderizar(
+        [],
+        timestamp=timestamp,
+        cambio=cambio,
+        conteudo=conteudo,
+        historico_urls=json_script(historico_urls),
+        historico_embutido=json_script(historico_embutido, separators=(",", ":")),
+    )
+
+
+def gravar(caminho, partes):
+    """Grava as partes direto no arquivo, sem montar uma string unica.
+
+    A escrita vai para um temporario renomeado no final, para que o HTML publicado
+    nunca fique pela metade.
+    """
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        f.writelines(partes)
+    os.replace(temporario, caminho)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Modo servico (python monitor.py --serve)
+Mantem o processo vivo em vez de pagar a partida a frio do Python (importar
+pandas/yfinance, ler o cache) a cada execucao do cron. Precos, estado das
+medias e o motor dos indicadores extras ficam em memoria entre as rodadas; cada classe de ativo e atualizada na
+sua propria cadencia, apenas com o mercado aberto (veja calendario.py).
+
+Endpoints locais (JSON):
+    GET /health   200 se o laco da agenda esta vivo e a ultima rodada foi bem sucedida,
+                  503 caso contrario (com os mercados fechados o laco segue sem rodadas)
+    GET /metrics  contadores e tempos das rodadas e as metricas da ultima rodada;
+                  /metrics?formato=prometheus devolve o mesmo no formato texto do Prometheus
+
+Cada rodada tambem vai para data/metrics/ como uma execucao (veja metricas.py).
+"""
+
+import json
+import time
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import monitor
+import alertas
+import metricas
+import calendario
+import provedores
+
+# Intervalo minimo entre duas atualizacoes de cada classe de ativo, em segundos
+CADENCIAS = {
+    "cripto": 5 * 60,
+    "futuros": 10 * 60,
+    "b3": 10 * 60,
+}
+INTERVALO_AGENDA = 15
+PORTA_PADRAO = 8765
+
+
+class Servico:
+    """Estado do modo servico: precos, medias, agenda por classe e metricas"""
+
+    def __init__(self, workers=monitor.WORKERS_PADRAO, html_embutido=False, cadencias=CADENCIAS, intradiario=False,
+                 composicao=None, extras=None):
+        self.workers = workers
+        self.html_embutido = html_embutido
+        # Carteiras e indicadores extras (padrao: os de monitor.CARTEIRAS e monitor.INDICADORES)
+        self.composicao = monitor.CARTEIRAS if composicao is None else composicao
+        self.extras = monitor.INDICADORES if extras is None else extras
+        self.cadencias = dict(cadencias)
+        self.memoria = {}
+        self.estados = {}
+        self.motores = {}
+        self.agregadores = {} if intradiario else None
+        self.proxima = {classe: 0.0 for classe in self.cadencias}
+        self.fingerprint = monitor.impressao_anterior()
+        self.parar = threading.Event()
+        self.trava = threading.Lock()
+        self.metricas = {
+            "inicio": monitor.agora().isoformat(),
+            "rodadas": 0,
+            "rodadas_com_gravacao": 0,
+            "falhas": 0,
+            "ultima_rodada": None,
+            "ultima_gravacao": None,
+            "ultima_falha": None,
+            "duracao_ultima_rodada_s": None,
+            "ativos_baixados_ultima_rodada": 0,
+            "erros_ultima_rodada": 0,
+        }
+        self.ultima_execucao = None
+        self._ultimo_sucesso = None
+        self._ultima_falhou = False
+
+    def vencidos(self, momento, relogio):
+        """Ativos a baixar agora: classes com a cadencia vencida e mercado aberto"""
+        classes = {classe for classe, quando in self.proxima.items() if relogio >= quando}
+        ativos = [ativo for ativo in monitor.universo(self.composicao)
+                  if calendario.classe(ativo) in classes and calendario.mercado_aberto(ativo, momento)]
+        return classes, ativos
+
+    def rodada(self):
+        """Executa uma rodada se alguma classe estiver vencida. Retorna True se rodou"""
+        momento = monitor.agora()
+        relogio = time.monotonic()
+        classes, baixar = self.vencidos(momento, relogio)
+        primeira = not self.memoria
+        if not baixar and not primeira:
+            # Nada vencido ou mercados fechados: o laco esta vivo e a ultima rodada continua
+            # valendo, a menos que tenha falhado
+            with self.trava:
+                if not self._ultima_falhou:
+                    self._ultimo_sucesso = time.monotonic()
+            return False
+        for classe in classes:
+            self.proxima[classe] = relogio + self.cadencias[classe]
+
+        inicio = time.perf_counter()
+        execucao = metricas.nova("servico", momento)
+        try:
+            relatorio = monitor.buscar_e_processar(self.workers, baixar=set(baixar),
+                                                   memoria=self.memoria, estados=self.estados,
+                                                   agregadores=self.agregadores, motores=self.motores,
+                                                   composicao=self.composicao, extras=self.extras)
+            execucao.registrar_erros(relatorio.get("erros", []))
+            with execucao.etapa("alertas"):
+                alertas.processar(relatorio)
+            gravou = relatorio["fingerprint"] != self.fingerprint
+            if gravou:
+                monitor.gravar_saidas(relatorio, self.html_embutido, self.composicao)
+                self.fingerprint = relatorio["fingerprint"]
+            else:
+                print("[INFO] Sem mudancas desde a ultima rodada - nenhum arquivo gravado")
+        except Exception:
+            monitor.gravar_metricas(execucao, "falha")
+            raise
+        resumo = monitor.gravar_metricas(execucao, "ok" if gravou else "sem_mudancas")
+
+        with self.trava:
+            self.metricas["rodadas"] += 1
+            self.metricas["ultima_rodada"] = monitor.agora().isoformat()
+            self.metricas["duracao_ultima_rodada_s"] = round(time.perf_counter() - inicio, 3)
+            self.metricas["ativos_baixados_ultima_rodada"] = len(baixar)
+            self.metricas["erros_ultima_rodada"] = len(relatorio.get("erros", []))
+            if gravou:
+                self.metricas["rodadas_com_gravacao"] += 1
+                self.metricas["ultima_gravacao"] = self.metricas["ultima_rodada"]
+            self.ultima_execucao = resumo or self.ultima_execucao
+            self._ultimo_sucesso = time.monotonic()
+            self._ultima_falhou = False
+        return True
+
+    def falhou(self, erro):
+        with self.trava:
+            self._ultima_falhou = True
+            self.metricas["falhas"] += 1
+            self.metricas["ultima_falha"] = {"quando": monitor.agora().isoformat(), "erro": str(erro)[:200]}
+
+    def saude(self):
+        """(saudavel, corpo) para o /health: a ultima rodada bem sucedida (ou volta ociosa do laco
+        depois dela) nao pode estar atrasada"""
+        with self.trava:
+            limite = 3 * max(self.cadencias.values())
+            atraso = None if self._ultimo_sucesso is None else time.monotonic() - self._ultimo_sucesso
+            saudavel = atraso is not None and atraso <= limite
+            return saudavel, {
+                "status": "ok" if saudavel else ("iniciando" if atraso is None else "atrasado"),
+                "segundos_desde_ultima_rodada": None if atraso is None else round(atraso, 1),
+                "ultima_rodada": self.metricas["ultima_rodada"],
+                "ativos_em_memoria": len(self.memoria),
+            }
+
+    def instantaneo(self):
+        with self.trava:
+            metricas = dict(self.metricas)
+        relogio = time.monotonic()
+        metricas["proxima_atualizacao_s"] = {classe: max(0, round(quando - relogio, 1))
+                                            for classe, quando in self.proxima.items()}
+        provedor = provedores.atual()
+        metricas["provedor"] = {"nome": provedor.nome, "disjuntor": provedor.disjuntor.estado}
+        metricas["ultima_execucao"] = self.ultima_execucao
+        return metricas
+
+    def prometheus(self):
+        """/metrics no formato texto do Prometheus: ultima rodada e contadores do servico"""
+        with self.trava:
+            ultima = self.ultima_execucao
+            extras = {
+                "vigilante_servico_rodadas": ("Rodadas desde o inicio do servico", self.metricas["rodadas"]),
+                "vigilante_servico_falhas": ("Rodadas com falha desde o inicio do servico", self.metricas["falhas"]),
+            }
+        extras["vigilante_disjuntor_aberto"] = ("1 se o disjuntor do provedor nao estiver fechado",
+                                                int(provedores.atual().disjuntor.estado != "fechado"))
+        return metricas.prometheus(ultima, extras)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        servico = self.server.servico
+        caminho, _, consulta = self.path.partition("?")
+        tipo = "application/json; charset=utf-8"
+        if caminho == "/health":
+            saudavel, corpo = servico.saude()
+            status = 200 if saudavel else 503
+        elif caminho == "/metrics" and consulta == "formato=prometheus":
+            status, corpo = 200, servico.prometheus()
+            tipo = "text/plain; version=0.0.4; charset=utf-8"
+        elif caminho == "/metrics":
+            status, corpo = 200, servico.instantaneo()
+        else:
+            status, corpo = 404, {"erro": "use /health ou /metrics"}
+        dados = (corpo if isinstance(corpo, str) else json.dumps(corpo, ensure_ascii=False)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def iniciar_http(servico, porta=PORTA_PADRAO, host="127.0.0.1"):
+    """Sobe o endpoint /health e /metrics em uma thread separada"""
+    http = ThreadingHTTPServer((host, porta), _Handler)
+    http.servico = servico
+    threading.Thread(target=http.serve_forever, name="http-saude", daemon=True).start()
+    return http
+
+
+def servir(workers=monitor.WORKERS_PADRAO, html_embutido=False, porta=PORTA_PADRAO, intradiario=False,
+           composicao=None, extras=None):
+    """Laco principal do modo servico; termina com SIGINT/SIGTERM"""
+    servico = Servico(workers, html_embutido, intradiario=intradiario, composicao=composicao, extras=extras)
+    http = iniciar_http(servico, porta)
+    print("[SERVICO] Iniciado - /health e /metrics em http://127.0.0.1:%d" % http.server_address[1])
+
+    def encerrar(sinal, quadro):
+        print("[SERVICO] Encerrando (sinal %d)" % sinal)
+        servico.parar.set()
+
+    signal.signal(signal.SIGINT, encerrar)
+    signal.signal(signal.SIGTERM, encerrar)
+
+    while not servico.parar.is_set():
+        try:
+            servico.rodada()
+        except Exception as e:
+            print("[ERRO] Rodada do servico: " + str(e)[:80])
+            servico.falhou(e)
+        servico.parar.wait(INTERVALO_AGENDA)
+
+    http.shutdown()
+    print("[SERVICO] Finalizado - " + monitor.agora().strftime('%d/%m/%Y %H:%M:%S BRT'))
+    return 0
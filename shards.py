@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Execucao dividida em shards
+Cada shard (python monitor.py --shard i/N) baixa e processa so a sua fatia do
+universo (carteiras.fatia) e grava o resultado em data/shards/:
+
+    <i>-de-<N>.json   linhas e graficos por ativo, erros, intradiario e tempo do shard
+    <i>-de-<N>.npz    fechamentos de cada ativo (datas, closes, maximas e minimas
+                      concatenados), que os cruzamentos, a analise por carteira e os
+                      indicadores precisam para o universo todo
+
+A juncao (python monitor.py --juntar N) le os N shards, confere que cada um cobre
+exatamente a fatia esperada do universo atual e monta o relatorio como uma execucao
+normal: carteiras, cruzamentos, analise, alertas, JSON/HTML e log de sinais.
+
+Os shards podem rodar em processos da mesma maquina ou em runners diferentes (basta
+copiar data/shards/ para quem for juntar):
+    for i in 1 2 3 4; do python monitor.py --shard $i/4 & done; wait
+    python monitor.py --juntar 4
+"""
+
+import os
+import json
+import time
+
+import numpy as np
+
+import monitor
+import carteiras
+import cache_precos
+import cambio
+
+DIR_SHARDS = os.path.join("data", "shards")
+
+
+def caminho(indice, total, extensao):
+    return os.path.join(DIR_SHARDS, "%d-de-%d.%s" % (indice, total, extensao))
+
+
+def _gravar_atomico(destino, escrever, modo="w"):
+    temporario = destino + ".tmp"
+    with open(temporario, modo, **({} if "b" in modo else {"encoding": "utf-8"})) as f:
+        escrever(f)
+    os.replace(temporario, destino)
+
+
+def executar(indice, total, workers=monitor.WORKERS_PADRAO, forcar=False, intradiario=False, composicao=None):
+    """Processa a fatia `indice` de `total` do universo de `composicao` e grava o resultado do shard"""
+    universo = monitor.universo(composicao)
+    ativos = carteiras.fatia(universo, indice, total)
+    print("[SHARD] %d/%d: %d de %d ativos" % (indice, total, len(ativos), len(universo)))
+    inicio = time.perf_counter()
+    relatorio, dados, resultados = monitor.buscar(ativos, workers, forcar, agregadores={} if intradiario else None)
+    tempo = time.perf_counter() - inicio
+
+    os.makedirs(DIR_SHARDS, exist_ok=True)
+    # O cambio baixado pelo shard vai junto: a juncao converte os ativos em dolar com ele
+    salvos = [ativo for ativo in cambio.auxiliares(ativos) + ativos if ativo in dados]
+    series = [dados[ativo] for ativo in salvos]
+    _gravar_atomico(caminho(indice, total, "npz"), lambda f: np.savez(
+        f,
+        ativos=np.array(salvos),
+        tamanhos=np.array([len(serie.datas) for serie in series], dtype=np.int64),
+        datas=np.concatenate([serie.datas for serie in series]) if series else np.array([], dtype="datetime64[D]"),
+        closes=np.concatenate([serie.closes for serie in series]) if series else np.array([]),
+        # Sem maxima/minima (fonte so com fechamentos) grava o proprio fechamento
+        maximas=np.concatenate([serie.closes if serie.maximas is None else serie.maximas
+                                for serie in series]) if series else np.array([]),
+        minimas=np.concatenate([serie.closes if serie.minimas is None else serie.minimas
+                                for serie in series]) if series else np.array([]),
+    ), "wb")
+    # O JSON vai por ultimo: com ele no lugar, o .npz do mesmo shard ja esta completo
+    saida = {
+        "shard": "%d/%d" % (indice, total),
+        "timestamp": relatorio["timestamp"],
+        "tempo_s": round(tempo, 3),
+        "ativos": ativos,
+        "resultados": {ativo: resultado for ativo, resultado in resultados.items() if resultado},
+        "erros": relatorio["erros"],
+        "intradiario": relatorio.get("intradiario"),
+    }
+    _gravar_atomico(caminho(indice, total, "json"),
+                    lambda f: json.dump(saida, f, ensure_ascii=False, separators=(",", ":")))
+    print("[TEMPO] Shard %d/%d: %.2fs para %d ativos" % (indice, total, tempo, len(ativos)))
+    return saida
+
+
+def carregar(indice, total):
+    """(resultado do shard, {ativo: Fechamentos}) gravados por executar"""
+    with open(caminho(indice, total, "json"), encoding="utf-8") as f:
+        saida = json.load(f)
+    dados = {}
+    with np.load(caminho(indice, total, "npz")) as npz:
+        fim = np.cumsum(npz["tamanhos"])
+        extremos = "maximas" in npz.files
+        for ativo, ate, n in zip(npz["ativos"].tolist(), fim, npz["tamanhos"]):
+            dados[ativo] = cache_precos.Fechamentos(
+                npz["datas"][ate - n:ate], npz["closes"][ate - n:ate],
+                npz["maximas"][ate - n:ate] if extremos else None, npz["minimas"][ate - n:ate] if extremos else None)
+    return saida, dados
+
+
+def juntar(total, composicao=None, extras=None):
+    """Relatorio completo a partir dos `total` shards em data/shards/ (veja monitor.montar_relatorio)"""
+    if total < 1:
+        raise ValueError("numero de shards deve ser pelo menos 1")
+    universo = monitor.universo(composicao)
+    dados, resultados, erros, intradiario, tempos = {}, {}, [], {}, []
+    for indice in range(1, total + 1):
+        try:
+            saida, series = carregar(indice, total)
+        except FileNotFoundError:
+            raise RuntimeError("shard %d/%d ausente em %s" % (indice, total, DIR_SHARDS)) from None
+        if saida["ativos"] != carteiras.fatia(universo, indice, total):
+            raise RuntimeError("shard %d/%d foi gerado com outro universo de ativos" % (indice, total))
+        dados.update(series)
+        resultados.update((ativo, tuple(resultado)) for ativo, resultado in saida["resultados"].items())
+        erros.extend(saida["erros"])
+        intradiario.update(saida.get("intradiario") or {})
+        tempos.append({"shard": saida["shard"], "timestamp": saida["timestamp"], "tempo_s": saida["tempo_s"],
+                       "ativos": len(saida["ativos"]), "erros": len(saida["erros"])})
+        print("[TEMPO] Shard %s: %.2fs para %d ativos" % (saida["shard"], saida["tempo_s"], len(saida["ativos"])))
+
+    ordem = {ativo: i for i, ativo in enumerate(cambio.auxiliares(universo) + universo)}
+    relatorio = {
+        # O relatorio vale a partir do shard mais recente
+        "timestamp": max(tempo["timestamp"] for tempo in tempos),
+        "carteiras": {},
+        "historico": {},
+        "erros": sorted(erros, key=lambda erro: ordem[erro["ativo"]]),
+        "shards": tempos,
+    }
+    if intradiario:
+        relatorio["intradiario"] = {ativo: intradiario[ativo] for ativo in universo if ativo in intradiario}
+    return monitor.montar_relatorio(relatorio, dados, resultados, composicao=composicao, extras=extras)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""Utilitarios comuns dos testes: series OHLCV sinteticas e diretorio de trabalho isolado"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serie_ohlcv(fim="2026-10-16", dias=400, inicio_preco=50.0, semente=0, freq="B"):
+    """DataFrame OHLCV diario com passeio aleatorio de `dias` pregoes terminando em `fim`"""
+    aleatorio = np.random.default_rng(semente)
+    datas = pd.bdate_range(end=fim, periods=dias) if freq == "B" else pd.date_range(end=fim, periods=dias)
+    closes = inicio_preco * np.exp(np.cumsum(aleatorio.normal(0, 0.02, dias)))
+    return pd.DataFrame({"Open": closes, "High": closes * 1.01, "Low": closes * 0.99, "Close": closes,
+                         "Volume": np.full(dias, 1000.0)}, index=pd.DatetimeIndex(datas, name="Date"))
+
+
+@pytest.fixture
+def trabalho(tmp_path, monkeypatch):
+    """Diretorio de trabalho vazio: data/ (cache, matriz, shards...) fica isolado do repositorio"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
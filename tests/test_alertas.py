@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Alertas por email com smtplib.SMTP substituido: registro de enviados, janela diaria e conexao unica"""
+
+import json
+import socket
+from datetime import datetime
+
+import pytest
+
+import alertas
+import monitor
+
+
+class ServidorFalso:
+    """Substitui smtplib.SMTP: registra conexoes, login e mensagens"""
+    conexoes = []
+    recusar = False
+
+    def __init__(self, host, porta, timeout=None):
+        self.host, self.porta = host, porta
+        self.tls = False
+        self.login_feito = None
+        self.mensagens = []
+        ServidorFalso.conexoes.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        return False
+
+    def starttls(self):
+        self.tls = True
+
+    def login(self, usuario, senha):
+        self.login_feito = (usuario, senha)
+
+    def send_message(self, msg):
+        if self.recusar:
+            raise OSError("conexao recusada")
+        self.mensagens.append(msg)
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    ServidorFalso.conexoes = []
+    ServidorFalso.recusar = False
+    monkeypatch.setattr(alertas.smtplib, "SMTP", ServidorFalso)
+    monkeypatch.setenv("EMAIL_SENDER", "vigilante@exemplo.com")
+    monkeypatch.setenv("EMAIL_PASSWORD", "senha")
+    monkeypatch.setenv("EMAIL_RECIPIENT", "a@exemplo.com, b@exemplo.com")
+    monkeypatch.setenv("SMTP_HOST", "smtp.exemplo.com")
+    monkeypatch.setenv("SMTP_PORT", "2525")
+    monkeypatch.delenv("SMTP_STARTTLS", raising=False)
+    monkeypatch.delenv("RELATORIO_URL", raising=False)
+    return ServidorFalso
+
+
+def _sinal(ativo, data, sinal, carteira):
+    return {"ativo": ativo, "data": data, "sinal": sinal, "carteira": carteira, "preco": 10.0, "distancia": 0.01}
+
+
+def _relatorio(*sinais):
+    return {"sinais_recentes": list(sinais)}
+
+
+def _momento(dia, hora):
+    return datetime(2026, 10, dia, hora, 0, tzinfo=monitor.BRT)
+
+
+def test_um_resumo_por_conexao_para_todos_os_destinatarios(smtp, tmp_path):
+    registro = str(tmp_path / "enviados.json")
+    relatorio = _relatorio(_sinal("PETR4.SA", "2026-10-14", "COMPRA", "Carteira Ações"),
+                           _sinal("PETR4.SA", "2026-10-14", "COMPRA", "Dividendos"),
+                           _sinal("VALE3.SA", "2026-10-15", "VENDA", "Carteira Ações"))
+
+    assert alertas.processar(relatorio, _momento(16, 19), caminho=registro) == 2
+
+    assert len(smtp.conexoes) == 1
+    conexao = smtp.conexoes[0]
+    assert (conexao.host, conexao.porta, conexao.tls) == ("smtp.exemplo.com", 2525, True)
+    assert conexao.login_feito == ("vigilante@exemplo.com", "senha")
+    assert [msg["To"] for msg in conexao.mensagens] == ["a@exemplo.com", "b@exemplo.com"]
+    texto = conexao.mensagens[0].get_body(("plain",)).get_content()
+    assert "2 cruzamento(s)" in texto
+    assert "Carteira Ações, Dividendos" in texto
+
+
+def test_antes_das_19h_nao_envia(smtp, tmp_path):
+    registro = str(tmp_path / "enviados.json")
+    relatorio = _relatorio(_sinal("PETR4.SA", "2026-10-14", "COMPRA", "Carteira Ações"))
+
+    assert alertas.processar(relatorio, _momento(16, 18), caminho=registro) == 0
+    assert smtp.conexoes == []
+    assert not (tmp_path / "enviados.json").exists()
+
+
+def test_um_resumo_por_dia_e_sem_repetir_cruzamentos(smtp, tmp_path):
+    registro = str(tmp_path / "enviados.json")
+    primeiro = _sinal("PETR4.SA", "2026-10-14", "COMPRA", "Carteira Ações")
+    segundo = _sinal("VALE3.SA", "2026-10-16", "VENDA", "Carteira Ações")
+
+    assert alertas.processar(_relatorio(primeiro), _momento(16, 19), caminho=registro) == 1
+    # Mesma janela diaria: nada sai, nem com um cruzamento novo
+    assert alertas.processar(_relatorio(primeiro, segundo), _momento(16, 20), caminho=registro) == 0
+    assert len(smtp.conexoes) == 1
+
+    # Dia seguinte: so o cruzamento ainda nao enviado
+    assert alertas.processar(_relatorio(primeiro, segundo), _momento(17, 19), caminho=registro) == 1
+    assert len(smtp.conexoes) == 2
+    texto = smtp.conexoes[1].mensagens[0].get_body(("plain",)).get_content()
+    assert "VALE3.SA" in texto and "PETR4.SA" not in texto
+
+    # Tudo ja enviado: nenhuma conexao
+    assert alertas.processar(_relatorio(primeiro, segundo), _momento(18, 19), caminho=registro) == 0
+    assert len(smtp.conexoes) == 2
+
+    with open(registro, encoding="utf-8") as f:
+        gravado = json.load(f)
+    assert gravado["ultimo_envio"] == "2026-10-17"
+    assert set(gravado["enviados"]) == {alertas.chave(primeiro), alertas.chave(segundo)}
+
+
+def test_falha_no_envio_nao_marca_como_enviado(smtp, tmp_path):
+    registro = str(tmp_path / "enviados.json")
+    sinal = _sinal("PETR4.SA", "2026-10-14", "COMPRA", "Carteira Ações")
+
+    smtp.recusar = True
+    assert alertas.processar(_relatorio(sinal), _momento(16, 19), caminho=registro) == 0
+    assert alertas.carregar_registro(registro) == {"ultimo_envio": None, "enviados": {}}
+
+    # A janela do dia continua aberta: a proxima execucao tenta de novo
+    smtp.recusar = False
+    assert alertas.processar(_relatorio(sinal), _momento(16, 20), caminho=registro) == 1
+
+
+class Caixa:
+    """Handler do aiosmtpd: guarda cada mensagem com a sessao (conexao) por onde chegou"""
+
+    def __init__(self):
+        self.recebidas = []
+
+    async def handle_DATA(self, servidor, sessao, envelope):
+        self.recebidas.append((sessao, envelope.rcpt_tos, envelope.content))
+        return "250 OK"
+
+
+def test_servidor_smtp_local_recebe_o_resumo_por_uma_conexao(tmp_path, monkeypatch):
+    controller = pytest.importorskip("aiosmtpd.controller")
+    with socket.socket() as livre:
+        livre.bind(("127.0.0.1", 0))
+        porta = livre.getsockname()[1]
+    caixa = Caixa()
+    servidor = controller.Controller(caixa, hostname="127.0.0.1", port=porta)
+    monkeypatch.setenv("EMAIL_SENDER", "vigilante@local")
+    monkeypatch.setenv("EMAIL_RECIPIENT", "a@local,b@local")
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(porta))
+    monkeypatch.setenv("SMTP_STARTTLS", "0")
+    monkeypatch.delenv("EMAIL_PASSWORD", raising=False)
+    relatorio = _relatorio(_sinal("PETR4.SA", "2026-10-14", "COMPRA", "Carteira Ações"),
+                           _sinal("VALE3.SA", "2026-10-15", "VENDA", "Carteira Ações"))
+
+    servidor.start()
+    try:
+        enviados = alertas.processar(relatorio, _momento(16, 19), caminho=str(tmp_path / "enviados.json"))
+    finally:
+        servidor.stop()
+
+    assert enviados == 2
+    assert [destinos for _, destinos, _ in caixa.recebidas] == [["a@local"], ["b@local"]]
+    assert len({id(sessao) for sessao, _, _ in caixa.recebidas}) == 1
+    assert all(b"VALE3.SA" in conteudo for _, _, conteudo in caixa.recebidas)
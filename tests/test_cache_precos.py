@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Atualizacao incremental do cache de precos: mescla, reajuste do historico e falha do download"""
+
+import numpy as np
+import pandas as pd
+
+import cache_precos
+import monitor
+from conftest import serie_ohlcv
+
+
+def test_inicio_incremental_e_o_penultimo_pregao():
+    df = serie_ohlcv(dias=10)
+    assert cache_precos.inicio_incremental(df) == df.index[-2]
+    assert cache_precos.inicio_incremental(df.iloc[:1]) is None
+    assert cache_precos.inicio_incremental(None) is None
+
+
+def test_mesclar_sobrescreve_a_partir_do_primeiro_pregao_novo():
+    completa = serie_ohlcv(dias=30)
+    antigo = completa.iloc[:25].copy()
+    antigo.iloc[-1, antigo.columns.get_loc("Close")] += 1  # gravado com o mercado aberto
+    novo = completa.iloc[23:]
+    mesclado = cache_precos.mesclar(antigo, novo)
+    pd.testing.assert_frame_equal(mesclado, completa)
+    assert cache_precos.mesclar(None, novo) is novo
+    assert cache_precos.mesclar(antigo, novo.iloc[:0]) is antigo
+
+
+def test_ajuste_detectado_so_com_o_penultimo_pregao_diferente():
+    completa = serie_ohlcv(dias=30)
+    antigo, novo = completa.iloc[:25], completa.iloc[23:].copy()
+    assert not cache_precos.ajuste_detectado(antigo, novo)
+    novo.loc[antigo.index[-1], "Close"] *= 1.05  # o ultimo podia estar em aberto
+    assert not cache_precos.ajuste_detectado(antigo, novo)
+    novo.loc[antigo.index[-2], "Close"] *= 0.5  # desdobramento reajustou o historico
+    assert cache_precos.ajuste_detectado(antigo, novo)
+    assert not cache_precos.ajuste_detectado(antigo, novo.iloc[2:])
+
+
+class Download:
+    """baixar_precos falso: serve recortes de `series` e registra (ativos, inicio) de cada lote"""
+
+    def __init__(self, series, faltando=()):
+        self.series = series
+        self.faltando = set(faltando)
+        self.lotes = []
+
+    def __call__(self, ativos, inicio=None):
+        self.lotes.append((sorted(ativos), inicio))
+        return {ativo: self.series[ativo] if inicio is None else self.series[ativo][self.series[ativo].index >= inicio]
+                for ativo in ativos if ativo not in self.faltando}
+
+
+def test_atualizar_precos_baixa_so_o_que_falta(trabalho, monkeypatch):
+    series = {"AAAA3.SA": serie_ohlcv(semente=1), "BBBB4.SA": serie_ohlcv(semente=2),
+              "CCCC3.SA": serie_ohlcv(semente=3), "DDDD3.SA": serie_ohlcv(semente=4)}
+    cache_precos.salvar("AAAA3.SA", series["AAAA3.SA"].iloc[:-3])
+    cache_precos.salvar("BBBB4.SA", series["BBBB4.SA"].iloc[:-3])
+    reajustada = series["CCCC3.SA"].iloc[:-3].copy()
+    reajustada["Close"] *= 2  # antes de um grupamento: o historico todo muda no download
+    cache_precos.salvar("CCCC3.SA", reajustada)
+    download = Download(series)
+    monkeypatch.setattr(monitor, "baixar_precos", download)
+
+    dados = monitor.atualizar_precos(list(series))
+
+    inicio = series["AAAA3.SA"].index[-5]
+    assert download.lotes == [(["AAAA3.SA", "BBBB4.SA", "CCCC3.SA"], inicio),
+                              (["CCCC3.SA", "DDDD3.SA"], None)]
+    for ativo, serie in series.items():
+        pd.testing.assert_frame_equal(dados[ativo], serie, check_freq=False)
+        lida = cache_precos.carregar_fechamentos(ativo)
+        assert np.allclose(lida.closes, serie["Close"].to_numpy())
+
+
+def test_atualizar_precos_mantem_o_cache_quando_o_download_falha(trabalho, monkeypatch):
+    serie = serie_ohlcv(semente=5)
+    cache_precos.salvar("AAAA3.SA", serie.iloc[:-3])
+    monkeypatch.setattr(monitor, "baixar_precos", Download({"AAAA3.SA": serie}, faltando={"AAAA3.SA", "EEEE3.SA"}))
+
+    defasados = set()
+    dados = monitor.atualizar_precos(["AAAA3.SA", "EEEE3.SA"], defasados=defasados)
+
+    assert defasados == {"AAAA3.SA"}
+    assert "EEEE3.SA" not in dados
+    pd.testing.assert_frame_equal(dados["AAAA3.SA"], cache_precos.carregar("AAAA3.SA"))
+    assert len(dados["AAAA3.SA"]) == len(serie) - 3
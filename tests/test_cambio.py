@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Conversao dos ativos em dolar para reais contra o calculo ativo a ativo"""
+
+import numpy as np
+
+import cambio
+import cruzamentos
+from cache_precos import Fechamentos
+
+
+def _dias(inicio, quantos, passo=1):
+    return np.arange(np.datetime64(inicio), np.datetime64(inicio) + quantos * passo, passo)
+
+
+def _cambio():
+    """USDBRL em dias uteis com um feriado (NaN) e sem fins de semana"""
+    datas = np.array([d for d in _dias("2026-01-05", 60) if np.is_busday(d)])
+    closes = 5.0 + np.arange(len(datas)) / 100
+    closes[10] = np.nan
+    return Fechamentos(datas, closes)
+
+
+def test_moeda_e_auxiliares():
+    assert cambio.moeda("BTC-USD") == "USD" and cambio.moeda("GC=F") == "USD"
+    assert cambio.moeda("PETR4.SA") == "BRL"
+    assert cambio.auxiliares(["PETR4.SA", "SI=F"]) == [cambio.PAR]
+    assert cambio.auxiliares(["PETR4.SA"]) == []
+
+
+def test_taxas_usa_a_ultima_cotacao_ate_cada_data():
+    par = _cambio()
+    datas = np.array(["2026-01-01", "2026-01-05", "2026-01-10", "2026-01-11", "NaT", "2026-06-01"],
+                     dtype="datetime64[D]")
+    esperado = []
+    for data in datas:
+        anteriores = [c for d, c in zip(par.datas, par.closes) if d <= data and c == c] if data == data else []
+        esperado.append(anteriores[-1] if anteriores else np.nan)
+    np.testing.assert_array_equal(cambio.taxas(par, datas), esperado)
+    # O feriado (NaN) fica com a cotacao do dia util anterior
+    np.testing.assert_array_equal(cambio.taxas(par, par.datas[10:11]), par.closes[9:10])
+    # Datas com hora (barras intradiarias) usam o dia
+    assert cambio.taxas(par, np.array(["2026-01-05T15:30"], dtype="datetime64[m]"))[0] == par.closes[0]
+
+
+def test_converter_multiplica_so_os_ativos_em_dolar():
+    par = _cambio()
+    btc = _dias("2026-01-01", 70)
+    series = {
+        "BTC-USD": Fechamentos(btc, np.linspace(90000, 95000, len(btc)),
+                               np.linspace(91000, 96000, len(btc)), np.linspace(89000, 94000, len(btc))),
+        "GC=F": Fechamentos(par.datas, np.linspace(2000, 2100, len(par.datas))),
+        "PETR4.SA": Fechamentos(par.datas, np.linspace(30, 35, len(par.datas))),
+    }
+    convertidas = cambio.converter(series, par)
+
+    assert set(convertidas) == {"BTC-USD", "GC=F"}
+    for ativo, convertida in convertidas.items():
+        fator = cambio.taxas(par, series[ativo].datas)
+        np.testing.assert_array_equal(convertida.datas, series[ativo].datas)
+        np.testing.assert_allclose(convertida.closes, series[ativo].closes * fator)
+    # Antes do inicio do cambio nao ha conversao
+    assert np.isnan(convertidas["BTC-USD"].closes[:4]).all()
+    np.testing.assert_allclose(convertidas["BTC-USD"].maximas, series["BTC-USD"].maximas * cambio.taxas(par, btc))
+    assert convertidas["GC=F"].maximas is None
+    assert cambio.converter(series, None) == {}
+
+
+def test_resumo_em_reais_igual_ao_calculo_de_cada_ativo():
+    par = _cambio()
+    series = {"BTC-USD": Fechamentos(_dias("2026-01-01", 90), np.linspace(90000, 99000, 90)),
+              "SI=F": Fechamentos(par.datas, np.linspace(30, 33, len(par.datas)))}
+    convertidas = cambio.converter(series, par)
+    colunas = cambio.resumo(convertidas)
+
+    for ativo, serie in convertidas.items():
+        precos = serie.closes[None, :]
+        ultimo = serie.closes[~np.isnan(serie.closes)]
+        assert colunas[ativo]["Fechamento BRL"] == round(float(serie.closes[-1]), 2)
+        assert colunas[ativo]["SMA17 BRL"] == round(float(cruzamentos.medias_moveis(precos, 17)[0, -1]), 2)
+        assert colunas[ativo]["SMA72 BRL"] is None or \
+            colunas[ativo]["SMA72 BRL"] == round(float(cruzamentos.medias_moveis(precos, 72)[0, -1]), 2)
+        assert colunas[ativo]["Min (5y) BRL"] == round(float(ultimo.min()), 2)
+        assert colunas[ativo]["Max (5y) BRL"] == round(float(ultimo.max()), 2)
+    assert colunas["SI=F"]["SMA72 BRL"] is None  # menos de 72 pregoes
+
+
+def test_cotacao_e_a_ultima_valida():
+    par = _cambio()
+    par.closes[-1] = np.nan
+    assert cambio.cotacao(par) == {"par": cambio.PAR, "data": str(par.datas[-2]),
+                                   "cotacao": round(float(par.closes[-2]), 4)}
+    assert cambio.cotacao(Fechamentos(par.datas, np.full(len(par.datas), np.nan))) is None
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Deteccao vetorizada de cruzamentos contra o calculo antigo com pandas, e o que vai no resumo"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cache_precos
+import cruzamentos
+import monitor
+from conftest import serie_ohlcv
+
+
+def _pandas(datas, closes):
+    """Calculo antigo do monitor: rolling do pandas e troca de sinal da diferenca das medias.
+
+    O antigo tambem contava como cruzamento o fim do aquecimento da SMA72 (sinal 0 -> +-1);
+    a regra atual nao conta, entao essa primeira troca e descartada aqui.
+    """
+    close = pd.Series(closes, index=pd.DatetimeIndex(datas))
+    sma17, sma72 = close.rolling(17).mean(), close.rolling(72).mean()
+    diferenca = sma17 - sma72
+    sinal = diferenca.apply(lambda x: 1 if x > 0 else (-1 if x < 0 else 0))
+    troca = sinal.diff().abs() > 0
+    eventos = []
+    for data in sinal.index[troca]:
+        i = sinal.index.get_loc(data)
+        if sinal.iloc[i - 1] == 0:
+            continue
+        eventos.append({"data": data.date().isoformat(), "direcao": "COMPRA" if sinal.iloc[i] > 0 else "VENDA",
+                        "preco": float(close.iloc[i]), "distancia": float(diferenca.iloc[i] / sma72.iloc[i])})
+    return eventos
+
+
+@pytest.mark.parametrize("semente", range(4))
+def test_detectar_igual_ao_calculo_antigo_com_pandas(semente):
+    series = {}
+    for i, dias in enumerate((1260, 900, 300)):
+        df = serie_ohlcv(dias=dias, semente=10 * semente + i)
+        series["ATV%d.SA" % i] = (df.index.values.astype("datetime64[D]"), df["Close"].to_numpy())
+
+    eventos = cruzamentos.detectar(*cruzamentos.montar_matriz(series))
+
+    for ativo, (datas, closes) in series.items():
+        esperado = _pandas(datas, closes)
+        assert esperado
+        assert [(e["data"], e["direcao"], e["preco"]) for e in eventos[ativo]] == \
+            [(e["data"], e["direcao"], e["preco"]) for e in esperado]
+        assert [e["distancia"] for e in eventos[ativo]] == pytest.approx([e["distancia"] for e in esperado], rel=1e-6)
+
+
+def test_ultimos_e_recentes():
+    eventos = {"A": [{"data": "2026-01-05", "direcao": "COMPRA", "preco": 10.0, "distancia": 0.01},
+                     {"data": "2026-10-10", "direcao": "VENDA", "preco": 9.5, "distancia": -0.002}],
+               "B": []}
+    assert cruzamentos.ultimos(eventos) == {"A": eventos["A"][-1]}
+    sinais = cruzamentos.recentes(eventos, {"X": ["A", "B"], "Y": ["A"]}, "2026-10-01")
+    assert [(s["carteira"], s["data"], s["sinal"]) for s in sinais] == [("X", "2026-10-10", "VENDA"),
+                                                                         ("Y", "2026-10-10", "VENDA")]
+
+
+def test_resumo_leva_so_o_ultimo_cruzamento_e_o_historico_a_lista(trabalho):
+    ativos = ["AAAA3.SA", "BBBB4.SA"]
+    for semente, ativo in enumerate(ativos):
+        cache_precos.salvar(ativo, serie_ohlcv(dias=1260, semente=semente))
+    relatorio, dados, resultados = monitor.buscar(ativos, baixar=set())
+    relatorio = monitor.montar_relatorio(relatorio, dados, resultados, composicao={"Mini": ativos}, extras={})
+
+    eventos = cruzamentos.detectar(*cruzamentos.montar_matriz({ativo: dados[ativo] for ativo in ativos}))
+    assert "cruzamentos" not in relatorio
+    assert relatorio["ultimos_cruzamentos"] == {ativo: eventos[ativo][-1] for ativo in ativos}
+    for ativo in ativos:
+        assert relatorio["historico"][ativo]["cruzamentos"] == eventos[ativo]
+    resumo = json.dumps({chave: valor for chave, valor in relatorio.items() if chave != "historico"})
+    assert sum(map(len, eventos.values())) > 20 and len(resumo) < 4000
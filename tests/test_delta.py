@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""delta.calcular seguido de delta.aplicar reconstroi o snapshot e o historico da versao nova"""
+
+import copy
+import json
+
+import delta
+import historico
+
+
+def _evento(data, direcao, preco):
+    return {"data": data, "direcao": direcao, "preco": preco, "distancia": 0.0125 * direcao}
+
+
+def _relatorio():
+    datas = ["2026-10-%02d" % dia for dia in (5, 6, 7, 8, 9, 12, 13, 14)]
+    return {
+        "timestamp": "2026-10-14T20:00:00",
+        "carteiras": {
+            "Dividendos": [{"Ativo": "TAEE11.SA", "Preco": 35.1}, {"Ativo": "BBSE3.SA", "Preco": 33.2}],
+            "Crescimento": [{"Ativo": "WEGE3.SA", "Preco": 40.0}],
+        },
+        "sinais_recentes": [{"ativo": "WEGE3.SA", "data": "2026-10-13", "direcao": 1}],
+        "ultimos_cruzamentos": {
+            "TAEE11.SA": _evento("2026-09-30", -1, 34.0),
+            "WEGE3.SA": _evento("2026-10-13", 1, 39.5),
+        },
+        "historico": {
+            "TAEE11.SA": {"datas": datas, "precos": [35.0 + i / 4 for i in range(8)],
+                          "sma17": [None, None] + [35.5] * 6, "sma72": [None] * 8,
+                          "cruzamentos": [_evento("2025-02-03", 1, 30.0), _evento("2026-09-30", -1, 34.0)]},
+            "WEGE3.SA": {"datas": datas, "precos": [39.0 + i / 4 for i in range(8)],
+                         "sma17": [39.25] * 8, "sma72": [None] * 8,
+                         "cruzamentos": [_evento("2026-10-13", 1, 39.5)]},
+        },
+    }
+
+
+def _seguinte(relatorio):
+    """Pregao do dia 15 em todos os ativos, um cruzamento novo do TAEE11 e o BBSE3 mudando de preco"""
+    novo = copy.deepcopy(relatorio)
+    novo["timestamp"] = "2026-10-15T20:00:00"
+    novo["carteiras"]["Dividendos"][1]["Preco"] = 33.9
+    for serie in novo["historico"].values():
+        for nome in ("datas", "precos", "sma17", "sma72"):
+            serie[nome] = serie[nome][1:]
+        serie["datas"].append("2026-10-15")
+        serie["precos"].append(serie["precos"][-1] + 0.5)
+        serie["sma17"].append(serie["sma17"][-1])
+        serie["sma72"].append(None)
+    novo["historico"]["TAEE11.SA"]["cruzamentos"].append(_evento("2026-10-15", 1, 37.25))
+    novo["ultimos_cruzamentos"]["TAEE11.SA"] = _evento("2026-10-15", 1, 37.25)
+    return novo
+
+
+def _publicado(relatorio):
+    """O snapshot (sem o historico) e os historicos como o cliente os le dos arquivos"""
+    snapshot = {chave: valor for chave, valor in relatorio.items() if chave != "historico"}
+    series = {ativo: historico.decodificar(json.loads(historico.serializar(historico.codificar(ativo, serie))))
+              for ativo, serie in relatorio["historico"].items()}
+    return json.loads(json.dumps(snapshot)), series
+
+
+def test_calcular_e_aplicar_reconstroem_snapshot_e_historico():
+    primeiro = _relatorio()
+    primeiro["versao"] = 1
+    delta_1, estado = delta.calcular({"versao": 0, "linhas": {}, "campos": {}}, primeiro, 1, {})
+    snapshot, historicos = {"versao": 0}, {}
+    delta.aplicar(snapshot, json.loads(json.dumps(delta_1)), historicos)
+    assert (snapshot, historicos) == _publicado(primeiro)
+
+    segundo = _seguinte(primeiro)
+    segundo["versao"] = 2
+    _, anteriores = _publicado(primeiro)
+    delta_2, _ = delta.calcular(estado, segundo, 2, anteriores)
+
+    # So o que mudou: uma linha, o cruzamento novo e o ultimo pregao
+    assert delta_2["linhas"] == {"Dividendos": [{"Ativo": "BBSE3.SA", "Preco": 33.9}]}
+    assert delta_2["ordem"] == {}
+    assert set(delta_2["campos"]) == {"timestamp"}
+    assert delta_2["entradas"] == {"ultimos_cruzamentos": {"TAEE11.SA": _evento("2026-10-15", 1, 37.25)}}
+    taee = delta_2["historico"]["TAEE11.SA"]
+    assert taee["datas"] == ["2026-10-15"] and taee["n"] == 8
+    assert taee["cruzamentos_mantidos"] == 2
+    assert taee["cruzamentos"] == [_evento("2026-10-15", 1, 37.25)]
+    assert delta_2["historico"]["WEGE3.SA"]["cruzamentos"] == []
+
+    delta.aplicar(snapshot, json.loads(json.dumps(delta_2)), historicos)
+    assert (snapshot, historicos) == _publicado(segundo)
+
+
+def test_ativo_que_sai_some_das_entradas_e_do_historico():
+    primeiro = _relatorio()
+    primeiro["versao"] = 1
+    delta_1, estado = delta.calcular({"versao": 0, "linhas": {}, "campos": {}}, primeiro, 1, {})
+    snapshot, historicos = {"versao": 0}, {}
+    delta.aplicar(snapshot, delta_1, historicos)
+
+    segundo = copy.deepcopy(primeiro)
+    segundo["versao"] = 2
+    del segundo["carteiras"]["Crescimento"]
+    del segundo["ultimos_cruzamentos"]["WEGE3.SA"]
+    del segundo["historico"]["WEGE3.SA"]
+    segundo["sinais_recentes"] = []
+    delta_2, _ = delta.calcular(estado, segundo, 2, {})
+
+    assert delta_2["carteiras_removidas"] == ["Crescimento"]
+    assert delta_2["entradas_removidas"] == {"ultimos_cruzamentos": ["WEGE3.SA"]}
+    assert delta_2["historico_removido"] == ["WEGE3.SA"]
+    delta.aplicar(snapshot, delta_2, historicos)
+    assert (snapshot, historicos) == _publicado(segundo)
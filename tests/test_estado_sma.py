@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Paridade bit a bit de JanelaMovel/EstadoSMA com o rolling().mean() do pandas"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import estado_sma
+
+
+def _rolling(closes, janela):
+    return pd.Series(closes).rolling(janela).mean().to_numpy()
+
+
+def _janela(closes, tamanho):
+    janela = estado_sma.JanelaMovel(tamanho)
+    medias = []
+    for close in closes:
+        janela.atualizar(close)
+        medias.append(janela.media())
+    return np.array(medias)
+
+
+def _iguais(a, b):
+    """Igualdade exata (mesmos bits, NaN na mesma posicao)"""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return a.shape == b.shape and np.array_equal(a.view(np.int64), b.view(np.int64))
+
+
+def _aleatoria(semente, n=800):
+    aleatorio = np.random.default_rng(semente)
+    return 30.0 * np.exp(np.cumsum(aleatorio.normal(0, 0.03, n)))
+
+
+def _com_lacunas(semente, n=800):
+    closes = _aleatoria(semente, n)
+    aleatorio = np.random.default_rng(semente + 100)
+    closes[aleatorio.random(n) < 0.05] = np.nan
+    closes[200:230] = np.nan  # lacuna maior que a janela curta
+    return closes
+
+
+def _com_patamares(semente, n=800):
+    closes = np.round(_aleatoria(semente, n), 2)
+    closes[100:190] = closes[100]  # patamar maior que as duas janelas
+    closes[400:420] = 12.34
+    closes[600:700] = 0.1 + 0.2  # valor sem representacao exata
+    return closes
+
+
+def _datas(n):
+    return np.datetime_as_string(np.arange(np.datetime64("2020-01-01"), np.datetime64("2020-01-01") + n), unit="D").tolist()
+
+
+@pytest.mark.parametrize("gerar", [_aleatoria, _com_lacunas, _com_patamares])
+@pytest.mark.parametrize("semente", range(5))
+@pytest.mark.parametrize("tamanho", [1, 17, 72])
+def test_janela_movel_igual_ao_pandas(gerar, semente, tamanho):
+    closes = gerar(semente)
+    assert _iguais(_janela(closes, tamanho), _rolling(closes, tamanho))
+
+
+@pytest.mark.parametrize("gerar", [_aleatoria, _com_lacunas, _com_patamares])
+def test_janela_movel_sobrevive_a_copia_e_serializacao(gerar):
+    closes = gerar(7)
+    janela = estado_sma.JanelaMovel(17)
+    for close in closes[:500]:
+        janela.atualizar(close)
+    copia = estado_sma.JanelaMovel.de_dict(janela.copiar().para_dict())
+    medias = []
+    for close in closes[500:]:
+        copia.atualizar(close)
+        medias.append(copia.media())
+    assert _iguais(medias, _rolling(closes, 17)[500:])
+
+
+def _incremental(closes, passos):
+    """calcular em etapas, persistindo o estado fechado entre elas como o monitor faz"""
+    datas = np.array(_datas(len(closes)), dtype="datetime64[D]")
+    estado = None
+    for fim in passos:
+        atual, estado = estado_sma.calcular("TESTE", datas[:fim], closes[:fim], estado)
+        estado = estado_sma.EstadoSMA.de_dict(estado.para_dict())
+    return atual, estado
+
+
+@pytest.mark.parametrize("gerar", [_aleatoria, _com_lacunas, _com_patamares])
+@pytest.mark.parametrize("semente", range(3))
+def test_estado_incremental_igual_ao_pandas(gerar, semente):
+    closes = gerar(semente)
+    passos = list(range(50, len(closes), 37)) + [len(closes)]
+    atual, fechado = _incremental(closes, passos)
+    assert _iguais(atual.valores(), [_rolling(closes, 17)[-1], _rolling(closes, 72)[-1]])
+    assert _iguais(fechado.valores(), [_rolling(closes, 17)[-2], _rolling(closes, 72)[-2]])
+    assert fechado.ultima_data == _datas(len(closes))[-2]
+
+
+def test_ultimo_pregao_em_aberto_nao_entra_no_estado_fechado():
+    closes = _aleatoria(1, 300)
+    datas = _datas(300)
+    _, estado = estado_sma.calcular("TESTE", datas, list(closes), None)
+    # O mesmo pregao volta com outro fechamento (mercado ainda aberto)
+    revisado = closes.copy()
+    revisado[-1] *= 1.05
+    atual, fechado = estado_sma.calcular("TESTE", datas, list(revisado), estado)
+    assert _iguais(atual.valores(), [_rolling(revisado, 17)[-1], _rolling(revisado, 72)[-1]])
+    assert fechado.ultima_data == datas[-2]
+
+
+@pytest.mark.parametrize("revisar", ["reajuste", "inicio"])
+def test_historico_revisado_reconstroi_o_estado(revisar, capsys):
+    closes = _aleatoria(3)
+    datas = _datas(len(closes))
+    _, estado = estado_sma.calcular("TESTE", datas[:600], list(closes[:600]), None)
+    estado_sma.calcular("TESTE", datas, list(closes), estado)
+    assert "reconstruindo" not in capsys.readouterr().out
+
+    if revisar == "reajuste":
+        # Desdobramento/dividendo: todo o historico ja consumido muda de escala
+        closes = closes / 3.0
+    else:
+        # Cache refeito comecando em outro pregao
+        closes, datas = closes[40:], datas[40:]
+    atual, fechado = estado_sma.calcular("TESTE", datas, list(closes), estado)
+
+    assert "reconstruindo estado" in capsys.readouterr().out
+    assert _iguais(atual.valores(), [_rolling(closes, 17)[-1], _rolling(closes, 72)[-1]])
+    assert _iguais(fechado.valores(), [_rolling(closes, 17)[-2], _rolling(closes, 72)[-2]])
+    assert fechado.primeira_data == datas[0]
+
+
+def test_cruzamento_igual_ao_detectado_no_rolling():
+    closes = _aleatoria(11, 600)
+    datas = _datas(600)
+    _, fechado = _incremental(closes, range(100, 601, 50))
+    curta, longa = _rolling(closes, 17)[:-1], _rolling(closes, 72)[:-1]
+    lado = pd.Series(np.sign(curta - longa)).replace(0, np.nan).ffill().to_numpy()
+    viradas = np.flatnonzero((lado[1:] != lado[:-1]) & ~np.isnan(lado[:-1]) & ~np.isnan(lado[1:])) + 1
+    assert fechado.ultimo_cruzamento == datas[viradas[-1]]
+    assert fechado.sinal == lado[-1]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Ida e volta do historico compacto (codificar/decodificar e os arquivos de gravar)"""
+
+import os
+import json
+
+import historico
+
+
+def _serie():
+    return {
+        "datas": ["2026-10-09", "2026-10-13", "2026-10-14", "2026-10-15", "2026-10-16"],
+        "precos": [10.0, 10.254, 9.996, 11.5, 11.49],
+        "sma17": [float("nan"), float("nan"), 10.1234, 10.2, 10.31],
+        "sma72": [None, None, None, None, 9.8],
+        "cruzamentos": [
+            {"data": "2024-03-01", "direcao": 1, "preco": 8.123, "distancia": 0.00123456789},
+            {"data": "2026-10-14", "direcao": -1, "preco": 9.996, "distancia": -0.0004},
+        ],
+    }
+
+
+def test_ida_e_volta_arredonda_na_escala_e_troca_nan_por_null():
+    serie = _serie()
+    doc = historico.codificar("PETR4.SA", serie)
+    volta = historico.decodificar(json.loads(historico.serializar(doc)))
+
+    assert volta["datas"] == serie["datas"]
+    assert doc["dd"] == [4, 1, 1, 1]
+    assert volta["precos"] == [10.0, 10.25, 10.0, 11.5, 11.49]
+    assert volta["sma17"] == [None, None, 10.12, 10.2, 10.31]
+    assert volta["sma72"] == [None, None, None, None, 9.8]
+    assert volta["cruzamentos"] == [
+        {"data": "2024-03-01", "direcao": 1, "preco": 8.12, "distancia": 0.001235},
+        {"data": "2026-10-14", "direcao": -1, "preco": 10.0, "distancia": -0.0004},
+    ]
+    # O formato compacto e estavel: codificar o que voltou da o mesmo documento
+    assert historico.codificar("PETR4.SA", volta) == doc
+
+
+def test_serie_vazia_e_sem_cruzamentos():
+    doc = historico.codificar("X", {"datas": [], "precos": [], "sma17": [], "sma72": []})
+    assert doc["d0"] is None and "cruzamentos" not in doc
+    volta = historico.decodificar(doc)
+    assert volta == {"datas": [], "precos": [], "sma17": [], "sma72": []}
+
+
+def test_gravar_so_regrava_o_que_mudou_e_devolve_os_anteriores(tmp_path):
+    diretorio = str(tmp_path)
+    serie = _serie()
+    indice = historico.gravar({"PETR4.SA": serie, "VALE3.SA": serie}, diretorio)
+    assert set(indice) == {"PETR4.SA", "VALE3.SA"}
+    with open(os.path.join(diretorio, indice["PETR4.SA"]["arquivo"]), encoding="utf-8") as f:
+        gravado = historico.decodificar(json.load(f))
+    assert gravado["cruzamentos"][-1]["data"] == "2026-10-14"
+
+    nova = dict(serie, precos=serie["precos"][:-1] + [12.0])
+    anteriores = {}
+    novo_indice = historico.gravar({"PETR4.SA": nova, "VALE3.SA": serie}, diretorio, anteriores)
+    assert novo_indice["VALE3.SA"] == indice["VALE3.SA"]
+    assert novo_indice["PETR4.SA"]["hash"] != indice["PETR4.SA"]["hash"]
+    assert list(anteriores) == ["PETR4.SA"]
+    assert anteriores["PETR4.SA"] == gravado
+
+    # Ativo que saiu das carteiras perde o arquivo
+    historico.gravar({"PETR4.SA": nova}, diretorio)
+    assert sorted(os.listdir(diretorio)) == ["PETR4.SA.json", "index.json"]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""Orcamento de tempo de partida: roda benchmarks/bench_importacao.py como no workflow"""
+
+import os
+import re
+import sys
+import subprocess
+
+from conftest import RAIZ
+
+ORCAMENTO_MS = 300
+
+
+def test_import_do_monitor_cabe_no_orcamento_sem_pandas():
+    r = subprocess.run([sys.executable, os.path.join(RAIZ, "benchmarks", "bench_importacao.py"),
+                        "--orcamento-ms", str(ORCAMENTO_MS), "--repeticoes", "3"],
+                       cwd=RAIZ, capture_output=True, text=True)
+    assert r.returncode == 0, r.stdout + r.stderr
+    tempo = float(re.search(r"import monitor: ([\d.]+) ms", r.stdout).group(1))
+    assert tempo <= ORCAMENTO_MS
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Motor de indicadores: avanco incremental entre execucoes contra a passada em lote"""
+
+import numpy as np
+import pytest
+
+import indicadores
+from cache_precos import Fechamentos
+
+LISTA = ["rsi14", "macd", "atr14", "bollinger20", "sma20", "ema12"]
+
+
+def _serie(dias, semente, passo=1):
+    aleatorio = np.random.default_rng(semente)
+    datas = np.arange(np.datetime64("2021-01-04"), np.datetime64("2021-01-04") + dias * passo, passo)
+    closes = 50 * np.exp(np.cumsum(aleatorio.normal(0, 0.02, len(datas))))
+    return Fechamentos(datas, closes, closes * 1.01, closes * 0.99)
+
+
+def _ate(series, cortar):
+    return {ativo: Fechamentos(*(campo[:len(campo) - cortar] for campo in serie)) for ativo, serie in series.items()}
+
+
+@pytest.fixture
+def series():
+    # Calendarios e tamanhos diferentes: cada ativo avanca os seus proprios pregoes
+    return {"DIARIO": _serie(1300, 1), "ALTERNADO": _serie(600, 2, passo=2), "CURTO": _serie(80, 3)}
+
+
+def _lista():
+    return [indicadores.criar(nome) for nome in LISTA]
+
+
+def test_atualizar_incremental_igual_a_passada_em_lote(series):
+    _, lote = indicadores.calcular(series, _lista())
+
+    motor, _ = indicadores.atualizar(_ate(series, 12), _lista())
+    for cortar in (7, 6, 1, 0):
+        motor, valores = indicadores.atualizar(_ate(series, cortar), _lista(), motor)
+
+    assert valores == lote
+    assert motor.consumidos["DIARIO"][1] == series["DIARIO"].datas[-2]
+
+
+def test_pregao_em_aberto_revisado_nao_entra_no_estado(series):
+    motor, _ = indicadores.atualizar(series, _lista())
+    revisadas = dict(series)
+    diario = series["DIARIO"]
+    closes = diario.closes.copy()
+    closes[-1] *= 1.03
+    revisadas["DIARIO"] = Fechamentos(diario.datas, closes, diario.maximas, diario.minimas)
+
+    _, valores = indicadores.atualizar(revisadas, _lista(), motor)
+    assert valores == indicadores.calcular(revisadas, _lista())[1]
+
+
+def test_anterior_nao_e_alterado(series):
+    motor, primeiro = indicadores.atualizar(_ate(series, 5), _lista())
+    indicadores.atualizar(series, _lista(), motor)
+    _, de_novo = indicadores.atualizar(_ate(series, 5), _lista(), motor)
+    assert de_novo == primeiro
+
+
+@pytest.mark.parametrize("mudanca", ["reajuste", "inicio", "indicadores", "ativos"])
+def test_estado_incompativel_refaz_a_passada(series, mudanca, monkeypatch):
+    motor, _ = indicadores.atualizar(_ate(series, 3), _lista())
+    lista = _lista()
+    if mudanca == "reajuste":
+        diario = series["DIARIO"]
+        series = dict(series, DIARIO=Fechamentos(diario.datas, diario.closes / 2, diario.maximas / 2, diario.minimas / 2))
+    elif mudanca == "inicio":
+        series = dict(series, DIARIO=Fechamentos(*(campo[30:] for campo in series["DIARIO"])))
+    elif mudanca == "indicadores":
+        lista = lista + [indicadores.criar("ema50")]
+    else:
+        series = {ativo: serie for ativo, serie in series.items() if ativo != "CURTO"}
+
+    lotes = []
+    original = indicadores.calcular
+    monkeypatch.setattr(indicadores, "calcular", lambda *args: lotes.append(1) or original(*args))
+    _, valores = indicadores.atualizar(series, lista, motor)
+
+    assert lotes == [1]
+    assert valores == original(series, lista)[1]
+
+
+def test_indicador_e_no_sem_os_metodos_abstratos_nao_instanciam():
+    class SoNos(indicadores.Indicador):
+        familia = "sonos"
+
+        def nos(self):
+            return []
+
+    class SemPasso(indicadores.No):
+        def lote(self, entradas):
+            return entradas[0]
+
+    with pytest.raises(TypeError):
+        SoNos(3)
+    with pytest.raises(TypeError):
+        SemPasso()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Compactacao do log de sinais em SQLite: pregoes antigos ficam so com a foto do fechamento"""
+
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import log_sinais
+
+ATIVOS = ("AAAA3.SA", "BBBB4.SA")
+HORAS = (11, 14, 17, 19)
+
+
+def _relatorio(dia, hora, sinal):
+    momento = datetime(dia.year, dia.month, dia.day, hora, 0, tzinfo=log_sinais.BRT)
+    return {
+        "timestamp": momento.isoformat(),
+        "carteiras": {"Carteira": [{"Ativo": ativo, "Fechamento": 10.0 + hora, "SMA17": 10.0, "SMA72": 9.0,
+                                    "Sinal": sinal} for ativo in ATIVOS]},
+        "historico": {ativo: {"datas": [dia.isoformat()]} for ativo in ATIVOS},
+    }
+
+
+def _fotos(caminho):
+    conexao = sqlite3.connect(caminho)
+    try:
+        return conexao.execute("SELECT ativo, pregao, momento, sinal FROM sinais ORDER BY ativo, momento").fetchall()
+    finally:
+        conexao.close()
+
+
+def test_registrar_compacta_os_pregoes_antigos(tmp_path):
+    caminho = str(tmp_path / "log.sqlite")
+    inicio = date(2026, 9, 28)
+    dias = [inicio + timedelta(days=i) for i in range(15)]
+    for dia in dias:
+        for hora in HORAS:
+            # O sinal vira no meio do pregao e volta no fechamento
+            sinal = "VENDA" if hora == 14 else "COMPRA"
+            assert log_sinais.registrar(_relatorio(dia, hora, sinal), caminho) == len(ATIVOS)
+
+    fotos = _fotos(caminho)
+    limite = (dias[-1] - timedelta(days=log_sinais.DIAS_INTRADIARIOS)).isoformat()
+    antigos = [dia.isoformat() for dia in dias if dia.isoformat() < limite]
+    recentes = [dia.isoformat() for dia in dias if dia.isoformat() >= limite]
+    assert len(fotos) == len(ATIVOS) * (len(antigos) + len(HORAS) * len(recentes))
+    for ativo in ATIVOS:
+        for pregao in antigos:
+            do_dia = [foto for foto in fotos if foto[:2] == (ativo, pregao)]
+            ultima = log_sinais._epoca(_relatorio(date.fromisoformat(pregao), HORAS[-1], "COMPRA")["timestamp"])
+            assert do_dia == [(ativo, pregao, ultima, 1)]
+        for pregao in recentes:
+            assert len([foto for foto in fotos if foto[:2] == (ativo, pregao)]) == len(HORAS)
+
+    # Depois da compactacao so restam as viradas intradiarias dos ultimos dias
+    agora = datetime(2026, 10, 12, 20, 0, tzinfo=log_sinais.BRT)
+    viradas = log_sinais.viradas(ATIVOS, "COMPRA", "VENDA", dias=30, caminho=caminho, agora=agora)
+    assert sorted({virada["pregao"] for virada in viradas}) == recentes
+
+
+def test_compactar_e_idempotente_e_respeita_o_limite(tmp_path):
+    caminho = str(tmp_path / "log.sqlite")
+    dia = date(2026, 10, 1)
+    for hora in HORAS:
+        log_sinais.registrar(_relatorio(dia, hora, "COMPRA"), caminho)
+    conexao = log_sinais.conectar(caminho)
+    try:
+        with conexao:
+            assert log_sinais.compactar(conexao, dia + timedelta(days=log_sinais.DIAS_INTRADIARIOS)) == 0
+            removidas = log_sinais.compactar(conexao, dia + timedelta(days=log_sinais.DIAS_INTRADIARIOS + 1))
+            assert removidas == len(ATIVOS) * (len(HORAS) - 1)
+            assert log_sinais.compactar(conexao, dia + timedelta(days=30)) == 0
+    finally:
+        conexao.close()
+    assert len(_fotos(caminho)) == len(ATIVOS)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Atualizacao da matriz de precos no lugar contra a reconstrucao do zero"""
+
+import numpy as np
+
+import matriz_precos
+from cache_precos import Fechamentos
+
+
+def _serie(inicio, dias, semente, passo=1):
+    aleatorio = np.random.default_rng(semente)
+    datas = np.arange(np.datetime64(inicio), np.datetime64(inicio) + dias * passo, passo)
+    return Fechamentos(datas, np.round(20 + np.cumsum(aleatorio.normal(0, 1, len(datas))), 2))
+
+
+def _sem(serie, *posicoes):
+    manter = np.ones(len(serie.datas), dtype=bool)
+    manter[list(posicoes)] = False
+    return Fechamentos(serie.datas[manter], serie.closes[manter])
+
+
+def _igual(serie, lida):
+    return np.array_equal(serie.datas, lida.datas) and np.array_equal(serie.closes, lida.closes)
+
+
+def test_acrescenta_pregoes_novos_e_regrava_os_alterados(tmp_path):
+    diretorio = str(tmp_path)
+    a, b = _serie("2026-01-01", 200, 1), _serie("2026-01-05", 50, 2, passo=2)
+    matriz_precos.atualizar({"A": Fechamentos(a.datas[:-10], a.closes[:-10]), "B": b}, diretorio)
+
+    revisada = Fechamentos(a.datas, a.closes.copy())
+    revisada.closes[-11] += 1  # ultimo pregao gravado mudou (estava em aberto)
+    mudancas = matriz_precos.atualizar({"A": revisada}, diretorio)
+
+    assert mudancas == {"acrescentados": 10, "regravados": 1, "reconstruida": False}
+    matriz = matriz_precos.abrir(diretorio)
+    assert _igual(revisada, matriz.fechamentos("A"))
+    assert _igual(b, matriz.fechamentos("B"))
+
+
+def test_pregao_que_sumiu_da_serie_volta_a_nan(tmp_path):
+    diretorio = str(tmp_path)
+    a, b = _serie("2026-01-01", 200, 1), _serie("2026-01-01", 200, 2)
+    matriz_precos.atualizar({"A": a, "B": b}, diretorio)
+
+    # O provedor deixou de ter dois pregoes de A (barra removida/corrigida na fonte)
+    corrigida = _sem(a, 50, 120)
+    mudancas = matriz_precos.atualizar({"A": corrigida}, diretorio)
+
+    assert mudancas == {"acrescentados": 0, "regravados": 2, "reconstruida": False}
+    matriz = matriz_precos.abrir(diretorio)
+    assert _igual(corrigida, matriz.fechamentos("A"))
+    assert np.isnan(matriz.linha("A")[[50, 120]]).all()
+    assert _igual(b, matriz.fechamentos("B"))
+
+    # Mesmo resultado de reconstruir a matriz do zero com as series atuais
+    do_zero = str(tmp_path / "do-zero")
+    matriz_precos.atualizar({"A": corrigida, "B": b}, do_zero)
+    assert np.array_equal(matriz.precos, matriz_precos.abrir(do_zero).precos, equal_nan=True)
+
+
+def test_historico_anterior_ao_inicio_da_serie_e_mantido(tmp_path):
+    diretorio = str(tmp_path)
+    longa = _serie("2020-01-01", 2000, 3)
+    matriz_precos.atualizar({"A": longa}, diretorio)
+
+    # O monitor so guarda os ultimos anos: a parte antiga fica como o backtest gravou
+    recente = Fechamentos(longa.datas[-500:], longa.closes[-500:])
+    mudancas = matriz_precos.atualizar({"A": recente}, diretorio)
+
+    assert mudancas["regravados"] == 0
+    assert _igual(longa, matriz_precos.abrir(diretorio).fechamentos("A"))
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Camada de resiliencia do download contra o provedor de fixtures com falhas roteirizadas"""
+
+import pytest
+
+import cache_precos
+import monitor
+import provedores
+from conftest import serie_ohlcv
+
+ATIVOS = ["AAAA3.SA", "BBBB4.SA", "CCCC3.SA"]
+
+
+class Relogio:
+    """Relogio falso: dormir avanca o tempo e registra cada espera"""
+
+    def __init__(self):
+        self.agora = 1000.0
+        self.esperas = []
+
+    def __call__(self):
+        return self.agora
+
+    def dormir(self, segundos):
+        self.esperas.append(segundos)
+        self.agora += segundos
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    diretorio = str(tmp_path / "fixtures")
+    for semente, ativo in enumerate(ATIVOS):
+        cache_precos.salvar(ativo, serie_ohlcv(semente=semente), diretorio)
+    return diretorio
+
+
+def _resiliente(provedor, relogio, sorteios=None, **opcoes):
+    """Resiliente sem espera real; o sorteio devolve o teto e registra os limites pedidos"""
+    def sorteio(minimo, maximo):
+        if sorteios is not None:
+            sorteios.append((minimo, maximo))
+        return maximo
+    opcoes.setdefault("balde", provedores.BaldeDeFichas(relogio=relogio, dormir=relogio.dormir))
+    opcoes.setdefault("disjuntor", provedores.Disjuntor(relogio=relogio))
+    return provedores.Resiliente(provedor, dormir=relogio.dormir, sorteio=sorteio, **opcoes)
+
+
+def test_novas_tentativas_so_dos_ativos_que_faltaram(fixtures):
+    relogio = Relogio()
+    sorteios = []
+    provedor = provedores.ProvedorFixtures(fixtures, roteiro=[{"BBBB4.SA"}, RuntimeError("HTTP 429"), None])
+    dados = _resiliente(provedor, relogio, sorteios, tentativas=3, espera_base=1.0).baixar(ATIVOS)
+
+    assert sorted(dados) == ATIVOS
+    assert provedor.chamadas == [ATIVOS, ["BBBB4.SA"], ["BBBB4.SA"]]
+    # Espera sorteada entre 0 e o teto exponencial, antes de cada repeticao
+    assert sorteios == [(0, 1.0), (0, 2.0)]
+    assert relogio.esperas == [1.0, 2.0]
+
+
+def test_espera_limitada_e_desiste_depois_das_tentativas(fixtures):
+    relogio = Relogio()
+    sorteios = []
+    provedor = provedores.ProvedorFixtures(fixtures, roteiro=[RuntimeError("falha")] * 5)
+    resiliente = _resiliente(provedor, relogio, sorteios, tentativas=4, espera_base=2.0, espera_maxima=5.0,
+                             disjuntor=provedores.Disjuntor(limite=10, relogio=relogio))
+
+    assert resiliente.baixar(ATIVOS) == {}
+    assert len(provedor.chamadas) == 4
+    assert sorteios == [(0, 2.0), (0, 4.0), (0, 5.0)]
+
+
+def test_espera_sorteada_varia_entre_zero_e_o_teto(fixtures):
+    resiliente = provedores.Resiliente(provedores.ProvedorFixtures(fixtures), espera_base=1.0, espera_maxima=8.0)
+    esperas = [resiliente.espera(3) for _ in range(200)]
+    assert all(0 <= espera <= 4.0 for espera in esperas)
+    assert len(set(esperas)) > 1
+
+
+def test_balde_de_fichas_limita_a_taxa():
+    relogio = Relogio()
+    balde = provedores.BaldeDeFichas(taxa=10, capacidade=20, relogio=relogio, dormir=relogio.dormir)
+
+    assert balde.retirar(15) == 0
+    # Faltam 5 fichas: meio segundo para repor a divida
+    assert balde.retirar(10) == pytest.approx(0.5)
+    # Pedido maior que a capacidade custa a capacidade
+    assert balde.retirar(30) == pytest.approx(2.0)
+    relogio.agora += 60
+    assert balde.retirar(20) == 0
+    assert relogio.esperas == [pytest.approx(0.5), pytest.approx(2.0)]
+
+
+def test_resiliente_retira_uma_ficha_por_ativo_pedido(fixtures):
+    relogio = Relogio()
+    balde = provedores.BaldeDeFichas(taxa=2, capacidade=4, relogio=relogio, dormir=relogio.dormir)
+    provedor = provedores.ProvedorFixtures(fixtures, roteiro=[{"BBBB4.SA", "CCCC3.SA"}])
+    _resiliente(provedor, relogio, balde=balde, espera_base=0.0).baixar(ATIVOS)
+
+    # 3 fichas das 4 do balde; a repeticao (espera sorteada 0) pede 2 e espera repor a que falta
+    assert relogio.esperas == [0.0, 0.5]
+
+
+def test_disjuntor_abre_fica_meio_aberto_e_fecha():
+    relogio = Relogio()
+    disjuntor = provedores.Disjuntor(limite=2, repouso=60, relogio=relogio)
+
+    disjuntor.falha()
+    assert disjuntor.estado == "fechado" and disjuntor.permitir()
+    disjuntor.falha()
+    assert disjuntor.estado == "aberto" and not disjuntor.permitir()
+
+    relogio.agora += 59
+    assert not disjuntor.permitir()
+    relogio.agora += 1
+    # Meio aberto: so uma chamada de teste passa
+    assert disjuntor.permitir() and disjuntor.estado == "meio aberto"
+    assert not disjuntor.permitir()
+
+    # Falha no teste reabre por mais um repouso inteiro
+    disjuntor.falha()
+    assert disjuntor.estado == "aberto"
+    relogio.agora += 30
+    assert not disjuntor.permitir()
+    relogio.agora += 30
+    assert disjuntor.permitir()
+    disjuntor.sucesso()
+    assert disjuntor.estado == "fechado" and disjuntor.falhas == 0 and disjuntor.permitir()
+
+
+def test_disjuntor_aberto_corta_as_chamadas_ao_provedor(fixtures, capsys):
+    relogio = Relogio()
+    provedor = provedores.ProvedorFixtures(fixtures, roteiro=[RuntimeError("fora do ar")] * 3)
+    disjuntor = provedores.Disjuntor(limite=2, repouso=300, relogio=relogio)
+    resiliente = _resiliente(provedor, relogio, tentativas=3, espera_base=1.0, disjuntor=disjuntor)
+
+    assert resiliente.baixar(ATIVOS) == {}
+    assert len(provedor.chamadas) == 2
+    assert disjuntor.estado == "aberto"
+    assert "disjuntor aberto" in capsys.readouterr().out
+
+    # Em repouso: volta vazio na hora, sem chamar o provedor
+    assert resiliente.baixar(ATIVOS) == {}
+    assert len(provedor.chamadas) == 2
+
+    # Depois do repouso a chamada de teste passa (o roteiro ainda tem uma falha) e reabre
+    relogio.agora += 300
+    assert resiliente.baixar(ATIVOS) == {}
+    assert len(provedor.chamadas) == 3
+    assert disjuntor.estado == "aberto"
+
+    # Proxima chamada de teste com o provedor de volta fecha o circuito
+    relogio.agora += 300
+    assert sorted(resiliente.baixar(ATIVOS)) == ATIVOS
+    assert disjuntor.estado == "fechado"
+
+
+def test_ativo_sem_download_fica_com_o_cache_marcado_como_defasado(fixtures, trabalho, monkeypatch):
+    # Cache local uma semana atras das fixtures
+    for semente, ativo in enumerate(ATIVOS):
+        cache_precos.salvar(ativo, serie_ohlcv(semente=semente)[:-5])
+    relogio = Relogio()
+    provedor = provedores.ProvedorFixtures(fixtures, roteiro=[{"BBBB4.SA"}] * 3)
+    monkeypatch.setattr(provedores, "_atual", None)
+    provedores.configurar(_resiliente(provedor, relogio, tentativas=3))
+
+    dados, resultados, erros = monitor.executar_pipeline(ATIVOS, workers=2)
+
+    assert provedor.chamadas == [ATIVOS, ["BBBB4.SA"], ["BBBB4.SA"]]
+    assert {ativo: resultados[ativo][0]["Defasado"] for ativo in ATIVOS} == {
+        "AAAA3.SA": False, "BBBB4.SA": True, "CCCC3.SA": False}
+    assert [(erro["ativo"], erro["etapa"]) for erro in erros] == [("BBBB4.SA", "download")]
+    assert "usando o cache local" in erros[0]["erro"]
+    # Os demais chegaram ao ultimo pregao das fixtures; o defasado parou no cache
+    assert str(dados["AAAA3.SA"].datas[-1]) == "2026-10-16"
+    assert str(dados["BBBB4.SA"].datas[-1]) == str(serie_ohlcv()[:-5].index[-1].date())
+
+
+def test_provedor_sem_baixar_nao_instancia():
+    class Incompleto(provedores.Provedor):
+        nome = "incompleto"
+
+    with pytest.raises(TypeError):
+        Incompleto()
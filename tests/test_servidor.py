@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Saude do modo servico com todos os mercados fechados"""
+
+import time
+
+import monitor
+import servidor
+
+
+def _servico_ocioso(monkeypatch):
+    """Servico ja aquecido (precos em memoria) em que nenhuma classe tem o que baixar"""
+    servico = servidor.Servico(cadencias={"cripto": 60, "b3": 120})
+    servico.memoria = {"PETR4.SA": None}
+    monkeypatch.setattr(servico, "vencidos", lambda momento, relogio: ({"b3"}, []))
+    return servico
+
+
+def _atrasar(servico):
+    with servico.trava:
+        servico._ultimo_sucesso = time.monotonic() - 10 * max(servico.cadencias.values())
+
+
+def test_voltas_ociosas_mantem_o_servico_saudavel(trabalho, monkeypatch):
+    servico = _servico_ocioso(monkeypatch)
+    assert servico.saude()[1]["status"] == "iniciando"
+
+    _atrasar(servico)
+    saudavel, corpo = servico.saude()
+    assert not saudavel and corpo["status"] == "atrasado"
+
+    # Mercados fechados: a volta nao roda nada, mas o laco esta vivo
+    assert servico.rodada() is False
+    saudavel, corpo = servico.saude()
+    assert saudavel and corpo["status"] == "ok"
+
+
+def test_voltas_ociosas_nao_escondem_uma_rodada_que_falhou(trabalho, monkeypatch):
+    servico = _servico_ocioso(monkeypatch)
+    _atrasar(servico)
+    servico.falhou(RuntimeError("disco cheio"))
+
+    assert servico.rodada() is False
+    saudavel, corpo = servico.saude()
+    assert not saudavel and corpo["status"] == "atrasado"
+
+
+def test_servico_agenda_os_ativos_da_composicao_recebida(trabalho):
+    servico = servidor.Servico(composicao={"Mini": ["BTC-USD", "ETH-USD"]}, extras={})
+    classes, ativos = servico.vencidos(monitor.agora(), time.monotonic())
+    assert "cripto" in classes
+    assert ativos == ["BTC-USD", "ETH-USD"]
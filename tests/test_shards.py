@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Shard rodado como script (python monitor.py --shard) com carteiras de outro arquivo"""
+
+import json
+import os
+import subprocess
+import sys
+
+import cache_precos
+from conftest import RAIZ, serie_ohlcv
+
+
+def test_shard_usa_carteiras_da_linha_de_comando(trabalho):
+    ativos = ["AAAA3.SA", "BBBB4.SA", "CCCC3.SA"]
+    fixtures = trabalho / "fixtures"
+    for semente, ativo in enumerate(ativos):
+        cache_precos.salvar(ativo, serie_ohlcv(semente=semente), str(fixtures))
+    (trabalho / "mini.csv").write_text(
+        "carteira,ativo\n" + "".join("Mini,%s\n" % ativo for ativo in ativos), encoding="utf-8")
+    (trabalho / "indicadores.csv").write_text("carteira,indicadores\nMini,rsi14\n", encoding="utf-8")
+
+    def monitor(*argumentos):
+        saida = subprocess.run(
+            [sys.executable, os.path.join(RAIZ, "monitor.py"), "--carteiras", "mini.csv", "--indicadores", "indicadores.csv",
+             "--provedor", "fixtures:" + str(fixtures)] + list(argumentos),
+            cwd=str(trabalho), capture_output=True, text=True, timeout=120)
+        assert saida.returncode == 0, saida.stdout + saida.stderr
+        return saida.stdout
+
+    assert "[SHARD] 1/1: 3 de 3 ativos" in monitor("--shard", "1/1")
+    with open(trabalho / "data" / "shards" / "1-de-1.json", encoding="utf-8") as f:
+        shard = json.load(f)
+    assert shard["ativos"] == ativos
+    assert sorted(shard["resultados"]) == sorted(ativos)
+
+    # A juncao confere as fatias contra o mesmo universo e aplica os indicadores do arquivo informado
+    monitor("--juntar", "1")
+    with open(trabalho / "data" / "current-analysis.json", encoding="utf-8") as f:
+        relatorio = json.load(f)
+    assert list(relatorio["carteiras"]) == ["Mini"]
+    assert [linha["Ativo"] for linha in relatorio["carteiras"]["Mini"]] == ativos
+    assert relatorio["indicadores"] == {"Mini": ["RSI14"]}
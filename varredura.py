@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE - Varredura de parametros da estrategia de medias
+Avalia todos os pares (SMA curta, SMA longa) de uma grade para todos os ativos
+e grava data/backtest-varredura.json com matrizes prontas para heatmap.
+
+Cada ativo tem uma unica soma acumulada dos fechamentos: qualquer SMA sai dela
+em O(1) por pregao, sem um rolling().mean() por par. Os ativos sao
+distribuidos entre processos.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import monitor
+import calendario
+import matriz_precos
+
+PERIODO_ANOS = 15
+ARQUIVO = os.path.join("data", "backtest-varredura.json")
+CURTAS_PADRAO = "1:51"
+LONGAS_PADRAO = "1:201"
+
+
+def faixa(texto):
+    """Converte 'inicio:fim[:passo]' (como range) ou '5,10,20' em lista de janelas"""
+    if ":" in texto:
+        return list(range(*(int(parte) for parte in texto.split(":"))))
+    return [int(parte) for parte in texto.split(",")]
+
+
+def varrer_ativo(precos, curtas, longas):
+    """Retorno da estrategia e numero de operacoes de cada par (curta, longa) para um ativo.
+
+    Mesma regra do backtest.py: comprado com a SMA curta acima da longa, sinal do
+    fechamento aplicado no pregao seguinte. Pares com curta >= longa ficam NaN.
+    Retorna (retorno, operacoes), matrizes len(curtas) x len(longas).
+    """
+    precos = np.asarray(precos, dtype=np.float64)
+    n = len(precos)
+    acumulado = np.concatenate(([0.0], np.cumsum(precos)))
+
+    def sma(janela):
+        media = np.full(n, np.nan)
+        if janela <= n:
+            media[janela - 1:] = (acumulado[janela:] - acumulado[:-janela]) / janela
+        return media
+
+    log_retorno = np.log(precos[1:] / precos[:-1])
+    matriz_longas = np.vstack([sma(janela) for janela in longas])
+
+    retorno = np.full((len(curtas), len(longas)), np.nan)
+    operacoes = np.zeros((len(curtas), len(longas)), dtype=np.int64)
+    for i, curta in enumerate(curtas):
+        with np.errstate(invalid="ignore"):
+            comprado = (sma(curta)[None, :] > matriz_longas)[:, :-1]
+        # Posicao no pregao t+1 e a decidida no fechamento de t
+        retorno[i] = np.expm1(comprado.astype(np.float64) @ log_retorno)
+        operacoes[i] = comprado[:, 0] + (comprado[:, 1:] & ~comprado[:, :-1]).sum(axis=1)
+
+    invalidos = np.asarray(curtas)[:, None] >= np.asarray(longas)[None, :]
+    retorno[invalidos] = np.nan
+    operacoes[invalidos] = 0
+    return retorno, operacoes
+
+
+def _varrer(args):
+    return varrer_ativo(*args)
+
+
+_MATRIZ = None
+
+
+def _varrer_da_matriz(args):
+    """Tarefa de um processo: os fechamentos vem da matriz mapeada, nao por pickle"""
+    global _MATRIZ
+    diretorio, ativo, desde, curtas, longas = args
+    if _MATRIZ is None:
+        _MATRIZ = matriz_precos.abrir(diretorio)
+    return varrer_ativo(_MATRIZ.fechamentos(ativo, desde).closes, curtas, longas)
+
+
+def _matriz_json(matriz, casas=2):
+    """Matriz NumPy em listas, com NaN como null"""
+    return [[None if np.isnan(v) else round(float(v), casas) for v in linha] for linha in matriz]
+
+
+def varrer(series, curtas, longas, workers=None):
+    """Executa a grade para {ativo: array de fechamentos} distribuindo os ativos entre processos"""
+    ativos = list(series)
+    tarefas = [(series[ativo], curtas, longas) for ativo in ativos]
+    if workers == 1:
+        resultados = list(map(_varrer, tarefas))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(_varrer, tarefas))
+    return dict(zip(ativos, resultados))
+
+
+def varrer_matriz(ativos, curtas, longas, workers=None, desde=None, diretorio=matriz_precos.DIR_MATRIZ):
+    """Como varrer, mas cada processo abre a matriz compartilhada (matriz_precos.py) e le o ativo
+    direto do arquivo mapeado: todos os processos usam as mesmas paginas, sem copia da matriz"""
+    tarefas = [(diretorio, ativo, desde, curtas, longas) for ativo in ativos]
+    if workers == 1:
+        resultados = list(map(_varrer_da_matriz, tarefas))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(_varrer_da_matriz, tarefas))
+    return dict(zip(ativos, resultados))
+
+
+def montar_relatorio(resultados, curtas, longas, periodo_anos=PERIODO_ANOS):
+    """Monta data/backtest-varredura.json: media dos ativos e matriz de cada ativo (em %)"""
+    retornos = np.array([retorno for retorno, _ in resultados.values()])
+    operacoes = np.array([ops for _, ops in resultados.values()])
+    with np.errstate(invalid="ignore"):
+        media = np.nanmean(retornos, axis=0) if len(retornos) else np.full((len(curtas), len(longas)), np.nan)
+    media_operacoes = operacoes.mean(axis=0) if len(operacoes) else np.zeros((len(curtas), len(longas)))
+
+    melhor = None
+    if np.isfinite(media).any():
+        i, j = np.unravel_index(np.nanargmax(media), media.shape)
+        melhor = {"sma_curta": curtas[i], "sma_longa": longas[j], "retorno_medio": round(float(media[i, j]) * 100, 2)}
+
+    return {
+        "timestamp": monitor.agora().isoformat(),
+        "periodo_anos": periodo_anos,
+        "metrica": "retorno da estrategia em %",
+        "curtas": list(curtas),
+        "longas": list(longas),
+        "melhor": melhor,
+        "media": _matriz_json(media * 100),
+        "operacoes_media": _matriz_json(media_operacoes, 1),
+        "ativos": {ativo: _matriz_json(retorno * 100) for ativo, (retorno, _) in resultados.items()},
+    }
+
+
+def executar(curtas, longas, workers=None, periodo_anos=PERIODO_ANOS, usar_matriz=False):
+    """Baixa o historico do universo em lote (ou le da matriz), varre a grade e grava o arquivo"""
+    print("[VARREDURA] %d x %d pares - %s" % (len(curtas), len(longas), monitor.agora().strftime('%d/%m/%Y %H:%M:%S BRT')))
+    if usar_matriz:
+        matriz = matriz_precos.abrir()
+        if matriz is None or not len(matriz.datas):
+            raise RuntimeError("matriz de precos inexistente em " + matriz_precos.DIR_MATRIZ)
+        desde = calendario.anos_antes(matriz.datas[-1].astype(object), periodo_anos)
+        ativos = [ativo for ativo, serie in matriz.series(monitor.universo(), desde).items()
+                  if len(serie.closes) > max(longas)]
+        inicio = time.perf_counter()
+        resultados = varrer_matriz(ativos, curtas, longas, workers, desde)
+    else:
+        dados = monitor.baixar_precos(monitor.universo(), periodo=str(periodo_anos) + "y")
+        series = {ativo: df['Close'].to_numpy(dtype=np.float64) for ativo, df in dados.items() if len(df) > max(longas)}
+        inicio = time.perf_counter()
+        resultados = varrer(series, curtas, longas, workers)
+    print("[TEMPO] Varredura: %.2fs para %d ativos" % (time.perf_counter() - inicio, len(resultados)))
+
+    relatorio = montar_relatorio(resultados, curtas, longas, periodo_anos)
+    os.makedirs(os.path.dirname(ARQUIVO), exist_ok=True)
+    with open(ARQUIVO, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, separators=(",", ":"))
+    print("[OK] Varredura salva em " + ARQUIVO)
+    if relatorio["melhor"]:
+        print("[OK] Melhor par medio: SMA%(sma_curta)d x SMA%(sma_longa)d (%(retorno_medio).2f%%)" % relatorio["melhor"])
+    return relatorio
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="VIGILANTE - Varredura de pares de medias moveis")
+    parser.add_argument("--curtas", default=CURTAS_PADRAO,
+                        help="janelas da media curta, 'inicio:fim[:passo]' ou lista (padrao: %(default)s)")
+    parser.add_argument("--longas", default=LONGAS_PADRAO,
+                        help="janelas da media longa, 'inicio:fim[:passo]' ou lista (padrao: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processos (padrao: numero de CPUs)")
+    parser.add_argument("--anos", type=int, default=PERIODO_ANOS, help="anos de historico (padrao: %(default)s)")
+    parser.add_argument("--matriz", action="store_true",
+                        help="le os precos da matriz compartilhada (data/matriz/) em vez de baixar")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        executar(faixa(args.curtas), faixa(args.longas), args.workers, args.anos, args.matriz)
+        return 0
+    except Exception as e:
+        print("[ERRO FATAL]:", str(e))
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())